@@ -0,0 +1,228 @@
+"""
+Self-contained XDG data directory for the benchmarks
+
+The fixture set is generated deterministically from a fixed seed, so that
+every run (and every machine) measures against the exact same databases:
+ - mime/globs2, mime/magic, mime/aliases, mime/subclasses, mime/generic-icons
+ - mime/<type>/<subtype>.xml for the localized comments
+ - applications/*.desktop, applications/mimeinfo.cache, applications/mimeapps.list
+ - samples/, a set of files to classify by content
+"""
+
+import os
+import random
+import struct
+
+SEED = 20161019
+
+TYPES = 400
+DESKTOP_FILES = 3000
+SAMPLES = 500
+
+MAGIC_HEADER = b"MIME-Magic\0\n"
+
+# A few real-world types the benchmarks can look up by name
+BUILTIN_GLOBS = [
+	(50, "text/plain", "*.txt"),
+	(50, "text/x-csrc", "*.c"),
+	(50, "text/x-c++src", "*.C", "cs"),
+	(50, "text/x-python", "*.py"),
+	(50, "application/xml", "*.xml"),
+	(50, "image/png", "*.png"),
+	(50, "application/zip", "*.zip"),
+	(50, "text/x-makefile", "Makefile"),
+	(50, "text/x-readme", "README*"),
+	(50, "application/x-compressed-tar", "*.tar.gz"),
+	(10, "application/x-trash", "*~"),
+	(10, "application/x-trash", "*.bak"),
+]
+
+BUILTIN_SUBCLASSES = [
+	("text/x-csrc", "text/plain"),
+	("text/x-c++src", "text/x-csrc"),
+	("text/x-python", "application/x-executable"),
+	("text/x-python", "text/plain"),
+	("application/xml", "text/plain"),
+	("application/x-compressed-tar", "application/x-gzip"),
+]
+
+COMMENT_TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
+<mime-type xmlns="http://www.freedesktop.org/standards/shared-mime-info" type="%(mime)s">
+  <comment>%(comment)s</comment>
+  <comment xml:lang="fr">%(comment)s (fr)</comment>
+</mime-type>
+"""
+
+DESKTOP_TEMPLATE = """[Desktop Entry]
+Type=Application
+Name=Application %(i)i
+Name[fr]=Application %(i)i (fr)
+Comment=Benchmark application number %(i)i
+Exec=app%(i)i %%U
+Icon=app%(i)i
+Categories=%(categories)s
+MimeType=%(mimes)s
+"""
+
+CATEGORIES = ["AudioVideo", "Development", "Education", "Game", "Graphics", "Network", "Office", "Science", "Settings", "System", "Utility"]
+
+
+def mimeTypes():
+	"""
+	Returns the list of generated MIME type names
+	"""
+	types = ["application", "audio", "image", "text", "video"]
+	return ["%s/x-bench%03i" % (types[i % len(types)], i) for i in range(TYPES)]
+
+def magicValue(i):
+	return ("BENCH%03i" % (i)).encode("ascii")
+
+def _magicRule(value, offset=0, indent=0, mask=None, range=None):
+	ret = b""
+	if indent:
+		ret += str(indent).encode("ascii")
+	ret += b">" + str(offset).encode("ascii") + b"=" + struct.pack(">H", len(value)) + value
+	if mask is not None:
+		ret += b"&" + mask
+	if range is not None:
+		ret += b"+" + str(range).encode("ascii")
+	return ret + b"\n"
+
+def _write(path, data, mode="w"):
+	dir = os.path.dirname(path)
+	if not os.path.isdir(dir):
+		os.makedirs(dir)
+	with open(path, mode) as f:
+		f.write(data)
+
+def writeMimeDatabase(base, rng):
+	mime = os.path.join(base, "mime")
+	names = mimeTypes()
+
+	lines = ["# Benchmark globs2"]
+	for glob in BUILTIN_GLOBS:
+		weight, name, pattern = glob[:3]
+		flags = ":" + ",".join(glob[3:]) if len(glob) > 3 else ""
+		lines.append("%i:%s:%s%s" % (weight, name, pattern, flags))
+	for i, name in enumerate(names):
+		lines.append("50:%s:*.bench%03i" % (name, i))
+		if i % 10 == 0:
+			lines.append("60:%s:bench%03i-*.dat" % (name, i))
+		if i % 25 == 0:
+			lines.append("50:%s:BENCHFILE%03i" % (name, i))
+	_write(os.path.join(mime, "globs2"), "\n".join(lines) + "\n")
+
+	magic = [MAGIC_HEADER]
+	for i, name in enumerate(names):
+		priority = 80 - (i % 4) * 10
+		magic.append(("[%i:%s]\n" % (priority, name)).encode("ascii"))
+		value = magicValue(i)
+		if i % 7 == 0:
+			# Masked match
+			magic.append(_magicRule(value, mask=b"\xff" * len(value)))
+		elif i % 5 == 0:
+			# Match anywhere in the first 16 bytes
+			magic.append(_magicRule(value, range=16))
+		else:
+			magic.append(_magicRule(value))
+		if i % 3 == 0:
+			# Nested rule
+			magic.append(_magicRule(b"\0", offset=len(value), indent=1))
+	_write(os.path.join(mime, "magic"), b"".join(magic), "wb")
+
+	aliases = ["application/x-bench-alias%03i %s" % (i, name) for i, name in enumerate(names) if i % 20 == 0]
+	_write(os.path.join(mime, "aliases"), "\n".join(aliases) + "\n")
+
+	subclasses = ["%s %s" % (sub, parent) for sub, parent in BUILTIN_SUBCLASSES]
+	for i, name in enumerate(names):
+		if i and i % 4 == 0:
+			subclasses.append("%s %s" % (name, names[rng.randrange(i)]))
+	_write(os.path.join(mime, "subclasses"), "\n".join(subclasses) + "\n")
+
+	icons = ["%s:%s-x-generic" % (name, name.split("/")[0]) for name in names]
+	_write(os.path.join(mime, "generic-icons"), "\n".join(icons) + "\n")
+
+	for name in names + ["text/plain", "application/xml"]:
+		_write(os.path.join(mime, name + ".xml"), COMMENT_TEMPLATE % {"mime": name, "comment": "%s document" % (name)})
+
+def writeApplications(base, rng):
+	applications = os.path.join(base, "applications")
+	names = mimeTypes() + [glob[1] for glob in BUILTIN_GLOBS]
+	cache = {}
+	categories = {}
+	for i in range(DESKTOP_FILES):
+		app = "app%04i.desktop" % (i)
+		mimes = rng.sample(names, rng.randint(1, 8))
+		cats = rng.sample(CATEGORIES, rng.randint(1, 3))
+		for mime in mimes:
+			cache.setdefault(mime, []).append(app)
+		for cat in cats:
+			categories.setdefault(cat, []).append(app)
+		_write(os.path.join(applications, app), DESKTOP_TEMPLATE % {
+			"i": i,
+			"mimes": ";".join(mimes) + ";",
+			"categories": ";".join(cats) + ";",
+		})
+
+	lines = ["[MIME Cache]"]
+	for mime in sorted(cache):
+		lines.append("%s=%s;" % (mime, ";".join(cache[mime])))
+	lines.append("")
+	lines.append("[Category Cache]")
+	for cat in sorted(categories):
+		lines.append("%s=%s;" % (cat, ";".join(categories[cat])))
+	_write(os.path.join(applications, "mimeinfo.cache"), "\n".join(lines) + "\n")
+
+	lines = ["[Default Applications]"]
+	for mime in sorted(cache)[::10]:
+		lines.append("%s=%s" % (mime, cache[mime][-1]))
+	lines.append("")
+	lines.append("[Added Associations]")
+	for mime in sorted(cache)[::7]:
+		lines.append("%s=%s;" % (mime, "app%04i.desktop" % (rng.randrange(DESKTOP_FILES))))
+	_write(os.path.join(applications, "mimeapps.list"), "\n".join(lines) + "\n")
+
+def writeSamples(base, rng):
+	samples = os.path.join(base, "samples")
+	for i in range(SAMPLES):
+		kind = i % 5
+		if kind == 0:
+			# Magic match
+			j = rng.randrange(TYPES)
+			data = magicValue(j) + b"\0" + bytes(bytearray(rng.randrange(256) for _ in range(256)))
+		elif kind == 1:
+			# Magic match at an offset
+			j = rng.randrange(0, TYPES, 5)
+			data = b"\1" * (j % 8) + magicValue(j) + b"\0" * 32
+		elif kind == 2:
+			# Plain text
+			data = ("line %i of a plain text sample\n" % (i) * 40).encode("ascii")
+		elif kind == 3:
+			# Binary without magic
+			data = bytes(bytearray(rng.randrange(256) for _ in range(2048)))
+		else:
+			# Empty file
+			data = b""
+		_write(os.path.join(samples, "sample%04i" % (i)), data, "wb")
+	return samples
+
+def generate(base):
+	"""
+	Generates the fixture set in \a base, which is used as the single data dir
+	"""
+	rng = random.Random(SEED)
+	writeMimeDatabase(base, rng)
+	writeApplications(base, rng)
+	writeSamples(base, rng)
+
+def environ(base):
+	"""
+	Returns the environment variables pointing xdg to the fixture set in \a base
+	"""
+	return {
+		"XDG_DATA_HOME": os.path.join(base, "home", "data"),
+		"XDG_DATA_DIRS": base,
+		"XDG_CONFIG_HOME": os.path.join(base, "home", "config"),
+		"XDG_CONFIG_DIRS": os.path.join(base, "config"),
+		"XDG_CACHE_HOME": os.path.join(base, "home", "cache"),
+	}
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+Memory sharing of the loaded databases between forked children
+
+Loads xdg.mime and xdg.actions against the fixture set of fixtures.py,
+optionally calls xdg.mime.freeze(), then forks N children which run the
+lookups of the benchmarks and a garbage collection, and report their
+shared and private memory from /proc/self/smaps_rollup (Linux only).
+
+Usage: python benchmarks/prefork.py [--children N] [--json FILE]
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import fixtures
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def smaps():
+	"""
+	Returns the FIELDS of /proc/self/smaps_rollup, in kB
+	"""
+	ret = {}
+	with open("/proc/self/smaps_rollup") as f:
+		for line in f:
+			key, _, value = line.partition(":")
+			if key in FIELDS:
+				ret[key] = int(value.split()[0])
+	return ret
+
+def workload(base):
+	import gc
+	from xdg.mime import MimeType
+	for i in range(fixtures.TYPES):
+		MimeType.fromName("file%i.bench%03i" % (i, i))
+		MimeType.fromName("bench%03i-%i.dat" % (i - i % 10, i))
+	for name in fixtures.mimeTypes():
+		mime = MimeType(name)
+		mime.bestApplication()
+		mime.isInstance("text/plain")
+	samples = os.path.join(base, "samples")
+	for name in sorted(os.listdir(samples)):
+		MimeType.fromContent(os.path.join(samples, name))
+	gc.collect()
+
+def measure(base, children, freeze):
+	"""
+	Runs in a fresh interpreter, with the environment pointing to \a base
+	Returns the smaps of each child.
+	"""
+	import xdg.mime
+	if freeze:
+		xdg.mime.freeze()
+
+	pipes = []
+	for i in range(children):
+		r, w = os.pipe()
+		pid = os.fork()
+		if pid == 0:
+			os.close(r)
+			try:
+				workload(base)
+				os.write(w, json.dumps(smaps()).encode("ascii"))
+			finally:
+				os._exit(0)
+		os.close(w)
+		pipes.append((pid, r))
+
+	ret = []
+	for pid, r in pipes:
+		with os.fdopen(r, "rb") as f:
+			ret.append(json.loads(f.read().decode("ascii")))
+		os.waitpid(pid, 0)
+	return ret
+
+def summarize(results):
+	ret = {}
+	for key in FIELDS:
+		ret[key] = sum(result[key] for result in results) / float(len(results))
+	ret["Shared"] = ret["Shared_Clean"] + ret["Shared_Dirty"]
+	ret["Private"] = ret["Private_Clean"] + ret["Private_Dirty"]
+	return ret
+
+
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description="Measure the memory shared between forked children")
+	parser.add_argument("--children", type=int, default=8, help="number of forked children (default: 8)")
+	parser.add_argument("--json", help="write the results as JSON to this file (- for stdout)")
+	parser.add_argument("--measure", choices=("plain", "frozen"), help=argparse.SUPPRESS)
+	parser.add_argument("--base", help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.measure:
+		results = measure(args.base, args.children, args.measure == "frozen")
+		json.dump(results, sys.stdout)
+		return
+
+	if not os.path.exists("/proc/self/smaps_rollup"):
+		parser.error("/proc/self/smaps_rollup is required")
+
+	base = tempfile.mkdtemp(prefix="xdg-bench-")
+	try:
+		fixtures.generate(base)
+		env = dict(os.environ)
+		env.update(fixtures.environ(base))
+		env["PYTHONPATH"] = ROOT
+		output = {}
+		for mode in ("plain", "frozen"):
+			data = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--measure", mode, "--base", base, "--children", str(args.children)], env=env)
+			output[mode] = result = summarize(json.loads(data.decode("ascii")))
+			sys.stderr.write("%-8s shared %8.0f kB  private %8.0f kB  pss %8.0f kB  (mean of %i children)\n" % (mode, result["Shared"], result["Private"], result["Pss"], args.children))
+	finally:
+		shutil.rmtree(base)
+
+	if args.json:
+		if args.json == "-":
+			json.dump(output, sys.stdout, indent=1, sort_keys=True)
+			sys.stdout.write("\n")
+		else:
+			with open(args.json, "w") as f:
+				json.dump(output, f, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+	main()
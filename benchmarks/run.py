@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the hot paths of python-xdg
+
+Runs against the fixture set generated by fixtures.py, which is pointed
+to by XDG_DATA_DIRS before xdg is imported, so that results do not depend
+on the databases installed on the machine.
+
+Usage: python benchmarks/run.py [--json FILE] [--repeat N] [--only NAME,...]
+
+Results are printed as a table, and written as JSON to FILE if given
+("-" for stdout) for regression tracking.
+"""
+
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fixtures
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+	clock = time.perf_counter
+except AttributeError:
+	clock = time.time
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+	"""
+	Registers \a func as a benchmark. It is called with the fixture dir and
+	must return a callable running one iteration and the amount of
+	operations it performs.
+	"""
+	BENCHMARKS.append(func)
+	return func
+
+def measure(setup, base, repeat):
+	run, ops = setup(base)
+	timings = []
+	for i in range(repeat):
+		start = clock()
+		run()
+		timings.append(clock() - start)
+	best = min(timings)
+	return {
+		"ops": ops,
+		"best": best,
+		"mean": sum(timings) / len(timings),
+		"ops_per_second": ops / best if best else None,
+	}
+
+
+@benchmark
+def import_mime(base):
+	"""Import of xdg.mime and xdg.actions, in a fresh interpreter"""
+	env = dict(os.environ)
+	env.update(fixtures.environ(base))
+	env["PYTHONPATH"] = ROOT
+	def run():
+		subprocess.check_call([sys.executable, "-c", "import xdg.mime"], env=env)
+	return run, 1
+
+@benchmark
+def from_name(base):
+	"""MimeType.fromName() on literal, extension, fnmatch and unknown names"""
+	from xdg.mime import MimeType
+	names = []
+	for i in range(fixtures.TYPES):
+		names += [
+			"file%i.bench%03i" % (i, i),
+			"FILE%i.BENCH%03i" % (i, i),
+			"bench%03i-%i.dat" % (i - i % 10, i),
+			"README.%i" % (i),
+			"unknown%i.nomatch" % (i),
+		]
+	names += ["BENCHFILE%03i" % (i) for i in range(0, fixtures.TYPES, 25)]
+	def run():
+		for name in names:
+			MimeType.fromName(name)
+	return run, len(names)
+
+@benchmark
+def from_content(base):
+	"""MimeType.fromContent() on the sample files"""
+	from xdg.mime import MimeType
+	samples = os.path.join(base, "samples")
+	paths = [os.path.join(samples, name) for name in sorted(os.listdir(samples))]
+	def run():
+		for path in paths:
+			MimeType.fromContent(path)
+	return run, len(paths)
+
+@benchmark
+def magic_match(base):
+	"""MAGIC.matchData() on in-memory buffers"""
+	from xdg.mime import MAGIC
+	samples = os.path.join(base, "samples")
+	buffers = []
+	for name in sorted(os.listdir(samples)):
+		with open(os.path.join(samples, name), "rb") as f:
+			buffers.append(f.read(MAGIC.maxLength))
+	def run():
+		for buffer in buffers:
+			MAGIC.matchData(buffer)
+	return run, len(buffers)
+
+@benchmark
+def magic_match_all(base):
+	"""MAGIC.matchAll() on in-memory buffers"""
+	from xdg.mime import MAGIC
+	samples = os.path.join(base, "samples")
+	buffers = []
+	for name in sorted(os.listdir(samples)):
+		with open(os.path.join(samples, name), "rb") as f:
+			buffers.append(f.read(MAGIC.maxLength))
+	def run():
+		for buffer in buffers:
+			MAGIC.matchAll(buffer)
+	return run, len(buffers)
+
+@benchmark
+def magic_load(base):
+	"""MagicFile.parse() of the fixture magic file"""
+	from xdg.mime import MagicFile
+	path = os.path.join(base, "mime", "magic")
+	def run():
+		MagicFile().parse(path)
+	return run, 1
+
+@benchmark
+def best_application(base):
+	"""MimeType.bestApplication() for every generated type"""
+	from xdg.mime import MimeType
+	mimes = [MimeType(name) for name in fixtures.mimeTypes()]
+	def run():
+		for mime in mimes:
+			mime.bestApplication()
+	return run, len(mimes)
+
+@benchmark
+def is_instance(base):
+	"""MimeType.isInstance() against text/plain and application/octet-stream"""
+	from xdg.mime import MimeType
+	mimes = [MimeType(name) for name in fixtures.mimeTypes()]
+	def run():
+		for mime in mimes:
+			mime.isInstance("text/plain")
+			mime.isInstance("application/octet-stream")
+	return run, len(mimes) * 2
+
+@benchmark
+def desktop_parse(base):
+	"""DesktopFile parsing of every generated desktop file"""
+	from xdg.desktopfile import DesktopFile
+	applications = os.path.join(base, "applications")
+	paths = [os.path.join(applications, name) for name in sorted(os.listdir(applications)) if name.endswith(".desktop")]
+	def run():
+		for path in paths:
+			desktop = DesktopFile()
+			desktop.read(path)
+			desktop.name()
+	return run, len(paths)
+
+def _trashSetup(base, count):
+	from xdg.trash import Trash
+	tmp = tempfile.mkdtemp(dir=base)
+	trash = Trash(os.path.join(tmp, "Trash"))
+	paths = [os.path.join(tmp, "file%i" % (i % (count // 4))) + ".%i" % (i // (count // 4)) for i in range(count)]
+	def create():
+		if os.path.isdir(trash.filesPath()):
+			trash.empty()
+		for path in paths:
+			with open(path, "w") as f:
+				f.write(path)
+	return trash, paths, create
+
+@benchmark
+def trash(base):
+	"""Trash.trash() of 1000 files, including creating them"""
+	trash, paths, create = _trashSetup(base, 1000)
+	def run():
+		create()
+		for path in paths:
+			trash.trash(path)
+	return run, len(paths)
+
+@benchmark
+def trash_many(base):
+	"""Trash.trashMany() of 1000 files, including creating them"""
+	trash, paths, create = _trashSetup(base, 1000)
+	def run():
+		create()
+		trash.trashMany(paths)
+	return run, len(paths)
+
+
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description="Run the python-xdg benchmarks")
+	parser.add_argument("--json", help="write the results as JSON to this file (- for stdout)")
+	parser.add_argument("--repeat", type=int, default=5, help="number of runs of each benchmark (default: 5)")
+	parser.add_argument("--only", help="comma-separated list of benchmarks to run")
+	args = parser.parse_args()
+
+	base = tempfile.mkdtemp(prefix="xdg-bench-")
+	try:
+		fixtures.generate(base)
+		# Must be set before xdg is imported, as the databases are loaded at import
+		os.environ.update(fixtures.environ(base))
+		sys.path.insert(0, ROOT)
+
+		only = args.only.split(",") if args.only else None
+		results = {}
+		for setup in BENCHMARKS:
+			if only and setup.__name__ not in only:
+				continue
+			results[setup.__name__] = result = measure(setup, base, args.repeat)
+			result["description"] = setup.__doc__
+			sys.stderr.write("%-20s %10.2f ops/s  (best %.4fs over %i ops)\n" % (setup.__name__, result["ops_per_second"] or 0, result["best"], result["ops"]))
+	finally:
+		shutil.rmtree(base)
+
+	if args.json:
+		output = {
+			"python": platform.python_implementation() + " " + platform.python_version(),
+			"platform": platform.platform(),
+			"seed": fixtures.SEED,
+			"repeat": args.repeat,
+			"results": results,
+		}
+		if args.json == "-":
+			json.dump(output, sys.stdout, indent=1, sort_keys=True)
+			sys.stdout.write("\n")
+		else:
+			with open(args.json, "w") as f:
+				json.dump(output, f, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+	main()
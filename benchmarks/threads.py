@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Thread scaling of the lookups
+
+Runs fromName(), isInstance() and bestApplication() lookups against the
+fixture set of fixtures.py from 1 to N threads, optionally while another
+thread reloads the databases in a loop, and checks every answer against
+the single-threaded one.
+
+Lookup throughput only scales with the threads on a free-threaded build
+of CPython; with the GIL, it is expected to stay flat.
+
+Usage: python benchmarks/threads.py [--threads N] [--seconds S] [--reload] [--json FILE]
+"""
+
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+
+import fixtures
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+	from time import perf_counter as clock
+except ImportError:
+	from time import time as clock
+
+
+def queries():
+	"""
+	Returns the list of (kind, argument) lookups ran by each thread
+	"""
+	ret = []
+	names = fixtures.mimeTypes()
+	for i, name in enumerate(names):
+		ret.append(("fromName", "file%i.bench%03i" % (i, i)))
+		ret.append(("isInstance", name))
+		ret.append(("bestApplication", name))
+	return ret
+
+def lookup(kind, argument):
+	from xdg.mime import MimeType
+	if kind == "fromName":
+		return str(MimeType.fromName(argument))
+	if kind == "isInstance":
+		return MimeType(argument).isInstance("application/octet-stream")
+	return MimeType(argument).bestApplication()
+
+def run(threads, seconds, expected, reload=False):
+	"""
+	Runs the lookups from \a threads threads for \a seconds
+	Returns the amount of lookups done and the list of wrong answers.
+	"""
+	from xdg import actions, mime
+	stop = threading.Event()
+	counts = [0] * threads
+	errors = []
+
+	def worker(index):
+		count = 0
+		while not stop.is_set():
+			for (kind, argument), answer in expected:
+				if lookup(kind, argument) != answer:
+					errors.append((kind, argument))
+			count += len(expected)
+		counts[index] = count
+
+	def reloader():
+		while not stop.is_set():
+			mime.reload()
+			actions.reload()
+
+	workers = [threading.Thread(target=worker, args=(i, )) for i in range(threads)]
+	if reload:
+		workers.append(threading.Thread(target=reloader))
+	start = clock()
+	for thread in workers:
+		thread.start()
+	stop.wait(seconds)
+	stop.set()
+	for thread in workers:
+		thread.join()
+	return sum(counts) / (clock() - start), errors
+
+
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description="Measure the thread scaling of the lookups")
+	parser.add_argument("--threads", type=int, default=8, help="largest number of threads (default: 8)")
+	parser.add_argument("--seconds", type=float, default=2.0, help="duration of each run (default: 2)")
+	parser.add_argument("--reload", action="store_true", help="reload the databases in a loop during the runs")
+	parser.add_argument("--json", help="write the results as JSON to this file (- for stdout)")
+	args = parser.parse_args()
+
+	base = tempfile.mkdtemp(prefix="xdg-bench-")
+	try:
+		fixtures.generate(base)
+		# Must be set before xdg is imported, as the databases are loaded at import
+		os.environ.update(fixtures.environ(base))
+		sys.path.insert(0, ROOT)
+
+		expected = [(query, lookup(*query)) for query in queries()]
+		gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+		sys.stderr.write("%s, GIL %s\n" % (platform.python_implementation() + " " + platform.python_version(), "enabled" if gil else "disabled"))
+
+		results = {}
+		threads = 1
+		baseline = None
+		failed = False
+		while threads <= args.threads:
+			rate, errors = run(threads, args.seconds, expected, args.reload)
+			baseline = baseline or rate
+			results[threads] = {"lookups_per_second": rate, "speedup": rate / baseline, "errors": len(errors)}
+			sys.stderr.write("%3i threads %12.0f lookups/s  x%.2f  %i wrong answers\n" % (threads, rate, rate / baseline, len(errors)))
+			failed = failed or bool(errors)
+			threads *= 2
+	finally:
+		shutil.rmtree(base)
+
+	if args.json:
+		output = {
+			"python": platform.python_implementation() + " " + platform.python_version(),
+			"gil": gil,
+			"reload": args.reload,
+			"results": results,
+		}
+		if args.json == "-":
+			json.dump(output, sys.stdout, indent=1, sort_keys=True)
+			sys.stdout.write("\n")
+		else:
+			with open(args.json, "w") as f:
+				json.dump(output, f, indent=1, sort_keys=True)
+
+	if failed:
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+MIME actions tests for python-xdg
+
+>>> import os, shutil, tempfile
+>>> from xdg.actions import ActionsListFile, ACTION_OPEN, ACTION_VIEW
+>>> tmp = tempfile.mkdtemp()
+>>> path = os.path.join(tmp, "mimeapps.list")
+>>> def write(data):
+...     with open(path, "w") as f:
+...         _ = f.write(data)
+>>> def read():
+...     with open(path) as f:
+...         return [line.strip() for line in f if line.strip()]
+>>> def load():
+...     ret = ActionsListFile()
+...     ret.read_merged([path])
+...     return ret
+>>> write("[Added Associations]\\nText/Plain=a.desktop;\\n")
+
+# Edits
+>>> actions = load()
+>>> actions.addedAssociations("text/plain")
+['a.desktop']
+>>> actions.addAssociation("text/plain", "b.desktop")
+>>> actions.setDefault("text/plain", "b.desktop", ACTION_VIEW)
+>>> actions.removeAssociation("text/plain", "a.desktop")
+>>> actions.addedAssociations("text/plain")
+['b.desktop']
+>>> actions.removedAssociations("text/plain", ACTION_OPEN)
+{'a.desktop'}
+>>> actions.defaultApplication("text/plain")
+'b.desktop'
+>>> actions.save(path)
+>>> actions.hasPendingChanges()
+False
+>>> read()
+['[Added Associations]', 'text/plain=b.desktop;', '[Default View Applications]', 'text/plain=b.desktop;', '[Removed Associations]', 'text/plain=a.desktop;']
+>>> load().addedAssociations("Text/Plain")
+['b.desktop']
+
+# Edits which change nothing are not saved
+>>> actions.removeAssociation("text/plain", "a.desktop")
+>>> actions.hasPendingChanges()
+False
+
+# Changes made by other writers are kept
+>>> actions.addAssociation("image/png", "c.desktop")
+>>> write("[Added Associations]\\ntext/plain=b.desktop;\\nTEXT/HTML=d.desktop;\\n")
+>>> actions.save(path)
+>>> saved = load()
+>>> saved.addedAssociations("text/plain"), saved.addedAssociations("text/html"), saved.addedAssociations("image/png")
+(['b.desktop'], ['d.desktop'], ['c.desktop'])
+
+# Relative paths
+>>> cwd = os.getcwd()
+>>> os.chdir(tmp)
+>>> actions.setDefault("image/png", "c.desktop")
+>>> actions.save("mimeapps.list")
+>>> os.chdir(cwd)
+>>> load().defaultApplication("image/png")
+'c.desktop'
+
+# Action masks, against the lookups of the separate sections
+>>> from xdg.actions import ActionsCacheFile, ACTION_EDIT, ACTION_ALL
+>>> from xdg.actions import ADDED_ASSOCIATIONS, REMOVED_ASSOCIATIONS, DEFAULT_APPLICATIONS
+>>> write('''[Default Applications]
+... text/plain=open.desktop;
+... [Default View Applications]
+... text/plain=view.desktop;
+... image/png=view.desktop;
+... [Default Edit Applications]
+... image/png=edit.desktop;
+... [Added Associations]
+... text/plain=a.desktop;b.desktop;
+... [Added View Associations]
+... text/plain=b.desktop;c.desktop;
+... [Added Edit Associations]
+... image/png=d.desktop;
+... [Removed Associations]
+... text/plain=x.desktop;y.desktop;
+... [Removed View Associations]
+... text/plain=y.desktop;
+... [Removed Edit Associations]
+... text/plain=y.desktop;z.desktop;
+... ''')
+>>> actions = load()
+>>> def flags(action):
+...     return [flag for flag in (ACTION_VIEW, ACTION_EDIT, ACTION_OPEN) if action & flag]
+
+The lookups before the tables, which only looked at the first action of
+the mask for the default application and the added associations
+>>> def oldDefault(mime, action):
+...     for flag in (ACTION_OPEN, ACTION_VIEW, ACTION_EDIT):
+...         if action & flag:
+...             apps = actions.getlist(DEFAULT_APPLICATIONS[flag], mime)
+...             return apps[0] if apps else None
+>>> def oldAdded(mime, action):
+...     return actions.getlist(ADDED_ASSOCIATIONS[flags(action)[0]], mime, [])
+>>> def oldRemoved(mime, action):
+...     lists = [actions.getlist(REMOVED_ASSOCIATIONS[flag], mime, []) for flag in flags(action)]
+...     return set(item for removed in lists for item in removed if all(item in removed for removed in lists))
+
+Single actions are unchanged, and so are the removed associations
+>>> for mime in ("text/plain", "image/png", "text/html"):
+...     for action in range(1, ACTION_ALL + 1):
+...         assert actions.removedAssociations(mime, action) == oldRemoved(mime, action)
+...         if len(flags(action)) == 1:
+...             assert actions.defaultApplication(mime, action) == oldDefault(mime, action)
+...             assert actions.addedAssociations(mime, action) == oldAdded(mime, action)
+
+Masks of several actions merge the added associations of all of them, and
+fall back to the default application of the next action
+>>> for action in range(1, ACTION_ALL + 1):
+...     print(action, actions.defaultApplication("image/png", action), actions.addedAssociations("text/plain", action), sorted(actions.removedAssociations("text/plain", action)))
+1 None ['a.desktop', 'b.desktop'] ['x.desktop', 'y.desktop']
+2 view.desktop ['b.desktop', 'c.desktop'] ['y.desktop']
+3 view.desktop ['b.desktop', 'c.desktop', 'a.desktop'] ['y.desktop']
+4 edit.desktop [] ['y.desktop', 'z.desktop']
+5 edit.desktop ['a.desktop', 'b.desktop'] ['y.desktop']
+6 view.desktop ['b.desktop', 'c.desktop'] ['y.desktop']
+7 view.desktop ['b.desktop', 'c.desktop', 'a.desktop'] ['y.desktop']
+>>> [actions.defaultApplication("text/plain", action) for action in range(1, ACTION_ALL + 1)]
+['open.desktop', 'view.desktop', 'open.desktop', None, 'open.desktop', 'view.desktop', 'open.desktop']
+>>> [oldDefault("image/png", action) for action in range(1, ACTION_ALL + 1)]
+[None, 'view.desktop', None, 'edit.desktop', None, 'view.desktop', None]
+>>> [oldAdded("text/plain", action) for action in range(1, ACTION_ALL + 1)]
+[['a.desktop', 'b.desktop'], ['b.desktop', 'c.desktop'], ['b.desktop', 'c.desktop'], [], [], ['b.desktop', 'c.desktop'], ['b.desktop', 'c.desktop']]
+
+Edits update the tables
+>>> actions.addAssociation("image/png", "a.desktop", ACTION_ALL)
+>>> actions.addedAssociations("image/png")
+['a.desktop', 'd.desktop']
+>>> actions.removeAssociation("text/plain", "b.desktop", ACTION_VIEW)
+>>> actions.addedAssociations("text/plain", ACTION_VIEW | ACTION_OPEN)
+['c.desktop', 'a.desktop', 'b.desktop']
+
+The cached associations are merged in the same order
+>>> write('''[MIME Cache]
+... text/plain=a.desktop;b.desktop;
+... [MIME View Cache]
+... text/plain=c.desktop;a.desktop;
+... ''')
+>>> cache = ActionsCacheFile()
+>>> cache.read_merged([path])
+>>> cache.applicationsForMimeType("text/plain")
+OrderedSet(['c.desktop', 'a.desktop', 'b.desktop'])
+>>> cache.applicationsForMimeType("text/plain", exclude=["a.desktop"], action=ACTION_OPEN)
+OrderedSet(['b.desktop'])
+>>> cache.applicationsForMimeType("text/html")
+OrderedSet()
+
+>>> shutil.rmtree(tmp)
+"""
+
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Autostart tests for python-xdg
+
+>>> import os, shutil, tempfile
+>>> tmp = tempfile.mkdtemp()
+>>> os.environ["XDG_CONFIG_HOME"] = os.path.join(tmp, "home")
+>>> os.environ["XDG_CONFIG_DIRS"] = os.path.join(tmp, "system")
+>>> os.environ["XDG_CURRENT_DESKTOP"] = "XFCE:GNOME"
+>>> from xdg import autostart
+>>> for dir in ("home", "system"):
+...     os.makedirs(os.path.join(tmp, dir, "autostart"))
+>>> def desktop(dir, name, keys=""):
+...     path = os.path.join(tmp, dir, "autostart", name)
+...     with open(path, "w") as f:
+...         _ = f.write("[Desktop Entry]\\nType=Application\\nName=%s\\nExec=true\\n%s" % (name[:-8], keys))
+...     return path
+>>> def names(desktops):
+...     return [d.value("Name") for d in desktops]
+>>> def touch(path, offset):
+...     st = os.stat(path)
+...     os.utime(path, (st.st_atime, st.st_mtime + offset))
+>>> _ = desktop("system", "a.desktop")
+>>> _ = desktop("system", "b.desktop", "Comment=System\\n")
+>>> _ = desktop("home", "b.desktop", "Comment=Local\\n")
+>>> _ = desktop("system", "hidden.desktop", "Hidden=true\\n")
+>>> _ = desktop("system", "xfce.desktop", "OnlyShowIn=XFCE;\\n")
+>>> _ = desktop("system", "kde.desktop", "OnlyShowIn=KDE;\\n")
+>>> _ = desktop("system", "notgnome.desktop", "NotShowIn=GNOME;\\n")
+>>> _ = desktop("system", "notkde.desktop", "NotShowIn=KDE;\\n")
+>>> _ = desktop("system", "tryexec.desktop", "TryExec=python-xdg-missing-executable\\n")
+>>> _ = desktop("system", "tryexecpath.desktop", "TryExec=%s\\n" % (os.path.join(tmp, "missing")))
+>>> open(os.path.join(tmp, "system", "autostart", "invalid.desktop"), "w").close()
+
+# Scan: the local entries override the global ones
+>>> [(os.path.relpath(path, tmp), d.comment()) for path, d in autostart._scan() if "b.desktop" in path]
+[('home/autostart/b.desktop', 'Local')]
+>>> names(d for path, d in autostart._scan())
+['a', 'b', 'hidden', 'kde', 'notgnome', 'notkde', 'tryexec', 'tryexecpath', 'xfce']
+
+# Filtering
+>>> names(autostart.localAutostartPrograms())
+['b']
+>>> names(autostart.globalAutostartPrograms())
+['a', 'notkde', 'xfce']
+>>> names(autostart.allAutostartPrograms())
+['b', 'a', 'notkde', 'xfce']
+>>> os.environ["XDG_CURRENT_DESKTOP"] = ""
+>>> names(autostart.globalAutostartPrograms())
+['a', 'notgnome', 'notkde']
+>>> os.environ["XDG_CURRENT_DESKTOP"] = "XFCE:GNOME"
+
+# The cache is refreshed when the files change
+>>> path = desktop("system", "a.desktop", "Hidden=true\\n")
+>>> touch(path, 10)
+>>> names(autostart.globalAutostartPrograms())
+['notkde', 'xfce']
+>>> path = desktop("home", "c.desktop")
+>>> touch(os.path.dirname(path), 10)
+>>> names(autostart.localAutostartPrograms())
+['b', 'c']
+>>> os.remove(os.path.join(tmp, "home", "autostart", "b.desktop"))
+>>> touch(os.path.dirname(path), 20)
+>>> [(os.path.relpath(path, tmp), d.comment()) for path, d in autostart._scan() if "b.desktop" in path]
+[('system/autostart/b.desktop', 'System')]
+>>> names(autostart.globalAutostartPrograms())
+['b', 'notkde', 'xfce']
+
+>>> shutil.rmtree(tmp)
+"""
+
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Base directory tests for python-xdg
+
+>>> import os, tempfile
+>>> from xdg.basedir import BaseDirectories
+>>> tmp = tempfile.mkdtemp()
+>>> dirs = BaseDirectories({"HOME": tmp, "XDG_DATA_DIRS": "", "XDG_CONFIG_DIRS": "/nonexistent"})
+>>> dirs.dataHome() == os.path.join(tmp, ".local", "share")
+True
+>>> dirs.dataDirs()[1:]
+['/usr/local/share', '/usr/share']
+>>> dirs.configDirs()[1:]
+['/nonexistent']
+>>> print(dirs.runtimeDir())
+None
+>>> os.makedirs(os.path.join(tmp, ".config"))
+>>> with open(os.path.join(tmp, ".config", "user-dirs.dirs"), "w") as f:
+...     _ = f.write('# comment\\nXDG_DESKTOP_DIR="$HOME/Bureau"\\nXDG_MUSIC_DIR="/srv/music"\\n')
+>>> dirs.userDir("desktop") == os.path.join(tmp, "Bureau")
+True
+>>> dirs.userDir("MUSIC")
+'/srv/music'
+>>> print(dirs.userDir("VIDEOS"))
+None
+>>> dirs.findConfig("user-dirs.dirs") == os.path.join(tmp, ".config", "user-dirs.dirs")
+True
+>>> print(dirs.findConfig("no-such-file"))
+None
+>>> dirs.findAllCache("no-such-file")
+[]
+>>> print(dirs.findRuntime("no-such-file"))
+None
+
+# Directory cache
+>>> import time
+>>> from xdg.basedir import DirectoryCache
+>>> cache = DirectoryCache(ttl=None)
+>>> path = os.path.join(tmp, "new-file")
+>>> cache.exists(path)
+False
+>>> open(path, "w").close()
+>>> cache.exists(path)
+False
+>>> cache.invalidate(tmp)
+>>> cache.exists(path)
+True
+
+# Files added by another writer are seen once the ttl expired
+>>> cache = DirectoryCache(ttl=0.05)
+>>> cache.exists(path + ".2")
+False
+>>> open(path + ".2", "w").close()
+>>> time.sleep(0.1)
+>>> cache.exists(path + ".2")
+True
+>>> os.remove(path + ".2")
+>>> time.sleep(0.1)
+>>> cache.exists(path + ".2")
+False
+
+# Same results as os.path.exists()
+>>> os.symlink(os.path.join(tmp, "no-such-file"), os.path.join(tmp, "broken"))
+>>> cache.exists(os.path.join(tmp, "broken")), os.path.exists(os.path.join(tmp, "broken"))
+(False, False)
+>>> os.symlink(path, os.path.join(tmp, "link"))
+>>> time.sleep(0.1)
+>>> cache.exists(os.path.join(tmp, "link"))
+True
+>>> cache.exists(os.path.join(tmp, ".config") + os.sep), cache.exists(path + os.sep)
+(True, False)
+
+>>> import shutil
+>>> shutil.rmtree(tmp)
+"""
+
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Icon theme tests for python-xdg
+
+>>> import os, shutil, tempfile
+>>> from xdg.icontheme import IconLookup
+>>> tmp = tempfile.mkdtemp()
+>>> def theme(name, index, icons):
+...     with open(os.path.join(tmp, name, "index.theme"), "w") as f:
+...         _ = f.write(index)
+...     for icon in icons:
+...         open(os.path.join(tmp, name, icon), "w").close()
+>>> for dir in ("base/16x16/apps", "base/48x48/apps", "base/scalable/apps", "child/48x48/apps"):
+...     os.makedirs(os.path.join(tmp, dir))
+>>> theme("base", "[Icon Theme]\\nName=Base\\nDirectories=16x16/apps,48x48/apps,scalable/apps\\n"
+...     "[16x16/apps]\\nSize=16\\nType=Fixed\\n[48x48/apps]\\nSize=48\\nType=Fixed\\n"
+...     "[scalable/apps]\\nSize=48\\nMinSize=8\\nMaxSize=512\\nType=Scalable\\n",
+...     ["16x16/apps/a.png", "48x48/apps/a.xpm", "48x48/apps/a.png", "scalable/apps/a.svg", "scalable/apps/b.svg"])
+>>> theme("child", "[Icon Theme]\\nName=Child\\nInherits=base\\nDirectories=48x48/apps\\n[48x48/apps]\\nSize=48\\n",
+...     ["48x48/apps/b.png"])
+>>> icons = IconLookup(dirs=[tmp], pixmapDirs=[])
+>>> icons.chain("child")
+[IconTheme('child'), IconTheme('base')]
+>>> def lookup(name, size, scale=1):
+...     path = icons.lookupIcon(name, size, scale, theme="child")
+...     return path and os.path.relpath(path, tmp)
+>>> lookup("a", 48)
+'base/48x48/apps/a.png'
+>>> lookup("a", 16)
+'base/16x16/apps/a.png'
+>>> lookup("a", 24)
+'base/scalable/apps/a.svg'
+>>> lookup("a", 48, 2)
+'base/scalable/apps/a.svg'
+>>> lookup("b", 256)
+'child/48x48/apps/b.png'
+>>> lookup("missing", 48) is None
+True
+>>> os.path.relpath(icons.lookupIcons(["missing", "b"], 48, theme="base"), tmp)
+'base/scalable/apps/b.svg'
+
+# Unthemed icons
+>>> open(os.path.join(tmp, "c.xpm"), "w").close()
+>>> lookup("c", 48) is None
+True
+>>> icons.reload()
+>>> lookup("c", 48)
+'c.xpm'
+
+# icon-theme.cache
+>>> import mmap, struct
+>>> from xdg.icontheme import CACHE_FILE, CacheIndex, DirectoryIndex
+>>> CacheIndex.hash(b"a"), CacheIndex.hash(b"ab"), CacheIndex.hash(u"\\xe9".encode("utf-8"))
+(97, 3105, 4294965318)
+
+The cache written by gtk-update-icon-cache: a header, a hash table of
+chained icons, their image lists and the list of the directories
+>>> def writeCache(path, directories, icons, buckets):
+...     data = bytearray(struct.pack(">HHII", 1, 0, 12, 0))
+...     data += struct.pack(">%iI" % (buckets + 1), buckets, *[0xffffffff] * buckets)
+...     for name, images in icons:
+...         name = name.encode("utf-8")
+...         bucket = 16 + 4 * (CacheIndex.hash(name) % buckets)
+...         icon = len(data)
+...         data += struct.pack(">III", struct.unpack_from(">I", data, bucket)[0], icon + 12, 0) + name + b"\\0"
+...         data += b"\\0" * (-len(data) % 4)
+...         struct.pack_into(">I", data, bucket, icon)
+...         struct.pack_into(">I", data, icon + 8, len(data))
+...         data += struct.pack(">I", len(images))
+...         for directory, flags in images:
+...             data += struct.pack(">HHI", directory, flags, 0)
+...     struct.pack_into(">I", data, 8, len(data))
+...     offset = len(data) + 4 + 4 * len(directories)
+...     data += struct.pack(">I", len(directories))
+...     for directory in directories:
+...         data += struct.pack(">I", offset)
+...         offset += len(directory) + 1
+...     data += b"".join(directory.encode("utf-8") + b"\\0" for directory in directories)
+...     with open(os.path.join(path, CACHE_FILE), "wb") as f:
+...         _ = f.write(data)
+>>> base = os.path.join(tmp, "base")
+>>> subdirs = ["16x16/apps", "48x48/apps", "scalable/apps"]
+>>> open(os.path.join(base, "16x16/apps", u"caf\\xe9.png"), "w").close()
+>>> queries = [(name, size, scale) for name in ("a", "b", u"caf\\xe9", "missing") for size in (16, 24, 48, 256) for scale in (1, 2)]
+>>> def resolve():
+...     icons.reload()
+...     return [icons.lookupIcon(name, size, scale, theme="base") for name, size, scale in queries]
+>>> expected = resolve()
+>>> type(icons.theme("base").indexes[0]).__name__
+'DirectoryIndex'
+
+Two buckets for three icons, so that one of them is chained
+>>> cached = [("a", [(0, 0x04), (1, 0x04 | 0x01 | 0x08), (2, 0x02)]), ("b", [(2, 0x02)]), (u"caf\\xe9", [(0, 0x04)])]
+>>> sorted(CacheIndex.hash(name.encode("utf-8")) % 2 for name, images in cached)
+[0, 0, 1]
+>>> writeCache(base, subdirs, cached, 2)
+>>> resolve() == expected
+True
+>>> index = icons.theme("base").indexes[0]
+>>> type(index).__name__, type(index._data) is mmap.mmap
+('CacheIndex', True)
+>>> index.lookup("a")
+[('16x16/apps', '.png'), ('48x48/apps', '.png'), ('48x48/apps', '.xpm'), ('scalable/apps', '.svg')]
+>>> index.lookup("missing"), index.lookup("c")
+((), ())
+>>> directory = DirectoryIndex(base, subdirs)
+>>> for name in ("a", "b", u"caf\\xe9"):
+...     assert sorted(index.lookup(name)) == sorted(directory.lookup(name)), name
+
+>>> shutil.rmtree(tmp)
+"""
+
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Ini file tests for python-xdg
+
+>>> import io, os, shutil, tempfile
+>>> from xdg.inifile import IniFile
+>>> tmp = tempfile.mkdtemp()
+>>> def write(name, data, encoding="utf-8"):
+...     path = os.path.join(tmp, name)
+...     with io.open(path, "w", encoding=encoding) as f:
+...         _ = f.write(data)
+...     return path
+>>> low = write("low.ini", u"[A]\\nName=Low\\nList=a;b;\\nOnly=low\\n# Comment\\n[B]\\nKey=low\\n")
+>>> high = write("high.ini", u"[A]\\nname = High\\nList=c;a;\\n\\n; Comment\\n[C]\\nKey=high\\n")
+
+# Merge order: later files have priority, and their ;-lists come first
+>>> ini = IniFile()
+>>> ini.read_merged([low, os.path.join(tmp, "missing.ini"), high])
+>>> ini.sections()
+['A', 'B', 'C']
+>>> ini.get("A", "Name"), ini.get("A", "Only"), ini.get("B", "Key"), ini.get("C", "Key")
+('High', 'low', 'low', 'high')
+>>> ini.getlist("A", "List")
+['c', 'a', 'b']
+>>> ini.get("A", "List")
+'c;a;b;'
+
+Reading more files merges them with the current values
+>>> ini.read_merged([write("higher.ini", u"[A]\\nList=d;\\n")])
+>>> ini.getlist("A", "List")
+['d', 'c', 'a', 'b']
+
+# Duplicate keys and sections in a file are merged the same way
+>>> ini = IniFile()
+>>> ini.read_merged([write("duplicates.ini", u"[A]\\nKey=1\\nList=a;\\n[B]\\n[A]\\nKey=2\\nList=b;a;\\n")])
+>>> ini.sections()
+['A', 'B']
+>>> ini.get("A", "Key"), ini.getlist("A", "List")
+('2', ['b', 'a'])
+
+# Lists after changes
+>>> ini.set("A", "List", "x;y;")
+>>> ini.getlist("A", "List")
+['x', 'y']
+>>> ini.setlist("A", "List", ["z"])
+>>> ini.getlist("A", "List"), ini.get("A", "List")
+(['z'], 'z;')
+>>> ini.set("A", "List", "single")
+>>> ini.getlist("A", "List")
+['single']
+>>> ini.setlist("A", "List", ["z"])
+>>> ini.remove_option("A", "List")
+True
+>>> ini.getlist("A", "List", [])
+[]
+>>> ini.setlist("A", "List", [])
+>>> ini.has_option("A", "List")
+False
+>>> ini.freeze()
+>>> ini.setlist("B", "List", ["a"])
+>>> ini.freeze()
+>>> ini.getlist("B", "List")
+['a']
+
+# Encoding: the files are read as UTF-8 unless told otherwise
+>>> path = write("latin1.ini", u"[A]\\nName=Caf\\xe9\\n", encoding="latin-1")
+>>> ini = IniFile()
+>>> ini.read_merged([low, path]) # doctest: +ELLIPSIS
+Traceback (most recent call last):
+    ...
+UnicodeDecodeError: 'utf-8' codec can't decode byte 0xe9 ...
+>>> ini.sections()
+[]
+>>> ini.read_merged([path], encoding="latin-1")
+>>> ini.get("A", "Name") == u"Caf\\xe9"
+True
+
+>>> shutil.rmtree(tmp)
+"""
+
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
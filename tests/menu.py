@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Menu tests for python-xdg
+
+>>> import os, shutil, tempfile, time
+>>> from xdg.menu import MenuCache, MenuParser
+>>> tmp = tempfile.mkdtemp()
+>>> for dir in ("applications/kde", "directories", "merged"):
+...     os.makedirs(os.path.join(tmp, dir))
+>>> def write(name, data):
+...     with open(os.path.join(tmp, name), "w") as f:
+...         _ = f.write(data)
+>>> def desktop(name, categories, extra=""):
+...     write(os.path.join("applications", name), "[Desktop Entry]\\nType=Application\\nCategories=%s\\n%s" % (categories, extra))
+>>> desktop("editor.desktop", "Utility;TextEditor;")
+>>> desktop("kde/calc.desktop", "Utility;Calculator;")
+>>> desktop("game.desktop", "Game;")
+>>> desktop("hidden.desktop", "Game;", "Hidden=true\\n")
+>>> desktop("settings.desktop", "Settings;", "NoDisplay=true\\n")
+>>> desktop("other.desktop", "")
+>>> write("directories/utility.directory", "[Desktop Entry]\\nName=Accessories\\n")
+>>> write("applications.menu", '''<Menu>
+...   <Name>Applications</Name>
+...   <AppDir>applications</AppDir>
+...   <DirectoryDir>directories</DirectoryDir>
+...   <Menu>
+...     <Name>Accessories</Name>
+...     <Directory>utility.directory</Directory>
+...     <Include><And><Category>Utility</Category><Not><Category>Calculator</Category></Not></And></Include>
+...   </Menu>
+...   <Menu>
+...     <Name>Games</Name>
+...     <Include><Category>Game</Category></Include>
+...   </Menu>
+...   <Menu>
+...     <Name>Settings</Name>
+...     <Include><Category>Settings</Category></Include>
+...   </Menu>
+...   <Menu>
+...     <Name>Other</Name>
+...     <OnlyUnallocated/>
+...     <Include><All/></Include>
+...   </Menu>
+...   <MergeDir>merged</MergeDir>
+...   <Move><Old>Tools</Old><New>Accessories</New></Move>
+... </Menu>''')
+>>> write("merged/tools.menu", '''<Menu>
+...   <Name>Applications</Name>
+...   <Menu>
+...     <Name>Tools</Name>
+...     <Include><Filename>kde-calc.desktop</Filename></Include>
+...   </Menu>
+... </Menu>''')
+>>> path = os.path.join(tmp, "applications.menu")
+>>> menu = MenuParser(path).parse()
+>>> menu
+<Menu: Applications>
+>>> [(p, [id for id, _ in m.entries]) for p, m in menu.walk()]
+[('', []), ('Accessories/', ['editor.desktop', 'kde-calc.desktop']), ('Games/', ['game.desktop']), ('Other/', ['other.desktop'])]
+>>> os.path.relpath(menu.submenu("Accessories").directory, tmp)
+'directories/utility.directory'
+>>> menu.submenu("Settings") is None
+True
+
+# Cache
+>>> cache = MenuCache(interval=0)
+>>> cache.get(path) is cache.get(path)
+True
+>>> menu = cache.get(path)
+>>> time.sleep(0.01)
+>>> desktop("puzzle.desktop", "Game;")
+>>> [id for id, _ in cache.get(path).submenu("Games").entries]
+['game.desktop', 'puzzle.desktop']
+
+Desktop files rewritten in place, which do not change the mtime of their
+directory
+>>> from xdg.menu import AppDirIndex
+>>> index = AppDirIndex(os.path.join(tmp, "applications"))
+>>> index.isValid()
+True
+>>> desktop("puzzle.desktop", "Game;Utility;")
+>>> index.isValid()
+False
+>>> [id for id, _ in cache.get(path).submenu("Accessories").entries]
+['editor.desktop', 'kde-calc.desktop', 'puzzle.desktop']
+
+.directory files added to or removed from the directory dirs
+>>> os.remove(os.path.join(tmp, "directories", "utility.directory"))
+>>> print(cache.get(path).submenu("Accessories").directory)
+None
+>>> write("directories/utility.directory", "[Desktop Entry]\\nName=Accessories\\n")
+>>> os.path.relpath(cache.get(path).submenu("Accessories").directory, tmp)
+'directories/utility.directory'
+
+>>> shutil.rmtree(tmp)
+"""
+
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
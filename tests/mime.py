@@ -83,6 +83,30 @@ False
 True
 >>> MimeType("application/vnd.android.package-archive").isInstance("application/zip")
 True
+>>> MimeType("text/x-python").ancestors()
+[<MimeType: application/x-executable>, <MimeType: text/plain>, <MimeType: application/octet-stream>]
+>>> MimeType("text/x-csrc").isInstance("text/plain")
+True
+>>> MimeType("image/png").isInstance("application/octet-stream")
+True
+>>> MimeType("inode/directory").isInstance("application/octet-stream")
+False
+>>> MimeType("text/xml").isInstance("application/xml")
+True
+
+Names unknown to the database get the implicit parents, and are not kept
+>>> from xdg.mime import DATABASE
+>>> closures = len(DATABASE.ancestors._closures)
+>>> MimeType("text/x-no-such-type").ancestors()
+[<MimeType: text/plain>, <MimeType: application/octet-stream>]
+>>> [MimeType("x-no-such-media/%i" % (i)).isInstance("application/octet-stream") for i in range(3)]
+[True, True, True]
+>>> MimeType("inode/x-no-such-type").ancestors()
+[]
+>>> len(DATABASE.ancestors._closures) == closures
+True
+>>> "text/x-python" in DATABASE.ancestors._closures
+True
 
 # icons / extensions
 >>> MimeType("application/zip").genericIcon()
@@ -130,7 +154,421 @@ True
 >>> f.close()
 >>> MimeType.fromContent(f.name).name()
 'text/plain'
+>>> MimeType.fromContent(f.name).charset()
+'us-ascii'
+>>> with open(f.name, "wb") as f:
+...     _ = f.write(u"caf\u00e9 cr\u00e8me".encode("utf-8"))
+>>> MimeType.fromContent(f.name).charset()
+'utf-8'
+>>> with open(f.name, "wb") as f:
+...     _ = f.write(u"caf\u00e9 cr\u00e8me".encode("latin-1"))
+>>> MimeType.fromContent(f.name).charset()
+'unknown-8bit'
+>>> with open(f.name, "wb") as f:
+...     _ = f.write(u"\ufefftext".encode("utf-16-le"))
+>>> MimeType.fromContent(f.name).charset()
+'utf-16le'
+>>> mime = MimeType.fromContent(f.name)
+>>> mime.name(), str(mime), mime.parameter(), mime == "text/plain"
+('text/plain', 'text/plain', 'charset=utf-16le', True)
+>>> for encoding in ("utf-16-be", "utf-32-le", "utf-32-be"):
+...     with open(f.name, "wb") as f:
+...         _ = f.write(u"\ufefftext".encode(encoding))
+...     print(MimeType.fromContent(f.name).charset())
+utf-16be
+utf-32le
+utf-32be
+>>> with open(f.name, "wb") as f:
+...     _ = f.write(u"\ufefftext".encode("utf-16-le"))
+>>> os.symlink(f.name, "test.lnk")
+>>> MimeType.fromInode("test.lnk").name()
+'inode/symlink'
+>>> MimeType.fromContent("test.lnk").charset()
+'utf-16le'
+>>> os.remove("test.lnk")
 >>> os.remove(f.name)
+
+# Content cache
+>>> from xdg.mime import enableContentCache, disableContentCache
+>>> cache = enableContentCache(size=16)
+>>> with open("test.tmp", "w") as f:
+...     _ = f.write("foo")
+>>> MimeType.fromContent("test.tmp").name()
+'text/plain'
+>>> cache.get(os.stat("test.tmp"))
+'text/plain; charset=us-ascii'
+>>> MimeType.fromContent("test.tmp").name()
+'text/plain'
+>>> with open("test.tmp", "wb") as f:
+...     _ = f.write(b"\\x00\\x01\\x02binary")
+>>> MimeType.fromContent("test.tmp").name()
+'application/octet-stream'
+>>> disableContentCache()
+
+The persistent tier keeps the results of each MIME database
+>>> import shutil, tempfile
+>>> from xdg.contentcache import ContentCache
+>>> base = tempfile.mkdtemp()
+>>> path = os.path.join(base, "cache", "content.sqlite")
+>>> cache = enableContentCache(size=16, persistent=True, path=path)
+>>> MimeType.fromContent("test.tmp").name()
+'application/octet-stream'
+>>> disableContentCache()
+>>> cache = enableContentCache(size=16, persistent=True, path=path)
+>>> cache.get(os.stat("test.tmp"))
+'application/octet-stream'
+>>> other = ContentCache(persistent=True, path=path, fingerprint="other")
+>>> other.get(os.stat("test.tmp")) is None
+True
+>>> other.set(os.stat("test.tmp"), "application/x-other")
+>>> other.close()
+>>> disableContentCache()
+>>> cache = enableContentCache(size=16, persistent=True, path=path)
+>>> cache.get(os.stat("test.tmp"))
+'application/octet-stream'
+>>> disableContentCache()
+>>> other = ContentCache(persistent=True, path=path, fingerprint="other")
+>>> other.get(os.stat("test.tmp"))
+'application/x-other'
+>>> other.close()
+
+Only the entries of the most recently used fingerprints are kept
+>>> for i in range(4):
+...     ContentCache(persistent=True, path=path, fingerprint=str(i)).close()
+>>> cache = enableContentCache(size=16, persistent=True, path=path)
+>>> cache.get(os.stat("test.tmp")) is None
+True
+>>> disableContentCache()
+>>> shutil.rmtree(base)
+>>> os.remove("test.tmp")
+
+# Instrumentation
+>>> from xdg import stats
+>>> events = []
+>>> stats.enable(lambda kind, name, value: events.append(name))
+>>> MimeType.fromName("foo.txt").name()
+'text/plain'
+>>> print(MimeType.fromName("no-such-file"))
+None
+>>> stats.STATS.counter("globs.extension"), stats.STATS.counter("globs.miss")
+(1, 1)
+>>> stats.STATS.timing("globs.match") > 0
+True
+>>> events
+['globs.match', 'globs.extension', 'globs.match', 'globs.miss']
+>>> stats.disable()
+>>> _ = MimeType.fromName("foo.txt")
+>>> stats.STATS.counter("globs.extension")
+1
+>>> stats.enable()
+>>> _ = MimeType.fromName("foo.txt")
+>>> stats.STATS.counter("globs.extension"), len(events)
+(2, 4)
+>>> stats.disable()
+>>> stats.STATS.reset()
+>>> stats.STATS.snapshot()
+{'counters': {}, 'timings': {}}
+
+# Command-line classifier
+>>> import io
+>>> from xdg.mime import main
+>>> out = io.BytesIO()
+>>> main(["--mode", "glob"], io.BytesIO(b"foo.txt\\nbar.png\\nno-such-file\\n"), out)
+>>> out.getvalue().splitlines()
+[b'foo.txt\\ttext/plain', b'bar.png\\timage/png', b'no-such-file\\t']
+>>> with open("test.tmp", "w") as f:
+...     _ = f.write("foo")
+>>> out = io.BytesIO()
+>>> main(["-0", "--mode", "magic", "--jobs", "2"], io.BytesIO(b"test.tmp\\0."), out)
+>>> out.getvalue().split(b"\\0")
+[b'test.tmp\\ttext/plain', b'.\\tinode/directory', b'']
+>>> os.remove("test.tmp")
+
+# Classification server
+>>> import tempfile, threading
+>>> from xdg import mimeserver
+>>> server = mimeserver.Server(os.path.join(tempfile.mkdtemp(), "mime.sock"))
+>>> thread = threading.Thread(target=server.serve_forever)
+>>> thread.start()
+>>> client = mimeserver.connect(server.server_address)
+>>> from xdg.mimeserver import RemoteMimeType
+>>> RemoteMimeType.fromName("foo.txt")
+<MimeType: text/plain>
+>>> print(RemoteMimeType.fromName("no-such-file"))
+None
+>>> RemoteMimeType("text/x-csrc").isInstance("text/plain")
+True
+>>> RemoteMimeType("text/plain").comment(), RemoteMimeType("text/plain").comment(lang="fr")
+('plain text document', 'document texte brut')
+>>> print(RemoteMimeType("application/x-does-not-exist").comment())
+None
+>>> RemoteMimeType("application/zip").icon(), RemoteMimeType("text/plain").genericIcon()
+('application-zip', 'text-x-generic')
+>>> RemoteMimeType("application/javascript").aliases()
+[<MimeType: application/x-javascript>, <MimeType: text/javascript>]
+>>> RemoteMimeType("application/x-does-not-exist").aliases()
+[]
+>>> RemoteMimeType("application/x-bzip").extensions()
+['.bz', '.bz2']
+>>> RemoteMimeType("application/x-does-not-exist").extensions()
+[]
+
+The queries answer the same as MimeType
+>>> def query(mime):
+...     ret = [mime.acronym(), mime.expandedAcronym(), mime.comment("fr"), mime.aliasOf(), mime.aliases()]
+...     ret += [mime.subClassOf(), mime.ancestors(), mime.genericMime(), mime.isDefault(), mime.iconPath()]
+...     ret += [list(mime.applications()), mime.bestApplication(), mime.defaultApplication()]
+...     ret += [list(mime.availableApplications()), mime.bestAvailableApplication()]
+...     return [[str(item) for item in value] if isinstance(value, list) else str(value) for value in ret]
+>>> for name in ("application/javascript", "text/javascript", "text/x-csrc", "text/plain", "application/x-does-not-exist"):
+...     assert query(RemoteMimeType(name)) == query(MimeType(name)), name
+>>> RemoteMimeType("text/x-csrc").subClassOf(), RemoteMimeType("text/javascript").aliasOf()
+([<MimeType: text/plain>], <MimeType: application/javascript>)
+>>> RemoteMimeType("text/x-csrc").genericMime(), RemoteMimeType("text/x-csrc").isDefault()
+(<MimeType: text/x-generic>, False)
+>>> RemoteMimeType.fromInode(".")
+<MimeType: inode/directory>
+>>> client.fromNames(["foo.txt", "bar.png", "no-such-file"])
+['text/plain', 'image/png', None]
+>>> fd = os.open(".", os.O_RDONLY)
+>>> RemoteMimeType.fromFile(fd)
+<MimeType: inode/directory>
+>>> os.close(fd)
+>>> client.close()
+>>> server.shutdown()
+>>> server.server_close()
+>>> thread.join()
+>>> shared = tempfile.mkdtemp()
+>>> os.chmod(shared, 0o777)
+>>> mimeserver.Server(os.path.join(shared, "mime.sock")) # doctest: +ELLIPSIS
+Traceback (most recent call last):
+    ...
+xdg.mimeserver.UnsafePathError: ... must be a directory owned by the user with mode 0700
+>>> os.chmod(shared, 0o700)
+>>> open(os.path.join(shared, "mime.sock"), "w").close()
+>>> mimeserver.Server(os.path.join(shared, "mime.sock")) # doctest: +ELLIPSIS
+Traceback (most recent call last):
+    ...
+xdg.mimeserver.UnsafePathError: ... exists and is not a socket owned by the user
+>>> mimeserver.Client(os.path.join(shared, "mime.sock")) # doctest: +ELLIPSIS
+Traceback (most recent call last):
+    ...
+xdg.mimeserver.UnsafePathError: ... is not a socket owned by the user
+>>> import shutil
+>>> shutil.rmtree(shared)
+
+# Reloading
+>>> import xdg.mime
+>>> old = xdg.mime.DATABASE
+>>> database = xdg.mime.reload()
+>>> database is xdg.mime.DATABASE, database is old
+(True, False)
+>>> xdg.mime.GLOBS is database.globs
+True
+>>> MimeType.fromName("foo.txt")
+<MimeType: text/plain>
+
+# Ranked magic matches
+>>> from xdg.mime import MAGIC
+>>> svg = b'<?xml version="1.0"?>\\n<svg xmlns="http://www.w3.org/2000/svg">'
+>>> MAGIC.matchAll(svg)
+[(45, 'image/svg+xml'), (40, 'application/xml')]
+>>> MAGIC.matchAll(svg, limit=1)
+[(45, 'image/svg+xml')]
+>>> MAGIC.matchAll(svg, max=44)
+[(40, 'application/xml')]
+>>> MAGIC.matchAll(svg, candidates={"application/xml", "text/html"})
+[(40, 'application/xml')]
+
+# MIME database compiler
+>>> import shutil
+>>> from xdg.mimecompiler import compileDatabase
+>>> base = tempfile.mkdtemp()
+>>> os.mkdir(os.path.join(base, "packages"))
+>>> with open(os.path.join(base, "packages", "test.xml"), "w") as f:
+...     _ = f.write('<?xml version="1.0" encoding="UTF-8"?>'
+...         '<mime-info xmlns="http://www.freedesktop.org/standards/shared-mime-info">'
+...         '<mime-type type="application/x-test">'
+...         '<comment>Test document</comment>'
+...         '<sub-class-of type="text/plain"/>'
+...         '<glob pattern="*.TEST" weight="60"/>'
+...         '<magic priority="70"><match type="string" value="TEST\\\\n" offset="0:4"/></magic>'
+...         '</mime-type>'
+...         '</mime-info>')
+>>> sorted(compileDatabase(base))
+['XMLnamespaces', 'aliases', 'application/x-test.xml', 'generic-icons', 'globs', 'globs2', 'icons', 'magic', 'mime.cache', 'subclasses', 'types']
+>>> compileDatabase(base)
+[]
+>>> with open(os.path.join(base, "globs2")) as f:
+...     f.readlines()[-1]
+'60:application/x-test:*.test\\n'
+>>> from xdg.mime import MagicFile
+>>> magic = MagicFile()
+>>> magic.parse(os.path.join(base, "magic"))
+>>> magic.matchData(b"xxTEST\\n")
+'application/x-test'
+
+The fingerprint of the databases changes when they are rewritten within
+the same second
+>>> from xdg import xdg
+>>> from xdg.basedir import XDG_DATA_DIRS
+>>> from xdg.mime import Database
+>>> data = tempfile.mkdtemp()
+>>> _ = shutil.copytree(base, os.path.join(data, "mime"))
+>>> XDG_DATA_DIRS.insert(0, data)
+>>> xdg.invalidateFiles()
+>>> os.utime(os.path.join(data, "mime", "magic"), ns=(0, 10 ** 9 + 1))
+>>> fingerprint = Database.load().fingerprint
+>>> os.utime(os.path.join(data, "mime", "magic"), ns=(0, 10 ** 9 + 2))
+>>> Database.load().fingerprint == fingerprint
+False
+>>> _ = XDG_DATA_DIRS.pop(0)
+>>> xdg.invalidateFiles()
+>>> shutil.rmtree(data)
+
+Packages which fail to parse are skipped, and reported on request
+>>> from xdg.mime import installPackage
+>>> bad = os.path.join(tempfile.mkdtemp(), "bad.xml")
+>>> with open(bad, "w") as f:
+...     _ = f.write('<mime-info xmlns="http://www.freedesktop.org/standards/shared-mime-info"><mime-type type="invalid"/></mime-info>')
+>>> installPackage(bad, base) # doctest: +ELLIPSIS
+Traceback (most recent call last):
+    ...
+xdg.mimecompiler.CompileError: Invalid MIME type 'invalid'
+>>> sorted(os.listdir(os.path.join(base, "packages")))
+['test.xml']
+>>> _ = shutil.copy(bad, os.path.join(base, "packages"))
+>>> compileDatabase(base)
+[]
+>>> compileDatabase(base, strict=True) # doctest: +ELLIPSIS
+Traceback (most recent call last):
+    ...
+xdg.mimecompiler.CompileError: .../packages/bad.xml: Invalid MIME type 'invalid'
+>>> shutil.rmtree(os.path.dirname(bad))
+>>> shutil.rmtree(base)
+
+# Desktop file cache
+>>> from xdg.actions import ActionsCacheFile
+>>> from xdg.desktopcache import generateCache
+>>> base = tempfile.mkdtemp()
+>>> os.mkdir(os.path.join(base, "kde"))
+>>> def desktop(name, keys):
+...     with open(os.path.join(base, name), "w") as f:
+...         _ = f.write("[Desktop Entry]\\nType=Application\\n" + keys + "\\n[Desktop Action new]\\nMimeType=text/x-action;\\n")
+>>> desktop("editor.desktop", "MimeType=text/plain;text/x-csrc;\\nCategories=Utility;TextEditor;")
+>>> desktop("kde/viewer.desktop", "MimeType=text/plain;invalid;")
+>>> generateCache(base)
+['mimeinfo.cache']
+>>> generateCache(base)
+[]
+>>> cache = ActionsCacheFile()
+>>> cache.read_merged([os.path.join(base, "mimeinfo.cache")])
+>>> list(cache.applicationsForMimeType("text/plain"))
+['editor.desktop', 'kde-viewer.desktop']
+>>> list(cache.applicationsForMimeType("text/x-action"))
+[]
+>>> cache.applicationsForCategory("TextEditor")
+['editor.desktop']
+>>> os.remove(os.path.join(base, "kde", "viewer.desktop"))
+>>> generateCache(base)
+['mimeinfo.cache']
+>>> cache = ActionsCacheFile()
+>>> cache.read_merged([os.path.join(base, "mimeinfo.cache")])
+>>> list(cache.applicationsForMimeType("text/plain"))
+['editor.desktop']
+>>> shutil.rmtree(base)
+
+# Magic rules
+>>> import struct
+>>> from xdg.mime import MagicFile
+>>> def rule(value, offset=0, indent=0, mask=None, word=1, length=1):
+...     ret = (b"%d" % indent if indent else b"") + b">%d=" % offset + struct.pack(">H", len(value)) + value
+...     if mask is not None:
+...         ret += b"&" + mask
+...     if word > 1:
+...         ret += b"~%d" % word
+...     if length > 1:
+...         ret += b"+%d" % length
+...     return ret + b"\\n"
+>>> def section(priority, mime, *rules):
+...     return b"[%d:%s]\\n" % (priority, mime.encode()) + b"".join(rules)
+>>> base = tempfile.mkdtemp()
+>>> path = os.path.join(base, "magic")
+>>> with open(path, "wb") as f:
+...     _ = f.write(b"MIME-Magic\\0\\n" +
+...         section(60, "application/x-range", rule(b"abc", offset=4, length=8)) +
+...         section(60, "application/x-mask", rule(bytes.fromhex("f00f"), mask=bytes.fromhex("f0f0"))) +
+...         section(50, "application/x-host16", rule(bytes.fromhex("1234"), word=2)) +
+...         section(50, "application/x-host16-mask", rule(bytes.fromhex("5600"), mask=bytes.fromhex("ff00"), word=2)) +
+...         section(50, "application/x-big16", rule(bytes.fromhex("cafe"))) +
+...         section(50, "application/x-little32", rule(struct.pack("<I", 0xdeadbeef))) +
+...         section(40, "application/x-nested",
+...             rule(b"AB"),
+...             rule(b"CD", offset=2, indent=1),
+...             rule(b"EF", offset=2, indent=1),
+...             rule(b"GH", offset=4, indent=2),
+...             rule(b"ZZ", offset=10)))
+>>> magic = MagicFile()
+>>> magic.parse(path)
+>>> magic.maxLength
+15
+>>> nested, = magic.types[40]
+>>> [str(r) for r in nested.topRules]
+['0>0=[2]AB&~1+1', '0>10=[2]ZZ&~1+1']
+>>> [str(r) for r in nested.topRules[0].children]
+['1>2=[2]CD&~1+1', '1>2=[2]EF&~1+1']
+>>> [str(r) for r in nested.topRules[0].children[1].children]
+['2>4=[2]GH&~1+1']
+
+Ranges
+>>> magic.matchData(b"012abc")
+>>> magic.matchData(b"0123abc")
+'application/x-range'
+>>> magic.matchData(b"01234567890abc")
+'application/x-range'
+>>> magic.matchData(b"012345678901abc")
+
+Masks
+>>> magic.matchData(bytes.fromhex("f50a"))
+'application/x-mask'
+>>> magic.matchData(bytes.fromhex("e50a"))
+>>> magic.matchData(bytes.fromhex("f51a"))
+
+Host-endian, big-endian and little-endian words
+>>> magic.matchData(struct.pack("=H", 0x1234))
+'application/x-host16'
+>>> magic.matchData(struct.pack("=H", 0x56aa))
+'application/x-host16-mask'
+>>> magic.matchData(struct.pack("=H", 0xaa56))
+>>> magic.matchData(struct.pack(">H", 0xcafe))
+'application/x-big16'
+>>> magic.matchData(struct.pack("<H", 0xcafe))
+>>> magic.matchData(struct.pack("<I", 0xdeadbeef))
+'application/x-little32'
+>>> magic.matchData(struct.pack(">I", 0xdeadbeef))
+
+Nested rules match if their parent and one of their children match
+>>> [magic.matchData(data) for data in (b"ABCD", b"ABEFGH", b"ABEF", b"ABGH", b"CDEFGH", b"..........ZZ")]
+['application/x-nested', 'application/x-nested', None, None, None, 'application/x-nested']
+>>> counter = [0]
+>>> nested.match(b"ABEFGH", counter), counter
+('application/x-nested', [4])
+>>> magic.freeze()
+>>> nested.topRules[0].children[1].children
+(MagicRule('2>4=[2]GH&~1+1'),)
+>>> magic.matchData(b"ABEFGH")
+'application/x-nested'
+>>> shutil.rmtree(base)
+
+# Freezing before fork, which must come last
+>>> from xdg.mime import freeze
+>>> freeze()
+>>> MimeType.fromName("foo.txt")
+<MimeType: text/plain>
+>>> MimeType("application/x-bzip").extensions()
+['.bz', '.bz2']
+>>> MimeType("text/x-csrc").isInstance("text/plain")
+True
 """
 
 
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Trash tests for python-xdg
+
+>>> import os, tempfile
+>>> from xdg.trash import Trash, mountPoint
+>>> tmp = tempfile.mkdtemp()
+>>> trash = Trash(os.path.join(tmp, "Trash"))
+>>> path = os.path.join(tmp, "foo")
+>>> _ = open(path, "w").write("foo")
+>>> trash.trash(path)
+>>> os.path.exists(path)
+False
+>>> trash.files()
+['foo']
+>>> "foo" in trash
+True
+>>> _ = open(path, "w").write("foo")
+>>> trash.trash(path)
+>>> sorted(trash.files())
+['foo', 'foo.1']
+>>> sorted(os.listdir(trash.infoPath()))
+['foo.1.trashinfo', 'foo.trashinfo']
+>>> trash.trash(path)
+Traceback (most recent call last):
+    ...
+OSError: No such file or directory
+>>> trash.empty()
+>>> trash.isEmpty()
+True
+>>> os.listdir(trash.infoPath())
+[]
+
+# Bulk trashing
+>>> paths = [os.path.join(tmp, name) for name in ("a", "b", "c")]
+>>> os.mkdir(os.path.join(tmp, "sub"))
+>>> paths.append(os.path.join(tmp, "sub", "a"))
+>>> for p in paths:
+...     _ = open(p, "w").write(p)
+>>> errors = trash.trashMany(paths + [os.path.join(tmp, "missing")])
+>>> list(errors) == [os.path.join(tmp, "missing")]
+True
+>>> sorted(trash.files())
+['a', 'a.1', 'b', 'c']
+>>> sorted(os.listdir(trash.infoPath()))
+['a.1.trashinfo', 'a.trashinfo', 'b.trashinfo', 'c.trashinfo']
+>>> trash.empty()
+
+Files which cannot be moved are left in place, without metadata
+>>> import errno
+>>> for p in paths:
+...     _ = open(p, "w").write(p)
+>>> def move(path, name, copy=False, move=trash._move):
+...     if name == "b":
+...         raise OSError(errno.EACCES, "Permission denied")
+...     move(path, name, copy)
+>>> trash._move = move
+>>> errors = trash.trashMany(paths)
+>>> del trash._move
+>>> [(os.path.relpath(path, tmp), e.errno) for path, e in errors.items()]
+[('b', 13)]
+>>> os.path.exists(paths[1]), [os.path.exists(p) for p in paths if p != paths[1]]
+(True, [False, False, False])
+>>> sorted(trash.files())
+['a', 'a.1', 'c']
+>>> sorted(os.listdir(trash.infoPath()))
+['a.1.trashinfo', 'a.trashinfo', 'c.trashinfo']
+>>> trash.empty()
+
+Directories, and those partially copied when the move fails
+>>> dir = os.path.join(tmp, "dir")
+>>> os.makedirs(os.path.join(dir, "sub"))
+>>> _ = open(os.path.join(dir, "sub", "file"), "w").write("file")
+>>> trash.trash(dir)
+>>> trash.files()
+['dir']
+>>> trash.empty()
+>>> trash.files(), os.listdir(trash.infoPath())
+([], [])
+>>> os.makedirs(os.path.join(dir, "sub"))
+>>> def move(path, name, copy=False):
+...     os.makedirs(os.path.join(trash.filesPath(), name, "sub"))
+...     raise OSError(errno.ENOSPC, "No space left on device")
+>>> trash._move = move
+>>> trash.trash(dir, copy=True)
+Traceback (most recent call last):
+    ...
+OSError: [Errno 28] No space left on device
+>>> del trash._move
+>>> trash.files(), os.listdir(trash.infoPath()), os.path.isdir(dir)
+([], [], True)
+
+# Per-device trash
+>>> mountPoint("/")
+'/'
+>>> os.path.ismount(mountPoint(tmp))
+True
+>>> os.stat(mountPoint(tmp)).st_dev == os.stat(tmp).st_dev
+True
+
+# Mount table
+>>> from xdg.mounts import MOUNTS, parseMountInfo
+>>> table = parseMountInfo("28 1 254:0 / / rw - ext4 /dev/vda rw\\n29 28 254:0 /data /media/my\\\\040disk rw - ext4 /dev/vda rw\\n")
+>>> table[os.makedev(254, 0)]
+['/', '/media/my disk']
+>>> MOUNTS.isMountPoint("/")
+True
+>>> MOUNTS.isMountPoint(tmp)
+False
+>>> mountPoint(tmp) in MOUNTS.mountPoints(os.stat(tmp).st_dev) or not MOUNTS.available()
+True
+
+Lookups from several threads at once
+>>> import threading
+>>> errors = []
+>>> def lookup():
+...     try:
+...         for i in range(2000):
+...             MOUNTS.isMountPoint(tmp)
+...             MOUNTS.refresh(force=not i % 500)
+...     except Exception as e:
+...         errors.append(e)
+>>> threads = [threading.Thread(target=lookup) for i in range(8)]
+>>> for thread in threads:
+...     thread.start()
+>>> for thread in threads:
+...     thread.join()
+>>> errors
+[]
+
+>>> import shutil
+>>> shutil.rmtree(tmp)
+"""
+
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
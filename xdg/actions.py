@@ -4,6 +4,7 @@ http://www.freedesktop.org/wiki/Specifications/mime-actions-spec
 
 The implementation is in two parts:
  - mimeinfo.cache, which is autogenerated by update-desktop-database
+   or xdg.desktopcache
    and contains a single-file cache of all desktop files
  - mimeapps.list, which contains user associations, exclusions and
    default apps
@@ -17,11 +18,20 @@ The implementation is in two parts:
    the default to be used when executing a specific action.
 """
 
+import os
+import threading
+from collections import OrderedDict
 from . import xdg
 from .desktopfile import getDesktopFilePath
 from .inifile import IniFile, NoSectionError
 from .utils import OrderedSet
 
+try:
+	import fcntl
+except ImportError:
+	# Not available on Windows; files are then written without locking
+	fcntl = None
+
 
 # MIME actions
 ACTION_OPEN = 0x01
@@ -56,56 +66,319 @@ MIME_CACHE = {
 CATEGORY_CACHE = "Category Cache"
 INTENTS_CACHE = "Intents Cache"
 
+# Every non-empty combination of actions, for the per-action lookup tables
+ACTION_MASKS = range(1, ACTION_ALL + 1)
+
+# The mimeapps.list file written to by ActionsListFile.save()
+USER_ACTIONS_LIST = os.path.join(xdg.XDG_DATA_HOME, "applications", "mimeapps.list")
+
+
+class ReverseIndexedFile(IniFile):
+	"""
+	IniFile which keeps, for each section in INDEXED_SECTIONS, a reverse
+	index of the listed values (applications) to the options listing them
+	(eg. MIME types). The index is built when the files are read.
+	"""
+	INDEXED_SECTIONS = ()
+
+	def __init__(self, *args, **kwargs):
+		self._reverse = {}
+		# Lookup tables built by the subclasses, by option
+		self._resolved = {}
+		super(ReverseIndexedFile, self).__init__(*args, **kwargs)
+
+	def _buildReverseIndex(self):
+		self._reverse = {}
+		for section in self.INDEXED_SECTIONS:
+			index = self._reverse[section] = {}
+			if not self.has_section(section):
+				continue
+			for option in self.options(section):
+				for value in self.getlist(section, option):
+					if value not in index:
+						index[value] = []
+					index[value].append(option)
+
+	def _reindex(self, section, option, old, new):
+		"""
+		Updates the reverse index after the values of \a option in
+		\a section changed from \a old to \a new
+		"""
+		index = self._reverse.get(section)
+		if index is None:
+			return
+		option = self.optionxform(option)
+		for value in old:
+			if option in index.get(value, ()):
+				options = [o for o in index[value] if o != option]
+				if options:
+					index[value] = options
+				else:
+					del index[value]
+		for value in new:
+			index[value] = list(index.get(value, ())) + [option]
+
+	def _reverseLookup(self, sections, value):
+		"""
+		Returns the options listing \a value in any of \a sections, in order
+		"""
+		ret = OrderedDict()
+		for section in sections:
+			for option in self._reverse.get(section, {}).get(value, ()):
+				ret[option] = None
+		return list(ret)
+
+	def freeze(self):
+		super(ReverseIndexedFile, self).freeze()
+		for index in self._reverse.values():
+			for value, options in index.items():
+				index[value] = tuple(options)
+		for mime, table in self._resolved.items():
+			self._resolved[mime] = tuple(table)
+
+	def read_merged(self, filenames, encoding=None):
+		super(ReverseIndexedFile, self).read_merged(filenames, encoding)
+		self._buildReverseIndex()
+
+
+def _sections(sections, action):
+	return [sections[flag] for flag in (ACTION_VIEW, ACTION_EDIT, ACTION_OPEN) if action & flag]
+
+def _editList(ini, section, option, add=(), remove=(), replace=False):
+	"""
+	Prepends \a add to and removes \a remove from the ;-list \a option
+	If \a replace is True, the current values are dropped.
+	Returns a tuple of the old and new values.
+	"""
+	old = ini.getlist(section, option, [])
+	values = [] if replace else [v for v in old if v not in add and v not in remove]
+	new = list(add) + values
+	ini.setlist(section, option, new)
+	return old, new
+
 
-class ActionsListFile(IniFile):
+class ActionsListFile(ReverseIndexedFile):
 	"""
 	applications/mimeapps.list
 	NOTE: Theoretically, this file should only be in $XDG_DATA_HOME
 	"""
+	INDEXED_SECTIONS = tuple(ADDED_ASSOCIATIONS.values()) + tuple(REMOVED_ASSOCIATIONS.values()) + tuple(DEFAULT_APPLICATIONS.values())
+
+	# Resolution of a MIME type which is not in any section
+	EMPTY_RESOLUTION = (None, (), frozenset())
+
+	def __init__(self, *args, **kwargs):
+		super(ActionsListFile, self).__init__(*args, **kwargs)
+		# Changes not yet written by save()
+		self._pending = []
+		# Serializes the edits; lookups only read the tables, which edits
+		# replace rather than modify
+		self._lock = threading.RLock()
+		# MIME type -> list of (default, added, removed), indexed by action mask
+		self._resolved = {}
+
+	def _edit(self, section, option, add=(), remove=(), replace=False):
+		old, new = _editList(self, section, option, add, remove, replace)
+		if old == new:
+			# Nothing for save() to write
+			return
+		self._reindex(section, option, old, new)
+		self._resolved[self.optionxform(option)] = self._resolve(option)
+		self._pending.append((section, option, add, remove, replace))
+
+	def _resolve(self, mime):
+		"""
+		Returns the lookup table of \a mime for every action mask:
+		 - The default application is the first one set, looking at the
+		   actions in the order open, view, edit
+		 - The added associations are merged, in the order view, edit, open
+		 - The removed associations are those removed for all the actions
+		"""
+		defaults = {}
+		added = {}
+		removed = {}
+		for flag in (ACTION_OPEN, ACTION_VIEW, ACTION_EDIT):
+			defaults[flag] = self.getlist(DEFAULT_APPLICATIONS[flag], mime, [])
+			added[flag] = self.getlist(ADDED_ASSOCIATIONS[flag], mime, [])
+			removed[flag] = frozenset(self.getlist(REMOVED_ASSOCIATIONS[flag], mime, []))
+
+		table = [self.EMPTY_RESOLUTION]
+		for action in ACTION_MASKS:
+			default = None
+			for flag in (ACTION_OPEN, ACTION_VIEW, ACTION_EDIT):
+				if action & flag and defaults[flag]:
+					default = defaults[flag][0]
+					break
+			flags = [flag for flag in (ACTION_VIEW, ACTION_EDIT, ACTION_OPEN) if action & flag]
+			merged = tuple(OrderedDict.fromkeys(app for flag in flags for app in added[flag]))
+			excluded = frozenset.intersection(*[removed[flag] for flag in flags])
+			table.append((default, merged, excluded))
+		return table
+
+	def _resolution(self, mime, action):
+		table = self._resolved.get(self.optionxform(mime))
+		if table is None:
+			return self.EMPTY_RESOLUTION
+		return table[action & ACTION_ALL]
+
+	def read_merged(self, filenames, encoding=None):
+		super(ActionsListFile, self).read_merged(filenames, encoding)
+		mimes = set()
+		for section in self.INDEXED_SECTIONS:
+			if self.has_section(section):
+				mimes.update(self.options(section))
+		self._resolved = dict((mime, self._resolve(mime)) for mime in mimes)
+
+	def addAssociation(self, mime, app, action=ACTION_OPEN):
+		"""
+		Associates \a app with \a mime, with priority over the other
+		associated applications. The change is only written by save().
+		"""
+		with self._lock:
+			for flag in (ACTION_VIEW, ACTION_EDIT, ACTION_OPEN):
+				if action & flag:
+					self._edit(ADDED_ASSOCIATIONS[flag], mime, add=[app])
+					self._edit(REMOVED_ASSOCIATIONS[flag], mime, remove=[app])
+
+	def removeAssociation(self, mime, app, action=ACTION_OPEN):
+		"""
+		Removes the association of \a app with \a mime. If \a app is the
+		default application, it is unset. The change is only written by save().
+		"""
+		with self._lock:
+			for flag in (ACTION_VIEW, ACTION_EDIT, ACTION_OPEN):
+				if action & flag:
+					self._edit(ADDED_ASSOCIATIONS[flag], mime, remove=[app])
+					self._edit(REMOVED_ASSOCIATIONS[flag], mime, add=[app])
+					self._edit(DEFAULT_APPLICATIONS[flag], mime, remove=[app])
+
+	def setDefault(self, mime, app, action=ACTION_OPEN):
+		"""
+		Sets \a app as the default application for \a mime
+		The change is only written by save().
+		"""
+		with self._lock:
+			for flag in (ACTION_VIEW, ACTION_EDIT, ACTION_OPEN):
+				if action & flag:
+					self._edit(DEFAULT_APPLICATIONS[flag], mime, add=[app], replace=True)
+
+	def hasPendingChanges(self):
+		return bool(self._pending)
+
+	def save(self, path=USER_ACTIONS_LIST):
+		"""
+		Writes all the pending changes to \a path in a single write
+		The file is reread under an exclusive lock and the changes are
+		applied on top of it, so that changes made by other writers in
+		the meantime are kept. The in-memory state is not reloaded.
+		"""
+		with self._lock:
+			if not self._pending:
+				return
+
+			dir = os.path.dirname(path) or "."
+			if not os.path.isdir(dir):
+				os.makedirs(dir)
+
+			lock = os.open(dir, os.O_RDONLY)
+			try:
+				if fcntl:
+					fcntl.flock(lock, fcntl.LOCK_EX)
+				# The keys are normalized like in memory, so that the
+				# edits apply to keys of any case
+				current = IniFile()
+				current.optionxform = self.optionxform
+				current.read_merged([path])
+				for section, option, add, remove, replace in self._pending:
+					_editList(current, section, option, add, remove, replace)
+				current.write_atomic(path)
+			finally:
+				os.close(lock)
+
+			self._pending = []
+		xdg.invalidateFiles(dir)
+
+	def addedMimeTypes(self, app, action=ACTION_ALL):
+		"""
+		Returns the MIME types the user associated with \a app
+		"""
+		return self._reverseLookup(_sections(ADDED_ASSOCIATIONS, action), app)
+
+	def removedMimeTypes(self, app, action=ACTION_ALL):
+		"""
+		Returns the MIME types the user removed the association of \a app for
+		"""
+		return self._reverseLookup(_sections(REMOVED_ASSOCIATIONS, action), app)
+
+	def defaultMimeTypes(self, app, action=ACTION_ALL):
+		"""
+		Returns the MIME types \a app is the default application of
+		"""
+		return self._reverseLookup(_sections(DEFAULT_APPLICATIONS, action), app)
 
 	def addedAssociations(self, mime, action=ACTION_ALL):
-		for flag in (ACTION_VIEW, ACTION_EDIT, ACTION_OPEN):
-			if action & flag:
-				return self.getlist(ADDED_ASSOCIATIONS[flag], mime, [])
+		# The associations added for each action in \a action, merged
+		return list(self._resolution(mime, action)[1])
 
 	def removedAssociations(self, mime, action=ACTION_ALL):
 		# When asking for ACTION_FOO, we only return the removed assocs for ACTION_FOO
 		# However, when asking for more than one action, we return the removed assocs
 		# for all those actions.
-		lists = []
-		for flag in (ACTION_VIEW, ACTION_EDIT, ACTION_OPEN):
-			if action & flag:
-				lists.append(self.getlist(REMOVED_ASSOCIATIONS[flag], mime, []))
-
-		return set(item for removed in lists for item in removed if all(item in removed for removed in lists))
+		return set(self._resolution(mime, action)[2])
 
 	def defaultApplication(self, mime, action=ACTION_ALL):
 		# The order here is different because it's always user-set (?)
-		for flag in (ACTION_OPEN, ACTION_VIEW, ACTION_EDIT):
-			if action & flag:
-				return self.getdefault(DEFAULT_APPLICATIONS[flag], mime, None)
+		return self._resolution(mime, action)[0]
+
+def _loadActionsList():
+	ret = ActionsListFile()
+	ret.read_merged(xdg.getFiles("applications/mimeapps.list")[::-1])
+	return ret
 
-ACTIONS_LIST = ActionsListFile()
-ACTIONS_LIST.read_merged(xdg.getFiles("applications/mimeapps.list")[::-1])
+ACTIONS_LIST = _loadActionsList()
 
 
-class ActionsCacheFile(IniFile):
+class ActionsCacheFile(ReverseIndexedFile):
 	"""
 	applications/mimeinfo.cache
-	Generated by desktop-file-utils
+	Generated by desktop-file-utils or xdg.desktopcache
 	"""
+	INDEXED_SECTIONS = tuple(MIME_CACHE.values()) + (CATEGORY_CACHE, )
+
+	def __init__(self, *args, **kwargs):
+		super(ActionsCacheFile, self).__init__(*args, **kwargs)
+		# MIME type -> merged tuple of applications, indexed by action mask
+		self._resolved = {}
 
 	def _get_apps(self, section, option, exclude):
 		if self.has_option(section, option):
 			return [app for app in self.getlist(section, option) if app not in exclude]
 		return []
 
-	def applicationsForMimeType(self, mime, exclude=[], action=ACTION_ALL):
-		ret = OrderedSet([])
+	def _resolve(self, mime):
+		apps = {}
 		for flag in (ACTION_VIEW, ACTION_EDIT, ACTION_OPEN):
-			if action & flag:
-				ret.update(self._get_apps(MIME_CACHE[flag], mime, exclude))
-		return ret
+			apps[flag] = self.getlist(MIME_CACHE[flag], mime, [])
+
+		table = [()]
+		for action in ACTION_MASKS:
+			flags = [flag for flag in (ACTION_VIEW, ACTION_EDIT, ACTION_OPEN) if action & flag]
+			table.append(tuple(OrderedDict.fromkeys(app for flag in flags for app in apps[flag])))
+		return table
+
+	def read_merged(self, filenames, encoding=None):
+		super(ActionsCacheFile, self).read_merged(filenames, encoding)
+		mimes = set()
+		for section in MIME_CACHE.values():
+			if self.has_section(section):
+				mimes.update(self.options(section))
+		self._resolved = dict((mime, self._resolve(mime)) for mime in mimes)
+
+	def applicationsForMimeType(self, mime, exclude=[], action=ACTION_ALL):
+		table = self._resolved.get(self.optionxform(mime))
+		if table is None:
+			return OrderedSet()
+		return OrderedSet(app for app in table[action & ACTION_ALL] if app not in exclude)
 
 	def applicationsForCategory(self, category, exclude=[]):
 		return self._get_apps(CATEGORY_CACHE, category, exclude)
@@ -113,23 +386,57 @@ class ActionsCacheFile(IniFile):
 	def applicationsForIntent(self, intent, exclude=[]):
 		return self._get_apps(INTENTS_CACHE, intent, exclude)
 
-ACTIONS_CACHE = ActionsCacheFile()
-ACTIONS_CACHE.read_merged(xdg.getFiles("applications/mimeinfo.cache")[::-1])
+	def categoriesForApplication(self, app):
+		return self._reverseLookup([CATEGORY_CACHE], app)
+
+	def mimeTypesForApplication(self, app, action=ACTION_ALL):
+		return self._reverseLookup(_sections(MIME_CACHE, action), app)
+
+def _loadActionsCache():
+	ret = ActionsCacheFile()
+	ret.read_merged(xdg.getFiles("applications/mimeinfo.cache")[::-1])
+	return ret
+
+ACTIONS_CACHE = _loadActionsCache()
+
+
+def reload():
+	"""
+	Reads mimeapps.list and mimeinfo.cache again, and replaces ACTIONS_LIST
+	and ACTIONS_CACHE. Lookups running in other threads finish on the
+	files they started with. Pending changes of ACTIONS_LIST are lost;
+	save() them first.
+	"""
+	global ACTIONS_LIST, ACTIONS_CACHE
+	xdg.invalidateFiles()
+	ACTIONS_LIST, ACTIONS_CACHE = _loadActionsList(), _loadActionsCache()
+
+
+def freeze():
+	"""
+	Turns the tables of ACTIONS_LIST and ACTIONS_CACHE into tuples, see
+	xdg.mime.freeze()
+	"""
+	ACTIONS_LIST.freeze()
+	ACTIONS_CACHE.freeze()
 
 
 def associationsForMimeType(mime, action=ACTION_ALL):
+	# Read once, in case of a concurrent reload()
+	actionsList, actionsCache = ACTIONS_LIST, ACTIONS_CACHE
+
 	# First, check if the default app is defined
-	ret = ACTIONS_LIST.defaultApplication(mime.name(), action=action)
+	ret = actionsList.defaultApplication(mime.name(), action=action)
 	if ret and getDesktopFilePath(ret):
 		yield ret
 
 	# Then, check the added associations (they have priority)
-	associations = ACTIONS_LIST.addedAssociations(mime.name())
+	associations = actionsList.addedAssociations(mime.name(), action=action)
 	for assoc in associations:
 		yield assoc
 
 	# Finally, check the cached associations
-	associations = ACTIONS_CACHE.applicationsForMimeType(mime.name(), exclude=ACTIONS_LIST.removedAssociations(mime.name(), action=action), action=action)
+	associations = actionsCache.applicationsForMimeType(mime.name(), exclude=actionsList.removedAssociations(mime.name(), action=action), action=action)
 	for assoc in associations:
 		yield assoc
 
@@ -139,3 +446,24 @@ def associationsForMimeType(mime, action=ACTION_ALL):
 			yield assoc
 
 	# No application found
+
+
+def mimeTypesForApplication(app, action=ACTION_ALL):
+	"""
+	Returns the names of the MIME types \a app can handle for \a action:
+	those it is associated with in the cache or by the user, minus the
+	associations removed by the user (for all the actions in \a action,
+	as in ActionsListFile.removedAssociations()).
+	"""
+	actionsList, actionsCache = ACTIONS_LIST, ACTIONS_CACHE
+	removed = None
+	for flag in (ACTION_VIEW, ACTION_EDIT, ACTION_OPEN):
+		if action & flag:
+			mimes = set(actionsList.removedMimeTypes(app, action=flag))
+			removed = mimes if removed is None else removed & mimes
+	removed = removed or set()
+	ret = OrderedDict()
+	for mime in actionsList.addedMimeTypes(app, action=action) + actionsCache.mimeTypesForApplication(app, action=action):
+		if mime not in removed:
+			ret[mime] = None
+	return list(ret)
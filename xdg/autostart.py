@@ -5,22 +5,137 @@ http://standards.freedesktop.org/autostart-spec/autostart-spec-latest.html
 
 import os
 from .basedir import XDG_CONFIG_HOME, XDG_CONFIG_DIRS
+from .desktopfile import DesktopFile, InvalidDesktopFile
+from .inifile import Error
 
 AUTOSTART_DIRS = [os.path.join(path, "autostart") for path in XDG_CONFIG_DIRS]
+LOCAL_AUTOSTART_DIR = os.path.join(XDG_CONFIG_HOME, "autostart")
+
+# Cache of the merged autostart entries, revalidated by directory mtime
+_entries = None
+_mtimes = None
+# Cache of parsed desktop files: path -> (mtime, DesktopFile or None)
+_parsed = {}
+
+
+def _mtime(path):
+	try:
+		return os.stat(path).st_mtime
+	except OSError:
+		return None
+
+def _isExecutable(name):
+	"""
+	Returns True if \a name is an absolute path to an executable or an
+	executable that can be found in $PATH
+	"""
+	if os.path.isabs(name):
+		return os.access(name, os.X_OK)
+	for dir in os.environ.get("PATH", os.defpath).split(os.pathsep):
+		if os.access(os.path.join(dir, name), os.X_OK):
+			return True
+	return False
+
+def _parse(path):
+	"""
+	Returns the DesktopFile at \a path, reparsing it only if it changed
+	Returns None for unreadable or invalid desktop files.
+	"""
+	mtime = _mtime(path)
+	if path in _parsed and _parsed[path][0] == mtime:
+		return _parsed[path][1]
+
+	desktop = DesktopFile()
+	try:
+		if not desktop.read(path):
+			desktop = None
+	except (InvalidDesktopFile, Error, EnvironmentError, UnicodeDecodeError):
+		desktop = None
+	_parsed[path] = (mtime, desktop)
+	return desktop
+
+def _scan():
+	"""
+	Returns a list of (path, DesktopFile) for all the autostart entries,
+	after the user's entries have overridden the global ones.
+	Directories are only rescanned if their mtime changed.
+	"""
+	global _entries, _mtimes
+
+	mtimes = [_mtime(dir) for dir in AUTOSTART_DIRS]
+	if _entries is None or mtimes != _mtimes:
+		entries = {}
+		# The first directory has the highest priority
+		for dir in reversed(AUTOSTART_DIRS):
+			try:
+				names = os.listdir(dir)
+			except OSError:
+				continue
+			for name in names:
+				if name.endswith(".desktop"):
+					entries[name] = os.path.join(dir, name)
+		_entries = [entries[name] for name in sorted(entries)]
+		_mtimes = mtimes
+
+	ret = []
+	for path in _entries:
+		desktop = _parse(path)
+		if desktop is not None:
+			ret.append((path, desktop))
+	return ret
+
+def _shouldAutostart(desktop):
+	"""
+	Applies the Hidden, OnlyShowIn, NotShowIn and TryExec keys of \a desktop
+	"""
+	if desktop.value("Hidden") == "true":
+		return False
+
+	desktops = [x for x in os.environ.get("XDG_CURRENT_DESKTOP", "").split(":") if x]
+	onlyShowIn = desktop.getlist(desktop.section, "OnlyShowIn")
+	if onlyShowIn and not any(x in onlyShowIn for x in desktops):
+		return False
+	notShowIn = desktop.getlist(desktop.section, "NotShowIn")
+	if notShowIn and any(x in notShowIn for x in desktops):
+		return False
+
+	tryExec = desktop.value("TryExec")
+	if tryExec and not _isExecutable(tryExec):
+		return False
+
+	return True
+
+def _autostartPrograms():
+	"""
+	Returns a list of (local, DesktopFile) for the programs to autostart
+	"""
+	ret = []
+	for path, desktop in _scan():
+		if _shouldAutostart(desktop):
+			ret.append((os.path.dirname(path) == LOCAL_AUTOSTART_DIR, desktop))
+	return ret
 
 def localAutostartPrograms():
-	return []
+	"""
+	Returns the DesktopFile of the programs to autostart from $XDG_CONFIG_HOME
+	"""
+	return [desktop for local, desktop in _autostartPrograms() if local]
 
 def globalAutostartPrograms():
-	return []
+	"""
+	Returns the DesktopFile of the programs to autostart from $XDG_CONFIG_DIRS
+	which have not been overridden by the user
+	"""
+	return [desktop for local, desktop in _autostartPrograms() if not local]
 
 def allAutostartPrograms():
-	return localAutostartPrograms() + globalAutostartPrograms()
+	programs = _autostartPrograms()
+	return [desktop for local, desktop in programs if local] + [desktop for local, desktop in programs if not local]
 
 def autorunForMedium(path):
 	for f in [".autorun", "autorun", "autorun.sh"]:
-		path = os.path.join(path, f)
-		if os.path.exists(path):
-			return path
+		autorun = os.path.join(path, f)
+		if os.path.exists(autorun):
+			return autorun
 
 # TODO autoopen files
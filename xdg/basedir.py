@@ -26,9 +26,19 @@ XDG_DOWNLOAD_DIR:
 
 XDG_DESKTOP_DIR:
  The user's Desktop directory. Defaults to $HOME/Desktop
+
+
+The DirectoryCache class keeps directory listings in memory, so that
+looking files up in the directories above does not hit the disk each time.
+
+The BaseDirectories class provides the same directories from a snapshot of
+an environment, along with lookup functions for files in those directories.
+It can be used when the environment differs from the one of the process.
 """
 
 import os
+from time import time
+from . import stats
 
 __all__ = (
 	"HOME",
@@ -40,6 +50,7 @@ __all__ = (
 	"XDG_RUNTIME_DIR",
 	"XDG_DESKTOP_DIR",
 	"XDG_DOWNLOAD_DIR",
+	"BaseDirectories",
 )
 
 # Always points to the user's home directory
@@ -64,5 +75,241 @@ XDG_CACHE_HOME  = os.environ.get("XDG_CACHE_HOME", os.path.join(HOME, ".cache"))
 XDG_RUNTIME_DIR = os.environ.get("XDG_RUNTIME_DIR")
 
 # xdg-user-dirs
-XDG_DESKTOP_DIR = os.environ.get("XDG_DOWNLOAD_DIR", os.path.join(HOME, "Desktop"))
+XDG_DESKTOP_DIR = os.environ.get("XDG_DESKTOP_DIR", os.path.join(HOME, "Desktop"))
 XDG_DOWNLOAD_DIR = os.environ.get("XDG_DOWNLOAD_DIR", HOME)
+
+
+class DirectoryCache(object):
+	"""
+	In-memory cache of directory listings.
+	Each directory is listed once and the listing is kept, including for
+	directories which do not exist, so that negative lookups are cached too.
+	A listing is trusted for \a ttl seconds; it is then checked against
+	the mtime of the directory, and only reread if the directory changed.
+	With a ttl of None, listings are only reread when invalidated.
+	"""
+	def __init__(self, ttl=1.0):
+		self.ttl = ttl
+		# Path -> (time of the last check, mtime, names, names of the symlinks)
+		self._listings = {}
+
+	def exists(self, path):
+		"""
+		Returns True if \a path exists, like os.path.exists()
+		Only symlinks, and paths ending with a separator, "." or "..",
+		cost a system call once their directory is listed.
+		"""
+		dir, name = os.path.split(path)
+		if name in ("", ".", ".."):
+			return os.path.exists(path)
+		names, links = self._listing(dir)
+		if name not in names:
+			return False
+		if name in links:
+			# Broken symlinks do not exist
+			return os.path.exists(path)
+		return True
+
+	def getFiles(self, name, dirs):
+		"""
+		Returns the list of existing paths \a name relative to each of \a dirs
+		"""
+		ret = []
+		seen = set()
+		for dir in dirs:
+			path = os.path.join(dir, name)
+			if path not in seen and self.exists(path):
+				seen.add(path)
+				ret.append(path)
+		return ret
+
+	def invalidate(self, path=None):
+		"""
+		Forgets the listing of \a path and all its subdirectories
+		If \a path is None, the whole cache is cleared.
+		"""
+		if path is None:
+			self._listings.clear()
+			return
+
+		path = os.path.normpath(path)
+		for key in list(self._listings):
+			key_ = os.path.normpath(key)
+			if key_ == path or key_.startswith(path + os.sep):
+				del self._listings[key]
+
+	def _listing(self, path):
+		entry = self._listings.get(path)
+		now = time()
+		if entry is not None:
+			if self.ttl is None or now - entry[0] < self.ttl:
+				if stats.ENABLED:
+					stats.STATS.count("dircache.hit")
+				return entry[2], entry[3]
+			mtime = _mtime(path)
+			if mtime == entry[1]:
+				if stats.ENABLED:
+					stats.STATS.count("dircache.hit")
+				self._listings[path] = (now, mtime, entry[2], entry[3])
+				return entry[2], entry[3]
+
+		if stats.ENABLED:
+			stats.STATS.count("dircache.miss")
+		# The mtime is read first, so that changes made while listing are
+		# seen by the next check
+		mtime = _mtime(path)
+		try:
+			entries = list(os.scandir(path))
+		except OSError:
+			entries = []
+		names = frozenset(entry.name for entry in entries)
+		links = frozenset(entry.name for entry in entries if entry.is_symlink())
+		self._listings[path] = (now, mtime, names, links)
+		return names, links
+
+	def listdir(self, path):
+		"""
+		Returns a frozenset of the entries in the directory \a path
+		Missing or unreadable directories are empty.
+		"""
+		return self._listing(path)[0]
+
+def _mtime(path):
+	try:
+		return os.stat(path).st_mtime_ns
+	except OSError:
+		return None
+
+# Shared cache of the listings of the XDG directories
+DIRECTORY_CACHE = DirectoryCache()
+
+
+class BaseDirectories(object):
+	"""
+	Base directories computed from a snapshot of \a environ (defaults to
+	os.environ), taken when the instance is created.
+	File lookups go through \a cache, which defaults to the shared
+	DIRECTORY_CACHE.
+	"""
+	def __init__(self, environ=None, cache=None):
+		if environ is None:
+			environ = os.environ
+		self._cache = cache or DIRECTORY_CACHE
+		self._environ = dict((k, v) for k, v in environ.items() if k.startswith("XDG_"))
+		self._home = environ.get("HOME") or HOME
+		self._dataHome = self._get("XDG_DATA_HOME", os.path.join(self._home, ".local", "share"))
+		self._configHome = self._get("XDG_CONFIG_HOME", os.path.join(self._home, ".config"))
+		self._cacheHome = self._get("XDG_CACHE_HOME", os.path.join(self._home, ".cache"))
+		self._runtimeDir = self._get("XDG_RUNTIME_DIR", None)
+		self._dataDirs = [self._dataHome] + self._get("XDG_DATA_DIRS", "/usr/local/share:/usr/share").split(":")
+		self._configDirs = [self._configHome] + self._get("XDG_CONFIG_DIRS", "/etc/xdg").split(":")
+		self._userDirs = None
+
+	def __repr__(self):
+		return "BaseDirectories(%r)" % (self._environ)
+
+	def _get(self, key, default):
+		# Empty variables are treated as unset
+		return self._environ.get(key) or default
+
+	def _parseUserDirs(self):
+		"""
+		Parses $XDG_CONFIG_HOME/user-dirs.dirs
+		"""
+		ret = {}
+		try:
+			file = open(os.path.join(self._configHome, "user-dirs.dirs"), "r")
+		except IOError:
+			return ret
+
+		with file:
+			for line in file:
+				line = line.strip()
+				if not line or line.startswith("#"):
+					continue
+				key, _, value = line.partition("=")
+				value = value.strip().strip('"')
+				if value.startswith("$HOME"):
+					value = self._home + value[len("$HOME"):]
+				elif not value.startswith("/"):
+					continue
+				ret[key.strip()] = value
+		return ret
+
+	def cacheHome(self):
+		return self._cacheHome
+
+	def configDirs(self):
+		return self._configDirs
+
+	def configHome(self):
+		return self._configHome
+
+	def dataDirs(self):
+		return self._dataDirs
+
+	def dataHome(self):
+		return self._dataHome
+
+	def home(self):
+		return self._home
+
+	def runtimeDir(self):
+		return self._runtimeDir
+
+	def userDir(self, name, default=None):
+		"""
+		Returns the xdg-user-dirs directory \a name (eg. "DESKTOP")
+		The environment takes precedence over user-dirs.dirs, which is
+		only parsed the first time this is called.
+		"""
+		key = "XDG_%s_DIR" % (name.upper())
+		if key in self._environ:
+			return self._environ[key]
+		if self._userDirs is None:
+			self._userDirs = self._parseUserDirs()
+		return self._userDirs.get(key, default)
+
+	def _findAll(self, name, dirs):
+		return self._cache.getFiles(name, [dir for dir in dirs if dir])
+
+	def _find(self, name, dirs):
+		files = self._findAll(name, dirs)
+		if files:
+			return files[0]
+
+	def findAllCache(self, name):
+		return self._findAll(name, [self._cacheHome])
+
+	def findAllConfig(self, name):
+		return self._findAll(name, self._configDirs)
+
+	def findAllData(self, name):
+		return self._findAll(name, self._dataDirs)
+
+	def findAllRuntime(self, name):
+		return self._findAll(name, [self._runtimeDir])
+
+	def findCache(self, name):
+		"""
+		Returns the path to \a name in $XDG_CACHE_HOME if it exists
+		"""
+		return self._find(name, [self._cacheHome])
+
+	def findConfig(self, name):
+		"""
+		Returns the first existing path to \a name in the config directories
+		"""
+		return self._find(name, self._configDirs)
+
+	def findData(self, name):
+		"""
+		Returns the first existing path to \a name in the data directories
+		"""
+		return self._find(name, self._dataDirs)
+
+	def findRuntime(self, name):
+		"""
+		Returns the path to \a name in $XDG_RUNTIME_DIR if it exists
+		"""
+		return self._find(name, [self._runtimeDir])
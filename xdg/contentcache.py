@@ -0,0 +1,199 @@
+"""
+Result cache for content-based MIME type detection
+
+Results are keyed on (st_dev, st_ino, st_mtime_ns, st_size) of the file, so
+that an unchanged file resolves with a single stat. The cache has two tiers:
+ - An in-memory LRU
+ - An optional persistent sqlite database, by default in
+   $XDG_CACHE_HOME/python-xdg/mime-content.sqlite
+
+The entries of the persistent tier are stored along with a fingerprint of
+the MIME database they were found with, and only those of the current
+MIME database are used. The entries of the MAX_FINGERPRINTS most recently
+used fingerprints are kept, so that processes using different databases
+share the file without clearing each other's entries.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from .basedir import XDG_CACHE_HOME
+
+try:
+	import sqlite3
+except ImportError:
+	sqlite3 = None
+
+CACHE_PATH = os.path.join(XDG_CACHE_HOME, "python-xdg", "mime-content.sqlite")
+
+
+def statKey(st):
+	"""
+	Returns the cache key of the stat result \a st
+	"""
+	mtime = getattr(st, "st_mtime_ns", None)
+	if mtime is None:
+		mtime = int(st.st_mtime * 1e9)
+	return (st.st_dev, st.st_ino, mtime, st.st_size)
+
+
+class LRUCache(object):
+	def __init__(self, size):
+		self.size = size
+		self._items = OrderedDict()
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._items)
+
+	def clear(self):
+		with self._lock:
+			self._items.clear()
+
+	def get(self, key, default=None):
+		with self._lock:
+			try:
+				value = self._items.pop(key)
+			except KeyError:
+				return default
+			self._items[key] = value
+			return value
+
+	def set(self, key, value):
+		with self._lock:
+			self._items.pop(key, None)
+			self._items[key] = value
+			if len(self._items) > self.size:
+				self._items.popitem(last=False)
+
+
+class SqliteStore(object):
+	"""
+	Persistent tier of the content cache
+	Writes are committed every \a batch entries and on flush().
+	"""
+	VERSION = 2
+	SCHEMA = (
+		"CREATE TABLE IF NOT EXISTS fingerprints (fingerprint TEXT PRIMARY KEY, used REAL)",
+		"CREATE TABLE IF NOT EXISTS content (fingerprint TEXT, dev INTEGER, ino INTEGER, mtime INTEGER, size INTEGER, mime TEXT, PRIMARY KEY (fingerprint, dev, ino, mtime, size))",
+	)
+	# Tables of the previous versions
+	OBSOLETE = ("meta", "content", "fingerprints")
+
+	MAX_FINGERPRINTS = 4
+
+	def __init__(self, path, fingerprint, batch=100):
+		if sqlite3 is None:
+			raise RuntimeError("The persistent content cache requires the sqlite3 module")
+
+		dir = os.path.dirname(path) or "."
+		if not os.path.isdir(dir):
+			os.makedirs(dir, 0o700)
+
+		self.batch = batch
+		self._pending = 0
+		self._lock = threading.Lock()
+		self._db = sqlite3.connect(path, check_same_thread=False)
+		self._db.execute("PRAGMA journal_mode=WAL")
+		self._db.execute("PRAGMA synchronous=NORMAL")
+		if self._db.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+			for table in self.OBSOLETE:
+				self._db.execute("DROP TABLE IF EXISTS %s" % (table))
+			self._db.execute("PRAGMA user_version = %i" % (self.VERSION))
+		for statement in self.SCHEMA:
+			self._db.execute(statement)
+		self.setFingerprint(fingerprint)
+
+	def close(self):
+		self.flush()
+		with self._lock:
+			self._db.close()
+
+	def flush(self):
+		with self._lock:
+			if self._pending:
+				self._db.commit()
+				self._pending = 0
+
+	def setFingerprint(self, fingerprint):
+		"""
+		Uses the entries of the MIME database identified by \a fingerprint
+		The entries of the least recently used fingerprints are deleted.
+		"""
+		with self._lock:
+			self._fingerprint = fingerprint
+			self._db.execute("INSERT OR REPLACE INTO fingerprints VALUES (?, ?)", (fingerprint, time.time()))
+			old = [row[0] for row in self._db.execute("SELECT fingerprint FROM fingerprints ORDER BY used DESC LIMIT -1 OFFSET ?", (self.MAX_FINGERPRINTS, ))]
+			for value in old:
+				self._db.execute("DELETE FROM content WHERE fingerprint = ?", (value, ))
+				self._db.execute("DELETE FROM fingerprints WHERE fingerprint = ?", (value, ))
+			self._db.commit()
+			self._pending = 0
+
+	def get(self, key):
+		with self._lock:
+			row = self._db.execute("SELECT mime FROM content WHERE fingerprint = ? AND dev = ? AND ino = ? AND mtime = ? AND size = ?", (self._fingerprint, ) + key).fetchone()
+		if row:
+			return row[0]
+
+	def set(self, key, mime):
+		with self._lock:
+			self._db.execute("INSERT OR REPLACE INTO content VALUES (?, ?, ?, ?, ?, ?)", (self._fingerprint, ) + key + (mime, ))
+			self._pending += 1
+			if self._pending >= self.batch:
+				self._db.commit()
+				self._pending = 0
+
+
+class ContentCache(object):
+	"""
+	Two-tier cache of MIME type names by file identity
+	If \a persistent is True, results are also stored in \a path, along
+	with the fingerprint of the MIME database \a fingerprint.
+	"""
+	def __init__(self, size=4096, persistent=False, path=CACHE_PATH, fingerprint=""):
+		self._memory = LRUCache(size)
+		self._store = None
+		if persistent:
+			self._store = SqliteStore(path, fingerprint)
+
+	def clear(self):
+		self._memory.clear()
+
+	def close(self):
+		if self._store:
+			self._store.close()
+			self._store = None
+
+	def flush(self):
+		if self._store:
+			self._store.flush()
+
+	def get(self, st):
+		"""
+		Returns the cached MIME type name for the stat result \a st
+		"""
+		key = statKey(st)
+		mime = self._memory.get(key)
+		if mime is None and self._store:
+			mime = self._store.get(key)
+			if mime is not None:
+				self._memory.set(key, mime)
+		return mime
+
+	def reset(self, fingerprint):
+		"""
+		Clears the results of a previous MIME database from memory, and
+		switches the persistent tier to \a fingerprint, see
+		SqliteStore.setFingerprint()
+		"""
+		self._memory.clear()
+		if self._store:
+			self._store.setFingerprint(fingerprint)
+
+	def set(self, st, mime):
+		key = statKey(st)
+		self._memory.set(key, mime)
+		if self._store:
+			self._store.set(key, mime)
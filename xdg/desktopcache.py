@@ -0,0 +1,192 @@
+"""
+Generator of the desktop file cache
+
+Generates applications/mimeinfo.cache, in place of update-desktop-database,
+from the desktop files of an applications directory and its
+subdirectories. Only the MimeType and Categories keys of the desktop
+entries are read.
+
+Generation is incremental: the keys read from each desktop file are kept
+in a manifest in the applications directory, along with the mtime and
+size of the file, and only the files which changed are read again.
+mimeinfo.cache is written to a temporary file which then replaces it, so
+that readers never see a partially written file.
+"""
+
+import io
+import json
+import os
+from .actions import MIME_CACHE, ACTION_OPEN, CATEGORY_CACHE
+from .desktopfile import DESKTOP_ENTRY
+from .inifile import IniFile
+from .utils import writeAtomic
+
+CACHE = "mimeinfo.cache"
+
+MANIFEST = ".python-xdg-manifest.json"
+MANIFEST_VERSION = 1
+
+KEYS = ("MimeType", "Categories")
+
+
+def _isValidMimeType(mime):
+	media, sep, subtype = mime.partition("/")
+	if not media or not sep or not subtype or "/" in subtype:
+		return False
+	return not any(c.isspace() or ord(c) < 0x20 for c in mime)
+
+def _splitList(value):
+	return [v.strip() for v in value.split(";") if v.strip()]
+
+def readKeys(path, keys):
+	"""
+	Returns a dict of the values of the keys \a keys in the desktop entry
+	of the desktop file \a path, or None if it is unreadable or has no
+	desktop entry. The rest of the file is not read.
+	"""
+	ret = {}
+	section = None
+	try:
+		file = io.open(path, "r", encoding="utf-8", errors="replace")
+	except (IOError, OSError):
+		return None
+
+	with file:
+		for line in file:
+			line = line.strip()
+			if not line or line[0] == "#":
+				continue
+			if line[0] == "[":
+				if section == DESKTOP_ENTRY:
+					# The keys all are in the desktop entry
+					break
+				section = line[1:line.find("]")]
+				continue
+			if section != DESKTOP_ENTRY:
+				continue
+			key, sep, value = line.partition("=")
+			key = key.rstrip()
+			if sep and key in keys and key not in ret:
+				ret[key] = value.lstrip()
+
+	if section != DESKTOP_ENTRY:
+		return None
+	return ret
+
+def parseDesktopFile(path):
+	"""
+	Returns the MIME types and categories listed by the desktop file \a path,
+	or None if it is unreadable or has no desktop entry.
+	"""
+	values = readKeys(path, KEYS)
+	if values is None:
+		return None
+	mimes = [mime for mime in _splitList(values.get("MimeType", "")) if _isValidMimeType(mime)]
+	return list(dict.fromkeys(mimes)), list(dict.fromkeys(_splitList(values.get("Categories", ""))))
+
+def scanDesktopFiles(dir, prefix="", dirs=None):
+	"""
+	Yields the (desktop file id, path, stat) of the desktop files in \a dir
+	The ids of the files in subdirectories are prefixed with the
+	subdirectory names, joined with "-".
+	If \a dirs is a dict, the (mtime, size) of the scanned directories are
+	stored in it, by path.
+	"""
+	try:
+		if dirs is not None:
+			st = os.stat(dir)
+			dirs[dir] = (st.st_mtime_ns, st.st_size)
+		entries = sorted(os.scandir(dir), key=lambda entry: entry.name)
+	except OSError:
+		return
+	for entry in entries:
+		if entry.name.startswith("."):
+			continue
+		try:
+			if entry.is_dir(follow_symlinks=False):
+				for ret in scanDesktopFiles(entry.path, prefix + entry.name + "-", dirs):
+					yield ret
+			elif entry.name.endswith(".desktop") and entry.is_file():
+				yield prefix + entry.name, entry.path, entry.stat()
+		except OSError:
+			continue
+
+
+class CacheGenerator(object):
+	"""
+	Incremental generator of the mimeinfo.cache of the applications
+	directory \a base
+	"""
+	def __init__(self, base):
+		self.base = base
+		self.path = os.path.join(base, CACHE)
+		self.manifestPath = os.path.join(base, MANIFEST)
+
+	def _loadManifest(self):
+		try:
+			with open(self.manifestPath, "r") as file:
+				manifest = json.load(file)
+		except (IOError, OSError, ValueError):
+			return {}
+		if manifest.get("version") != MANIFEST_VERSION:
+			return {}
+		return manifest["files"]
+
+	def write(self, files):
+		"""
+		Writes the cache of \a files, a dict of desktop file id -> entry
+		"""
+		mimes = {}
+		categories = {}
+		for id in sorted(files):
+			for mime in files[id]["mimes"]:
+				mimes.setdefault(mime, []).append(id)
+			for category in files[id]["categories"]:
+				categories.setdefault(category, []).append(id)
+
+		ini = IniFile()
+		ini.optionxform = str
+		# The MIME Cache section is always written, even if empty, as by
+		# update-desktop-database. The Category Cache section, which it does
+		# not write, is only written if the desktop files list categories.
+		ini.add_section(MIME_CACHE[ACTION_OPEN])
+		for mime in sorted(mimes):
+			ini.setlist(MIME_CACHE[ACTION_OPEN], mime, mimes[mime])
+		for category in sorted(categories):
+			ini.setlist(CATEGORY_CACHE, category, categories[category])
+		ini.write_atomic(self.path)
+
+	def generate(self, force=False):
+		"""
+		Generates the cache, reading again only the desktop files which
+		changed since the last run, or all of them if \a force is True.
+		Returns the list of the files which were written.
+		"""
+		previous = self._loadManifest()
+		files = {}
+		for id, path, st in scanDesktopFiles(self.base):
+			if id in files:
+				continue
+			key = [st.st_mtime_ns, st.st_size]
+			entry = previous.get(id)
+			if force or entry is None or entry["key"] != key:
+				# Invalid files are kept in the manifest as well, so that
+				# they are not read again
+				mimes, categories = parseDesktopFile(path) or ([], [])
+				entry = {"key": key, "mimes": mimes, "categories": categories}
+			files[id] = entry
+
+		if not force and files == previous and os.path.exists(self.path):
+			return []
+
+		self.write(files)
+		manifest = {"version": MANIFEST_VERSION, "files": files}
+		writeAtomic(self.manifestPath, json.dumps(manifest, sort_keys=True).encode("utf-8"))
+		return [CACHE]
+
+
+def generateCache(base, force=False):
+	"""
+	Generates the mimeinfo.cache of \a base, see CacheGenerator.generate()
+	"""
+	return CacheGenerator(base).generate(force)
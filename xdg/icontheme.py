@@ -0,0 +1,388 @@
+"""
+Implementation of the XDG Icon Theme spec
+http://standards.freedesktop.org/icon-theme-spec/icon-theme-spec-latest.html
+
+Themes are read from the index.theme files of the icon directories, and
+looked up along their inheritance chain, hicolor last.
+
+Each theme directory is indexed once: from its icon-theme.cache, which
+is mapped in memory, if it is up to date, or by listing its
+subdirectories otherwise. Lookups are then resolved in memory, and their
+results are kept in an LRU cache; see reload() for changes on disk.
+"""
+
+import mmap
+import os
+import struct
+import threading
+from .basedir import HOME, XDG_DATA_DIRS
+from .contentcache import LRUCache
+from .inifile import IniFile
+
+ICON_THEME = "Icon Theme"
+DEFAULT_THEME = "hicolor"
+
+# In order of preference
+EXTENSIONS = (".png", ".svg", ".xpm")
+
+ICON_DIRS = [os.path.join(HOME, ".icons")] + [os.path.join(dir, "icons") for dir in XDG_DATA_DIRS]
+PIXMAP_DIRS = ["/usr/share/pixmaps"]
+
+CACHE_FILE = "icon-theme.cache"
+# Image flags of icon-theme.cache, by extension
+CACHE_FLAGS = {".xpm": 0x01, ".svg": 0x02, ".png": 0x04}
+
+# Size of the LRU cache of lookup results
+LOOKUP_CACHE_SIZE = 4096
+
+_MISSING = object()
+
+
+class ThemeDirectory(object):
+	"""
+	Subdirectory of an icon theme, eg. 48x48/apps
+	"""
+	def __init__(self, name, size, scale=1, type="Threshold", minSize=None, maxSize=None, threshold=2):
+		self.name = name
+		self.size = size
+		self.scale = scale
+		self.type = type
+		self.minSize = size if minSize is None else minSize
+		self.maxSize = size if maxSize is None else maxSize
+		self.threshold = threshold
+
+	def __repr__(self):
+		return "ThemeDirectory(%r)" % (self.name)
+
+	@classmethod
+	def fromIni(cls, ini, name):
+		def getint(key, default=None):
+			value = ini.getdefault(name, key)
+			try:
+				return int(value)
+			except (TypeError, ValueError):
+				return default
+
+		size = getint("Size")
+		if size is None:
+			return
+		return cls(name, size, getint("Scale", 1), ini.getdefault(name, "Type", "Threshold"), getint("MinSize"), getint("MaxSize"), getint("Threshold", 2))
+
+	def matchesSize(self, size, scale):
+		if scale != self.scale:
+			return False
+		if self.type == "Fixed":
+			return size == self.size
+		if self.type == "Scalable":
+			return self.minSize <= size <= self.maxSize
+		return self.size - self.threshold <= size <= self.size + self.threshold
+
+	def sizeDistance(self, size, scale):
+		scaled = size * scale
+		if self.type == "Fixed":
+			return abs(self.size * self.scale - scaled)
+		if self.type == "Scalable":
+			low, high = self.minSize, self.maxSize
+		else:
+			low, high = self.size - self.threshold, self.size + self.threshold
+		if scaled < low * self.scale:
+			return self.minSize * self.scale - scaled
+		if scaled > high * self.scale:
+			return scaled - self.maxSize * self.scale
+		return 0
+
+
+class DirectoryIndex(object):
+	"""
+	Icons of the subdirectories \a subdirs of the theme directory \a path,
+	listed once with os.scandir()
+	"""
+	def __init__(self, path, subdirs):
+		self.path = path
+		# Icon name -> list of (subdirectory, extension)
+		self._icons = {}
+		for subdir in subdirs:
+			try:
+				entries = list(os.scandir(os.path.join(path, subdir)))
+			except OSError:
+				continue
+			for entry in entries:
+				name, ext = os.path.splitext(entry.name)
+				if ext in CACHE_FLAGS:
+					self._icons.setdefault(name, []).append((subdir, ext))
+		for icons in self._icons.values():
+			icons.sort(key=lambda icon: EXTENSIONS.index(icon[1]))
+
+	def __repr__(self):
+		return "DirectoryIndex(%r)" % (self.path)
+
+	def lookup(self, name):
+		"""
+		Returns the (subdirectory, extension) pairs of the icon \a name
+		"""
+		return self._icons.get(name, ())
+
+
+class CacheIndex(object):
+	"""
+	Icons of the theme directory \a path, read from its icon-theme.cache
+	(as written by gtk-update-icon-cache), which is mapped in memory
+	"""
+	def __init__(self, path):
+		self.path = path
+		with open(os.path.join(path, CACHE_FILE), "rb") as file:
+			self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		major, minor, hashOffset, directoryOffset = struct.unpack_from(">HHII", self._data, 0)
+		if major != 1:
+			raise ValueError("Unsupported version %i.%i of %r" % (major, minor, self.path))
+		self._hashOffset = hashOffset
+		self._buckets = self._card32(hashOffset)
+		count = self._card32(directoryOffset)
+		self._directories = [self._string(self._card32(directoryOffset + 4 + 4 * i)) for i in range(count)]
+
+	def __repr__(self):
+		return "CacheIndex(%r)" % (self.path)
+
+	@classmethod
+	def isValid(cls, path):
+		"""
+		Returns True if the theme directory \a path has an icon-theme.cache
+		which is not older than the directory
+		"""
+		try:
+			return os.stat(os.path.join(path, CACHE_FILE)).st_mtime >= os.stat(path).st_mtime
+		except OSError:
+			return False
+
+	def _card32(self, offset):
+		return struct.unpack_from(">I", self._data, offset)[0]
+
+	def _string(self, offset):
+		return self._data[offset:self._data.find(b"\0", offset)].decode("utf-8", "replace")
+
+	@staticmethod
+	def hash(name):
+		"""
+		The icon name hash of gtk-update-icon-cache, over signed chars
+		"""
+		ret = 0
+		for i, c in enumerate(bytearray(name)):
+			if c > 0x7f:
+				c -= 0x100
+			ret = c if i == 0 else (ret << 5) - ret + c
+			ret &= 0xffffffff
+		return ret
+
+	def lookup(self, name):
+		"""
+		Returns the (subdirectory, extension) pairs of the icon \a name
+		"""
+		if not self._buckets:
+			return ()
+		encoded = name.encode("utf-8")
+		offset = self._card32(self._hashOffset + 4 + 4 * (self.hash(encoded) % self._buckets))
+		while offset != 0xffffffff:
+			chain, nameOffset, imagesOffset = struct.unpack_from(">III", self._data, offset)
+			if self._data[nameOffset:nameOffset + len(encoded) + 1] == encoded + b"\0":
+				ret = []
+				for i in range(self._card32(imagesOffset)):
+					directory, flags = struct.unpack_from(">HH", self._data, imagesOffset + 4 + 8 * i)
+					for ext in EXTENSIONS:
+						if flags & CACHE_FLAGS[ext]:
+							ret.append((self._directories[directory], ext))
+				return ret
+			offset = chain
+		return ()
+
+
+def _index(path, subdirs):
+	if CacheIndex.isValid(path):
+		try:
+			return CacheIndex(path)
+		except (EnvironmentError, ValueError, struct.error):
+			pass
+	return DirectoryIndex(path, subdirs)
+
+
+class IconTheme(object):
+	"""
+	Icon theme \a name, found in the icon directories \a dirs
+	"""
+	def __init__(self, name, dirs=ICON_DIRS):
+		self.name = name
+		self.paths = [path for path in (os.path.join(dir, name) for dir in dirs) if os.path.isdir(path)]
+		self.inherits = []
+		self.directories = []
+
+		ini = None
+		for path in self.paths:
+			index = os.path.join(path, "index.theme")
+			if os.path.exists(index):
+				# Only the first index.theme is used
+				ini = IniFile()
+				ini.read_merged([index])
+				break
+		if ini is None or not ini.has_section(ICON_THEME):
+			self.indexes = []
+			return
+
+		def getlist(key):
+			return [value.strip() for value in ini.getdefault(ICON_THEME, key, "").split(",") if value.strip()]
+
+		self.inherits = getlist("Inherits")
+		subdirs = []
+		for subdir in getlist("Directories") + getlist("ScaledDirectories"):
+			directory = ThemeDirectory.fromIni(ini, subdir)
+			if directory is not None and subdir not in subdirs:
+				self.directories.append(directory)
+				subdirs.append(subdir)
+		self.indexes = [_index(path, subdirs) for path in self.paths]
+
+	def __repr__(self):
+		return "IconTheme(%r)" % (self.name)
+
+	def exists(self):
+		return bool(self.indexes)
+
+	def lookupIcon(self, names, size, scale=1):
+		"""
+		Returns the path of the first of the icons \a names in a directory
+		matching \a size and \a scale, or else of the icon in the closest
+		directory, or None if the theme has none of them
+		"""
+		found = {}
+		for name in names:
+			for index in self.indexes:
+				for subdir, ext in index.lookup(name):
+					found.setdefault((name, subdir), []).append(os.path.join(index.path, subdir, name + ext))
+		if not found:
+			return
+
+		for directory in self.directories:
+			if directory.matchesSize(size, scale):
+				for name in names:
+					if (name, directory.name) in found:
+						return found[name, directory.name][0]
+
+		closest = None
+		distance = None
+		for directory in self.directories:
+			for name in names:
+				if (name, directory.name) in found:
+					d = directory.sizeDistance(size, scale)
+					if distance is None or d < distance:
+						closest, distance = found[name, directory.name][0], d
+		return closest
+
+
+class IconLookup(object):
+	"""
+	Resolves icon names to file paths, through the themes found in the
+	icon directories \a dirs and the unthemed icons of \a pixmapDirs
+	The themes are indexed on their first use, and the last \a size
+	results are kept in memory.
+	"""
+	def __init__(self, dirs=ICON_DIRS, pixmapDirs=PIXMAP_DIRS, size=LOOKUP_CACHE_SIZE):
+		self.dirs = dirs
+		self.pixmapDirs = pixmapDirs
+		self._lock = threading.Lock()
+		self._themes = {}
+		self._chains = {}
+		self._fallback = None
+		self._cache = LRUCache(size)
+
+	def theme(self, name):
+		"""
+		Returns the IconTheme \a name
+		"""
+		theme = self._themes.get(name)
+		if theme is None:
+			with self._lock:
+				theme = self._themes.get(name)
+				if theme is None:
+					theme = self._themes[name] = IconTheme(name, self.dirs)
+		return theme
+
+	def chain(self, name):
+		"""
+		Returns the existing themes to look icons up in for the theme
+		\a name: the theme, the themes it inherits from, and hicolor
+		"""
+		ret = self._chains.get(name)
+		if ret is None:
+			ret = []
+			pending = [name]
+			while pending:
+				theme = self.theme(pending.pop(0))
+				if theme in ret:
+					continue
+				ret.append(theme)
+				pending = theme.inherits + pending
+			if name != DEFAULT_THEME:
+				default = self.theme(DEFAULT_THEME)
+				if default not in ret:
+					ret.append(default)
+			ret = self._chains[name] = [theme for theme in ret if theme.exists()]
+		return ret
+
+	def _fallbackIndexes(self):
+		if self._fallback is None:
+			self._fallback = [DirectoryIndex(dir, [""]) for dir in self.dirs + self.pixmapDirs]
+		return self._fallback
+
+	def _lookup(self, names, size, scale, theme):
+		for t in self.chain(theme):
+			path = t.lookupIcon(names, size, scale)
+			if path:
+				return path
+
+		for name in names:
+			for index in self._fallbackIndexes():
+				for subdir, ext in index.lookup(name):
+					return os.path.join(index.path, name + ext)
+
+	def lookupIcons(self, names, size=48, scale=1, theme=DEFAULT_THEME):
+		"""
+		Returns the path of the best match for the first of the icons
+		\a names found in the theme \a theme or the themes it inherits
+		from, or in the unthemed icons. Returns None if there is none.
+		"""
+		key = (theme, tuple(names), size, scale)
+		ret = self._cache.get(key, _MISSING)
+		if ret is _MISSING:
+			ret = self._lookup(key[1], size, scale, theme)
+			self._cache.set(key, ret)
+		return ret
+
+	def lookupIcon(self, name, size=48, scale=1, theme=DEFAULT_THEME):
+		return self.lookupIcons([name], size, scale, theme)
+
+	def reload(self):
+		"""
+		Forgets the indexed themes and the cached results
+		"""
+		with self._lock:
+			self._themes = {}
+			self._chains = {}
+			self._fallback = None
+			self._cache.clear()
+
+
+ICON_LOOKUP = IconLookup()
+
+
+def lookupIcon(name, size=48, scale=1, theme=DEFAULT_THEME):
+	"""
+	Returns the path of the icon \a name, see IconLookup.lookupIcons()
+	"""
+	return ICON_LOOKUP.lookupIcon(name, size, scale, theme)
+
+def lookupIcons(names, size=48, scale=1, theme=DEFAULT_THEME):
+	return ICON_LOOKUP.lookupIcons(names, size, scale, theme)
+
+def reload():
+	"""
+	Indexes the themes again on their next use
+	This must be called after themes are installed, removed or updated.
+	"""
+	ICON_LOOKUP.reload()
@@ -3,43 +3,98 @@ Ini file format
 Base for .desktop file format
 """
 
+import io
+from collections import OrderedDict
 try:
-	from configparser import RawConfigParser, NoOptionError, NoSectionError
+	from configparser import RawConfigParser, Error, NoOptionError, NoSectionError
 except ImportError:
-	from ConfigParser import RawConfigParser, NoOptionError, NoSectionError
+	from ConfigParser import RawConfigParser, Error, NoOptionError, NoSectionError
+from .utils import writeAtomic
 
 
 class IniFile(RawConfigParser):
+	def __init__(self, *args, **kwargs):
+		# Natively stored ;-list values, by section and option
+		self._lists = {}
+		RawConfigParser.__init__(self, *args, **kwargs)
+
+	def _iterFile(self, filename, encoding=None):
+		"""
+		Yields (section, option, value) for each key in the file \a filename,
+		and (section, None, None) for each section heading
+		Missing or unreadable files are ignored, like RawConfigParser.read()
+		"""
+		try:
+			file = io.open(filename, "r", encoding=encoding or "utf-8")
+		except IOError:
+			return
+
+		section = None
+		with file:
+			for line in file:
+				line = line.strip()
+				if not line or line[0] in "#;":
+					continue
+
+				if line[0] == "[" and line[-1] == "]":
+					section = line[1:-1]
+					yield section, None, None
+					continue
+
+				option, sep, value = line.partition("=")
+				if not sep or section is None:
+					continue
+				yield section, self.optionxform(option.rstrip()), value.lstrip()
+
 	def read_merged(self, filenames, encoding=None):
-		cfg = []
+		"""
+		Reads and merges \a filenames, from lowest to highest priority
+		Values of later files override the earlier ones, except for
+		;-lists, which are merged with the values of the later files first.
+		"""
+		merged = OrderedDict()
+		existing = bool(self.sections())
 		for filename in filenames:
-			_cfg = RawConfigParser()
-			_cfg.read(filename)
-			cfg.append(_cfg)
-
-		for _cfg in cfg:
-			for section in _cfg.sections():
-				if not self.has_section(section):
-					self.add_section(section)
-
-				for option in _cfg.options(section):
-					value = _cfg.get(section, option)
-					if ";" in value:
-						current = self.getdefault(section, option, "")
-						if ";" in current:
-							val = []
-							for v in value.split(";"):
-								if v and v not in val:
-									val.append(v)
-
-							for v in self.getlist(section, option):
-								if v and v not in val:
-									val.append(v)
-
-							self.set(section, option, ";".join(val) + ";")
-							continue
+			for section, option, value in self._iterFile(filename, encoding):
+				if section not in merged:
+					merged[section] = OrderedDict()
+				options = merged[section]
+				if option is None:
+					continue
+
+				if ";" not in value:
+					options[option] = value
+					continue
+
+				values = OrderedDict.fromkeys(v for v in value.split(";") if v)
+				current = options.get(option)
+				if current is None and existing:
+					current = self.getdefault(section, option)
+					if current is not None and ";" in current:
+						current = self.getlist(section, option)
+				if isinstance(current, (list, OrderedDict)):
+					for v in current:
+						values[v] = None
+				options[option] = values
+
+		for section, options in merged.items():
+			if not self.has_section(section):
+				self.add_section(section)
+
+			for option, value in options.items():
+				if isinstance(value, OrderedDict):
+					self.setlist(section, option, value)
+				else:
 					self.set(section, option, value)
 
+	def freeze(self):
+		"""
+		Turns the natively stored ;-lists into tuples
+		"""
+		for values in self._lists.values():
+			for option, value in values.items():
+				values[option] = tuple(value)
+
 	def getdefault(self, section, option, default=None):
 		try:
 			return self.get(section, option)
@@ -47,6 +102,12 @@ class IniFile(RawConfigParser):
 			return default
 
 	def getlist(self, section, option, default=None):
+		values = self._lists.get(section)
+		if values is not None:
+			option_ = self.optionxform(option)
+			if option_ in values:
+				return list(values[option_])
+
 		try:
 			ret = self.get(section, option)
 		except (NoOptionError, NoSectionError):
@@ -55,3 +116,45 @@ class IniFile(RawConfigParser):
 		if ";" not in ret:
 			return [ret]
 		return [x for x in ret.split(";") if x]
+
+	def remove_option(self, section, option):
+		self._lists.get(section, {}).pop(self.optionxform(option), None)
+		return RawConfigParser.remove_option(self, section, option)
+
+	def remove_section(self, section):
+		self._lists.pop(section, None)
+		return RawConfigParser.remove_section(self, section)
+
+	def set(self, section, option, value=None):
+		self._lists.get(section, {}).pop(self.optionxform(option), None)
+		RawConfigParser.set(self, section, option, value)
+
+	def setlist(self, section, option, values):
+		"""
+		Sets \a option to the ;-list \a values, adding \a section if needed
+		The option is removed if \a values is empty.
+		"""
+		values = list(values)
+		if not values:
+			if self.has_section(section):
+				self.remove_option(section, option)
+			return
+
+		if not self.has_section(section):
+			self.add_section(section)
+		self.set(section, option, ";".join(values) + ";")
+		if section not in self._lists:
+			self._lists[section] = {}
+		self._lists[section][self.optionxform(option)] = values
+
+	def write_atomic(self, path):
+		"""
+		Writes the file to \a path as key=value pairs, see utils.writeAtomic()
+		"""
+		lines = []
+		for section in self.sections():
+			lines.append(u"[%s]\n" % (section))
+			for option in self.options(section):
+				lines.append(u"%s=%s\n" % (option, self.get(section, option)))
+			lines.append(u"\n")
+		writeAtomic(path, u"".join(lines).encode("utf-8"))
@@ -0,0 +1,509 @@
+"""
+Implementation of the XDG Desktop Menu spec
+http://standards.freedesktop.org/menu-spec/menu-spec-1.0.html
+
+A .menu file is resolved in three steps:
+ - The <MergeFile>, <MergeDir> and <DefaultMergeDirs> elements are
+   replaced by the contents of the merged files, and the <DefaultAppDirs>
+   and <DefaultDirectoryDirs> elements by the directories they stand for.
+ - The submenus of the same name are merged, and the <Move> elements
+   are applied.
+ - The <Include> and <Exclude> rules are evaluated as set operations on
+   an index of the desktop files by id and by category, which is built
+   once per application directory.
+
+The resolved trees are kept in memory by getMenu(), and only resolved
+again when one of the files or directories they were built from changed.
+<Layout> and <LegacyDir> elements are ignored; entries are listed by
+desktop file id and submenus by name.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from time import time
+from xml.etree import ElementTree
+from . import xdg
+from .basedir import XDG_CONFIG_DIRS, XDG_DATA_DIRS
+from .desktopcache import readKeys, scanDesktopFiles
+
+# The desktop entry keys read by the index
+KEYS = ("Categories", "NoDisplay", "Hidden")
+
+# Elements of which only the last one of a menu applies
+LAST_WINS = {
+	"Deleted": ("deleted", True),
+	"NotDeleted": ("deleted", False),
+	"OnlyUnallocated": ("onlyUnallocated", True),
+	"NotOnlyUnallocated": ("onlyUnallocated", False),
+}
+
+# Seconds during which a resolved menu is returned without checking the
+# mtimes of its files
+CHECK_INTERVAL = 2.0
+
+
+class MenuError(Exception):
+	pass
+
+
+class Menu(object):
+	"""
+	Menu of a resolved tree
+	\a directory is the path of the .directory file of the menu, if any.
+	\a entries is the list of the (desktop file id, path) of its entries.
+	"""
+	def __init__(self, name, directory=None):
+		self.name = name
+		self.directory = directory
+		self.entries = []
+		self.submenus = []
+
+	def __repr__(self):
+		return "<Menu: %s>" % (self.name)
+
+	def submenu(self, path):
+		"""
+		Returns the submenu at \a path (eg. "Applications/Games"), or None
+		"""
+		menu = self
+		for name in path.split("/"):
+			if name:
+				menu = dict((submenu.name, submenu) for submenu in menu.submenus).get(name)
+				if menu is None:
+					return
+		return menu
+
+	def walk(self):
+		"""
+		Yields the (path, menu) of this menu and its submenus, depth first
+		"""
+		pending = [("", self)]
+		while pending:
+			path, menu = pending.pop(0)
+			yield path, menu
+			pending = [(path + submenu.name + "/", submenu) for submenu in menu.submenus] + pending
+
+
+class AppDirIndex(object):
+	"""
+	Index of the desktop files of the application directory \a path and
+	its subdirectories, by id and by category
+	The entries of \a previous, an index of the same directory, are reused
+	for the files which did not change.
+	"""
+	def __init__(self, path, previous=None):
+		self.path = path
+		# Directory or desktop file -> (mtime, size), to detect added,
+		# removed and changed files
+		self.stamps = {path: None}
+		# Desktop file id -> (path, stat key, categories, no display, hidden)
+		self.entries = {}
+		reuse = previous.entries if previous is not None else {}
+		for id, filename, st in scanDesktopFiles(path, dirs=self.stamps):
+			key = self.stamps[filename] = (st.st_mtime_ns, st.st_size)
+			entry = reuse.get(id)
+			if entry is None or entry[0] != filename or entry[1] != key:
+				values = readKeys(filename, KEYS)
+				if values is None:
+					continue
+				categories = tuple(c.strip() for c in values.get("Categories", "").split(";") if c.strip())
+				entry = (filename, key, categories, values.get("NoDisplay") == "true", values.get("Hidden") == "true")
+			self.entries[id] = entry
+
+	def __repr__(self):
+		return "AppDirIndex(%r)" % (self.path)
+
+	def isValid(self):
+		"""
+		Returns True if no desktop file was added to, removed from or
+		changed in the directory since it was indexed
+		"""
+		return _stampsValid(self.stamps)
+
+
+class Pool(object):
+	"""
+	Desktop files available to a menu, from the application directories
+	\a indexes, by increasing priority
+	"""
+	def __init__(self, indexes):
+		# Desktop file id -> (path, no display)
+		self.entries = {}
+		# Category -> set of desktop file ids
+		self.categories = {}
+		merged = {}
+		for index in indexes:
+			merged.update(index.entries)
+		for id, (path, key, categories, noDisplay, hidden) in merged.items():
+			if hidden:
+				continue
+			self.entries[id] = (path, noDisplay)
+			for category in categories:
+				self.categories.setdefault(category, set()).add(id)
+		self.all = frozenset(self.entries)
+
+	def match(self, rule):
+		"""
+		Returns the set of the ids matching the element \a rule
+		"""
+		tag = rule.tag
+		if tag == "Category":
+			return set(self.categories.get((rule.text or "").strip(), ()))
+		if tag == "Filename":
+			id = (rule.text or "").strip()
+			return set([id]) if id in self.entries else set()
+		if tag == "All":
+			return set(self.all)
+		if tag == "And":
+			ret = None
+			for child in rule:
+				ret = self.match(child) if ret is None else ret & self.match(child)
+			return ret or set()
+		if tag == "Not":
+			return set(self.all) - self.matchAny(rule)
+		# Or, Include and Exclude
+		return self.matchAny(rule)
+
+	def matchAny(self, rule):
+		ret = set()
+		for child in rule:
+			ret |= self.match(child)
+		return ret
+
+
+def _stamp(path):
+	try:
+		st = os.stat(path)
+		return (st.st_mtime_ns, st.st_size)
+	except OSError:
+		return None
+
+def _stampsValid(stamps):
+	for path, stamp in stamps.items():
+		if _stamp(path) != stamp:
+			return False
+	return True
+
+def _text(element):
+	return (element.text or "").strip()
+
+def _name(menu):
+	return _text(menu.find("Name")) if menu.find("Name") is not None else ""
+
+
+class MenuParser(object):
+	"""
+	Resolves the .menu file \a path into a tree of Menu
+	The (mtime, size) of the files and directories read are kept in
+	self.stamps.
+	"""
+	def __init__(self, path, indexes=None):
+		self.path = path
+		self.stamps = {}
+		# Application directory -> AppDirIndex, shared between the parsers
+		self.indexes = {} if indexes is None else indexes
+		self._merging = []
+
+	def _read(self, path):
+		self.stamps[path] = _stamp(path)
+		try:
+			root = ElementTree.parse(path).getroot()
+		except (EnvironmentError, ElementTree.ParseError) as e:
+			raise MenuError("Could not read %r: %s" % (path, e))
+		if root.tag != "Menu":
+			raise MenuError("The root element of %r is not <Menu>" % (path))
+		return root
+
+	def _merged(self, path):
+		"""
+		Returns the children of the root menu of \a path, expanded
+		Files already being merged are ignored, to break loops.
+		"""
+		path = os.path.realpath(path)
+		if path in self._merging or not os.path.isfile(path):
+			self.stamps.setdefault(path, _stamp(path))
+			return []
+		self._merging.append(path)
+		try:
+			root = self._read(path)
+			self._expand(root, path)
+		except MenuError:
+			return []
+		finally:
+			self._merging.pop()
+		return [child for child in root if child.tag != "Name"]
+
+	def _mergeDir(self, dir):
+		self.stamps[dir] = _stamp(dir)
+		try:
+			names = sorted(os.listdir(dir))
+		except OSError:
+			return []
+		ret = []
+		for name in names:
+			if name.endswith(".menu"):
+				ret.extend(self._merged(os.path.join(dir, name)))
+		return ret
+
+	def _parent(self, path):
+		"""
+		Returns the file of the same name as \a path in the next config dirs
+		"""
+		for i, dir in enumerate(XDG_CONFIG_DIRS):
+			dir = os.path.join(dir, "")
+			if path.startswith(dir):
+				name = path[len(dir):]
+				for parent in XDG_CONFIG_DIRS[i + 1:]:
+					if os.path.isfile(os.path.join(parent, name)):
+						return os.path.join(parent, name)
+				return
+
+	def _element(self, tag, text):
+		ret = ElementTree.Element(tag)
+		ret.text = text
+		return ret
+
+	def _expand(self, menu, path):
+		"""
+		Expands the merge and default elements of \a menu, read from \a path
+		"""
+		base = os.path.dirname(path)
+		children = []
+		for child in menu:
+			tag = child.tag
+			if tag == "MergeFile":
+				if child.get("type") == "parent":
+					parent = self._parent(path)
+					if parent:
+						children.extend(self._merged(parent))
+				elif _text(child):
+					children.extend(self._merged(os.path.join(base, _text(child))))
+			elif tag == "MergeDir":
+				children.extend(self._mergeDir(os.path.join(base, _text(child))))
+			elif tag == "DefaultMergeDirs":
+				name = os.path.basename(self.path)[:-len(".menu")] + "-merged"
+				for dir in XDG_CONFIG_DIRS[::-1]:
+					children.extend(self._mergeDir(os.path.join(dir, "menus", name)))
+			elif tag == "DefaultAppDirs":
+				children.extend(self._element("AppDir", os.path.join(dir, "applications")) for dir in XDG_DATA_DIRS[::-1])
+			elif tag == "DefaultDirectoryDirs":
+				children.extend(self._element("DirectoryDir", os.path.join(dir, "desktop-directories")) for dir in XDG_DATA_DIRS[::-1])
+			elif tag in ("AppDir", "DirectoryDir"):
+				children.append(self._element(tag, os.path.join(base, _text(child))))
+			elif tag == "Menu":
+				self._expand(child, path)
+				children.append(child)
+			else:
+				children.append(child)
+		menu[:] = children
+
+	def _consolidate(self, menu):
+		"""
+		Merges the submenus of \a menu which have the same name
+		"""
+		submenus = OrderedDict()
+		children = []
+		for child in menu:
+			if child.tag == "Menu":
+				name = _name(child)
+				if name in submenus:
+					submenus[name].extend(c for c in child if c.tag != "Name")
+					continue
+				submenus[name] = child
+			children.append(child)
+		menu[:] = children
+		for submenu in submenus.values():
+			self._consolidate(submenu)
+
+	def _find(self, menu, path, create=False):
+		"""
+		Returns the (parent, submenu) at \a path relative to \a menu
+		"""
+		parent = None
+		for name in [name for name in path.split("/") if name]:
+			submenu = None
+			for child in menu:
+				if child.tag == "Menu" and _name(child) == name:
+					submenu = child
+					break
+			if submenu is None:
+				if not create:
+					return None, None
+				submenu = ElementTree.SubElement(menu, "Menu")
+				ElementTree.SubElement(submenu, "Name").text = name
+			parent, menu = menu, submenu
+		return parent, menu
+
+	def _move(self, menu):
+		"""
+		Applies the <Move> elements of \a menu and of its submenus
+		"""
+		moved = False
+		for move in menu.findall("Move"):
+			olds = [_text(old) for old in move.findall("Old")]
+			news = [_text(new) for new in move.findall("New")]
+			for old, new in zip(olds, news):
+				parent, source = self._find(menu, old)
+				if parent is None:
+					continue
+				parent.remove(source)
+				target = self._find(menu, new, create=True)[1]
+				target.extend(c for c in source if c.tag != "Name")
+				moved = True
+		if moved:
+			self._consolidate(menu)
+		for child in menu:
+			if child.tag == "Menu":
+				self._move(child)
+
+	def _index(self, dir):
+		index = self.indexes.get(dir)
+		if index is None or not index.isValid():
+			index = self.indexes[dir] = AppDirIndex(dir, index)
+		self.stamps.update(index.stamps)
+		return index
+
+	def _resolve(self, element, appDirs, directoryDirs, pools, pending):
+		appDirs = list(appDirs)
+		directoryDirs = list(directoryDirs)
+		directories = []
+		state = {"deleted": False, "onlyUnallocated": False}
+		for child in element:
+			if child.tag == "AppDir":
+				appDirs = [dir for dir in appDirs if dir != child.text] + [child.text]
+			elif child.tag == "DirectoryDir":
+				directoryDirs = [dir for dir in directoryDirs if dir != child.text] + [child.text]
+			elif child.tag == "Directory":
+				directories.append(_text(child))
+			elif child.tag in LAST_WINS:
+				key, value = LAST_WINS[child.tag]
+				state[key] = value
+		if state["deleted"]:
+			return
+
+		menu = Menu(_name(element))
+		# The last <Directory> found in the last <DirectoryDir> wins
+		for directory in directories[::-1]:
+			for dir in directoryDirs[::-1]:
+				# Detects the .directory files added to or removed from it
+				self.stamps.setdefault(dir, _stamp(dir))
+				path = os.path.join(dir, directory)
+				if os.path.isfile(path):
+					menu.directory = path
+					break
+			if menu.directory:
+				break
+
+		key = tuple(appDirs)
+		pool = pools.get(key)
+		if pool is None:
+			pool = pools[key] = Pool([self._index(dir) for dir in appDirs])
+		ids = set()
+		for child in element:
+			if child.tag == "Include":
+				ids |= pool.match(child)
+			elif child.tag == "Exclude":
+				ids -= pool.match(child)
+		pending.append((menu, ids, pool, state["onlyUnallocated"]))
+
+		for child in element:
+			if child.tag == "Menu":
+				submenu = self._resolve(child, appDirs, directoryDirs, pools, pending)
+				if submenu is not None:
+					menu.submenus.append(submenu)
+		menu.submenus.sort(key=lambda submenu: submenu.name)
+		return menu
+
+	def parse(self):
+		"""
+		Returns the root Menu of the resolved tree
+		"""
+		root = self._read(self.path)
+		self._merging.append(os.path.realpath(self.path))
+		self._expand(root, self.path)
+		self._consolidate(root)
+		self._move(root)
+
+		pending = []
+		menu = self._resolve(root, [], [], {}, pending)
+		# The menus with <OnlyUnallocated> get the entries no other menu has
+		allocated = set()
+		for submenu, ids, pool, onlyUnallocated in pending:
+			if not onlyUnallocated:
+				allocated |= ids
+		for submenu, ids, pool, onlyUnallocated in pending:
+			if onlyUnallocated:
+				ids -= allocated
+			submenu.entries = [(id, pool.entries[id][0]) for id in sorted(ids) if not pool.entries[id][1]]
+		if menu is not None:
+			_prune(menu)
+		return menu
+
+
+def _prune(menu):
+	"""
+	Removes the empty submenus of \a menu
+	"""
+	for submenu in menu.submenus:
+		_prune(submenu)
+	menu.submenus = [submenu for submenu in menu.submenus if submenu.entries or submenu.submenus]
+
+
+class MenuCache(object):
+	"""
+	Resolved menus, by .menu file
+	A menu is resolved again when one of the files or directories it was
+	built from changed; this is checked at most every \a interval seconds.
+	"""
+	def __init__(self, interval=CHECK_INTERVAL):
+		self.interval = interval
+		self._lock = threading.Lock()
+		# Path -> (menu, stamps, time of the last check)
+		self._menus = {}
+		self._indexes = {}
+
+	def get(self, path):
+		entry = self._menus.get(path)
+		now = time()
+		if entry is not None:
+			menu, stamps, checked = entry
+			if now - checked < self.interval:
+				return menu
+			if _stampsValid(stamps):
+				self._menus[path] = (menu, stamps, now)
+				return menu
+
+		with self._lock:
+			parser = MenuParser(path, self._indexes)
+			menu = parser.parse()
+			self._menus[path] = (menu, parser.stamps, now)
+		return menu
+
+	def invalidate(self):
+		with self._lock:
+			self._menus = {}
+
+
+MENU_CACHE = MenuCache()
+
+
+def menuFile(name=None):
+	"""
+	Returns the path of the menu file \a name in the config dirs, by
+	default $XDG_MENU_PREFIX applications.menu
+	"""
+	if name is None:
+		name = os.environ.get("XDG_MENU_PREFIX", "") + "applications.menu"
+	files = xdg.getConfigFiles(os.path.join("menus", name))
+	if files:
+		return files[0]
+
+def getMenu(name=None):
+	"""
+	Returns the resolved root Menu of the menu file \a name (see menuFile()),
+	or None if there is no such file
+	"""
+	path = menuFile(name)
+	if path:
+		return MENU_CACHE.get(path)
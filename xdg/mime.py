@@ -10,58 +10,110 @@ update-mime-database command, which is provided by the freedesktop.org
 shared mime database package.
 """
 
+import codecs
+import gc
+import mmap
 import operator
 import os
 import struct
+import sys
 from fnmatch import fnmatch
 from xml.dom import minidom, XML_NAMESPACE
 from . import actions
+from . import stats
 from . import xdg
+from .mimetype import BaseMimeType, INODE, TEXT, X_CONTENT, X_SCHEME_HANDLER, DEFAULT_TEXT, DEFAULT_BINARY
 
 
 FREEDESKTOP_NS = "http://www.freedesktop.org/standards/shared-mime-info"
 
-TEXTCHARS = bytes("".join(map(chr, [7, 8, 9, 10, 12, 13, 27] + list(range(0x20, 0x100)))), "utf-8")
+TEXTCHARS = bytes(bytearray([7, 8, 9, 10, 12, 13, 27] + list(range(0x20, 0x100))))
 
-INODE = "inode"
-TEXT = "text"
-X_CONTENT = "x-content"
-X_SCHEME_HANDLER = "x-scheme-handler"
+# Amount of bytes looked at to tell text from binary
+TEXT_WINDOW = 1024
+
+def _isAscii(data):
+	try:
+		return data.isascii()
+	except AttributeError:
+		# Python < 3.7
+		return not data.translate(None, bytes(bytearray(range(0x80))))
+
+def _textCharset(data):
+	"""
+	Returns the charset of \a data if it is classified as text rather than
+	binary, otherwise returns None.
+	Text in an unknown 8-bit encoding is "unknown-8bit".
+	Only the first TEXT_WINDOW bytes of \a data are looked at.
+	"""
+	window = memoryview(data)[:TEXT_WINDOW].tobytes() if not isinstance(data, bytes) else data[:TEXT_WINDOW]
+	if window[:3] == codecs.BOM_UTF8:
+		return "utf-8"
+	# Before UTF-16, whose little-endian BOM starts the UTF-32 one
+	if window[:4] == codecs.BOM_UTF32_LE:
+		return "utf-32le"
+	if window[:4] == codecs.BOM_UTF32_BE:
+		return "utf-32be"
+	if window[:2] == codecs.BOM_UTF16_LE:
+		return "utf-16le"
+	if window[:2] == codecs.BOM_UTF16_BE:
+		return "utf-16be"
+
+	# Deleting the text bytes is done in C and only allocates for
+	# binary data; it is much faster than scanning the bytes in Python.
+	if window.translate(None, TEXTCHARS):
+		return None
+
+	if _isAscii(window):
+		return "us-ascii"
+
+	try:
+		# Not final: the window may end in the middle of a character
+		codecs.utf_8_decode(window, "strict", False)
+		return "utf-8"
+	except UnicodeDecodeError:
+		return "unknown-8bit"
 
 def _isBinaryString(bytes):
 	"""
 	Determine if a string is classified as binary rather than text.
 	Same algorithm as used in file(1)
 	"""
-	nontext = bytes.translate(None, TEXTCHARS)
-	return bool(nontext)
+	return _textCharset(bytes) is None
 
-def _readNumber(file):
+def _parseNumber(data, offset):
 	"""
-	Read a number from a binary stream
+	Parses the decimal number at \a offset in the buffer \a data
+	Returns a tuple of the number (0 if there are no digits) and the
+	offset following it.
 	"""
-	ret = bytearray()
-	c = file.read(1)
-	while c:
-		if not c.isdigit():
-			file.seek(-1, os.SEEK_CUR)
+	ret = 0
+	end = len(data)
+	while offset < end:
+		c = data[offset]
+		if not 0x30 <= c <= 0x39:
 			break
-		ret.append(ord(c))
-		c = file.read(1)
-
-	return int(ret or 0)
+		ret = ret * 10 + c - 0x30
+		offset += 1
+	return ret, offset
 
 def installPackage(package, base=os.path.join(xdg.XDG_DATA_HOME, "mime")):
 	"""
 	Helper to install \a package to \a base and update the database
 	The base argument defaults to $XDG_DATA_HOME/mime
+	The database is compiled in-process and reloaded before returning.
+	Raises xdg.mimecompiler.CompileError, and installs nothing, if
+	\a package cannot be parsed.
 	"""
 	from shutil import copyfile
+	from .mimecompiler import parsePackage
+	parsePackage(package)
 	path = os.path.join(base, "packages")
 	if not os.path.exists(path):
 		os.makedirs(path)
 	copyfile(package, os.path.join(path, os.path.basename(package)))
 	xdg.updateMimeDatabase(base)
+	reload()
 
 def unalias(mime):
 	"""
@@ -82,6 +134,11 @@ class BaseFile(object):
 	def __repr__(self):
 		return self._keys.__repr__()
 
+	def freeze(self):
+		for key, value in self._keys.items():
+			if isinstance(value, list):
+				self._keys[key] = tuple(value)
+
 	def get(self, name, default=None):
 		return self._keys.get(name, default)
 
@@ -98,10 +155,6 @@ class AliasesFile(BaseFile):
 				mime, alias = line.split(" ")
 				self._keys[mime] = alias
 
-ALIASES = AliasesFile()
-for path in xdg.getFiles("mime/aliases"):
-	ALIASES.parse(path)
-
 
 class GlobsFile(object):
 	"""
@@ -114,7 +167,17 @@ class GlobsFile(object):
 		self._matches = []
 
 	def extensionsFor(self, mime):
-		return self._extensionsFor[str(mime)]
+		return list(self._extensionsFor[str(mime)])
+
+	def freeze(self):
+		"""
+		Turns the tables into tuples, see freeze()
+		"""
+		for extension, mimes in self._extensions.items():
+			self._extensions[extension] = tuple(mimes)
+		for mime, extensions in self._extensionsFor.items():
+			self._extensionsFor[mime] = tuple(extensions)
+		self._matches = tuple((weight, mime, glob, tuple(flags)) for weight, mime, glob, flags in self._matches)
 
 	def parse(self, path):
 		with open(path, "r") as file:
@@ -152,15 +215,18 @@ class GlobsFile(object):
 				else:
 					self._matches.append((int(weight), mime, glob, flags))
 
-	def match(self, name):
+	def _match(self, name):
+		"""
+		Returns a tuple of the lookup stage which matched and the MIME type
+		"""
 		if name in self._literals:
-			return self._literals[name]
+			return "literal", self._literals[name]
 
 		_, extension = os.path.splitext(name)
 		if extension in self._extensions:
-			return max(self._extensions[extension], key=operator.itemgetter(0))[1]
+			return "extension", max(self._extensions[extension], key=operator.itemgetter(0))[1]
 		elif extension.lower() in self._extensions:
-			return max(self._extensions[extension.lower()], key=operator.itemgetter(0))[1]
+			return "extension", max(self._extensions[extension.lower()], key=operator.itemgetter(0))[1]
 
 		matches = []
 		for weight, mime, glob, flags in self._matches:
@@ -171,14 +237,19 @@ class GlobsFile(object):
 				matches.append((weight, mime, glob))
 
 		if not matches:
-			return ""
+			return "miss", ""
 
 		weight, mime, glob = max(matches, key=lambda weight_mime_glob: (weight_mime_glob[0], len(weight_mime_glob[2])))
-		return mime
+		return "fnmatch", mime
 
-GLOBS = GlobsFile()
-for path in xdg.getFiles("mime/globs2"):
-	GLOBS.parse(path)
+	def match(self, name):
+		if stats.ENABLED:
+			start = stats.clock()
+			stage, mime = self._match(name)
+			stats.STATS.time("globs.match", stats.clock() - start)
+			stats.STATS.count("globs." + stage)
+			return mime
+		return self._match(name)[1]
 
 
 class IconsFile(BaseFile):
@@ -195,104 +266,124 @@ class IconsFile(BaseFile):
 				mime, icon = line.split(":")
 				self._keys[mime] = icon
 
-ICONS = IconsFile()
-for path in xdg.getFiles("mime/generic-icons"):
-	ICONS.parse(path)
 
 class MagicRule(object):
-	def __init__(self, file):
+	def __init__(self, data, offset):
 		"""
-		Parse a section's line
+		Parse a section's line at \a offset in the memoryview \a data
 		[ indent ] ">" start-offset "=" value [ "&" mask ] [ "~" word-size ] [ "+" range-length ] "\n"
+		The value and mask are kept as slices of \a data. self.end is set
+		to the offset following the line.
 		"""
-		self.next = None
-		self.prev = None
+		# The rules nested under this one, any of which must match as well
+		self.children = []
 
-		self.nest = 0
-		c = file.read(1)
-		if not c:
+		end = len(data)
+		if offset >= end:
 			raise ValueError("Early EOF")
 
-		if c != b">":
-			file.seek(-1, os.SEEK_CUR)
-			self.nest = _readNumber(file)
-			c = file.read(1)
-			if c != b">":
-				raise ValueError("Missing '>' in section body (got %r)" % (c))
-
-		self.startOffset = _readNumber(file)
-
-		c = file.read(1)
-
-		if c != b"=":
-			raise ValueError("Missing '=' in %r section body (got %r)" % (file.name, c))
+		self.nest, offset = _parseNumber(data, offset)
+		if offset >= end or data[offset] != 0x3e: # ">"
+			raise ValueError("Missing '>' in section body at offset %i" % (offset))
 
-		self.valueLength, = struct.unpack(">H", file.read(2))
-		self.value = file.read(self.valueLength)
+		self.startOffset, offset = _parseNumber(data, offset + 1)
+		if offset >= end or data[offset] != 0x3d: # "="
+			raise ValueError("Missing '=' in section body at offset %i" % (offset))
 
-		c = file.read(1)
+		self.valueLength, = struct.unpack_from(">H", data, offset + 1)
+		offset += 3
+		self.value = data[offset:offset + self.valueLength]
+		offset += self.valueLength
+		if len(self.value) != self.valueLength:
+			raise ValueError("Early EOF")
 
-		if c == b"&":
-			self.mask = file.read(self.valueLength)
-			c = file.read(1)
+		c = data[offset] if offset < end else None
+		if c == 0x26: # "&"
+			self.mask = data[offset + 1:offset + 1 + self.valueLength]
+			offset += 1 + self.valueLength
+			c = data[offset] if offset < end else None
 		else:
 			self.mask = None
 
-		if c == b"~":
-			self.wordSize = _readNumber(file)
-			c = file.read(1)
+		if c == 0x7e: # "~"
+			self.wordSize, offset = _parseNumber(data, offset + 1)
+			c = data[offset] if offset < end else None
 		else:
 			self.wordSize = 1
 
-		if c == b"+":
-			self.rangeLength = _readNumber(file)
-			c = file.read(1)
+		if c == 0x2b: # "+"
+			self.rangeLength, offset = _parseNumber(data, offset + 1)
+			c = data[offset] if offset < end else None
 		else:
 			self.rangeLength = 1
 
-		if c != b"\n":
+		if c != 0x0a: # "\n"
 			raise ValueError("Malformed MIME magic line: %r" % (c))
+		self.end = offset + 1
+
+		if self.wordSize > 1 and sys.byteorder == "little":
+			# Host-endian values are stored big-endian
+			self.value = self._swap(self.value)
+			if self.mask is not None:
+				self.mask = self._swap(self.mask)
+
+		if self.mask is not None:
+			self._maskInt = int.from_bytes(self.mask, "big")
+			self._maskedValue = int.from_bytes(self.value, "big") & self._maskInt
+
+	def _swap(self, value):
+		ret = bytearray(value)
+		for i in range(0, len(ret) - len(ret) % self.wordSize, self.wordSize):
+			ret[i:i + self.wordSize] = ret[i:i + self.wordSize][::-1]
+		return bytes(ret)
 
 	def length(self):
 		return self.startOffset + self.valueLength + self.rangeLength
 
-	def appendRule(self, rule):
-		if self.nest < rule.nest:
-			self.next = rule
-			rule.prev = self
-
-		elif self.prev:
-			self.prev.appendRule(rule)
+	def freeze(self):
+		self.children = tuple(self.children)
+		for rule in self.children:
+			rule.freeze()
 
-	def match(self, buffer):
-		if self.match0(buffer):
-			if self.next:
-				return self.next.match(buffer)
+	def match(self, buffer, counter=None):
+		"""
+		Returns True if the rule and one of its nested rules, if any,
+		match \a buffer
+		If \a counter is a list, its first item is incremented for each
+		rule evaluated.
+		"""
+		if counter is not None:
+			counter[0] += 1
+		if not self.match0(buffer):
+			return False
+		if not self.children:
 			return True
+		for rule in self.children:
+			if rule.match(buffer, counter):
+				return True
+		return False
 
 	def match0(self, buffer):
+		start = self.startOffset
+		if self.mask is None:
+			# Search the whole range at once
+			return buffer.find(self.value, start, start + self.rangeLength - 1 + self.valueLength) != -1
+
 		l = len(buffer)
-		for o in range(self.rangeLength):
-			s = self.startOffset + o
-			e = self.valueLength + s
+		for s in range(start, start + self.rangeLength):
+			e = s + self.valueLength
 			if l < e:
 				return False
-			if self.mask:
-				test = ""
-				for i in range(self.valueLength):
-					c = buffer[s+i] & self.mask[i]
-					test += chr(c)
-			else:
-				test = buffer[s:e]
-
-			if test == self.value:
+			if int.from_bytes(buffer[s:e], "big") & self._maskInt == self._maskedValue:
 				return True
+		return False
 
 	def __repr__(self):
 		return "MagicRule(%r)" % (self.__str__())
 
 	def __str__(self):
-		return "%r>%r=[%r]%s&%s~%r+%r" % (self.nest, self.startOffset, self.valueLength, repr(self.value)[2:-1] or "", repr(self.mask)[2:-1], self.wordSize, self.rangeLength)
+		mask = repr(bytes(self.mask))[2:-1] if self.mask is not None else ""
+		return "%r>%r=[%r]%s&%s~%r+%r" % (self.nest, self.startOffset, self.valueLength, repr(bytes(self.value))[2:-1] or "", mask, self.wordSize, self.rangeLength)
 
 
 class MagicFile(object):
@@ -304,22 +395,26 @@ class MagicFile(object):
 		def __init__(self, mime):
 			self.mime = mime
 			self.topRules = []
-			self.lastRule = None
+			# The last rule of each nesting level
+			self.parents = []
 
-		def getLine(self, file):
-			rule = MagicRule(file)
+		def getLine(self, data, offset):
+			rule = MagicRule(data, offset)
 
-			if rule.nest and self.lastRule:
-				self.lastRule.appendRule(rule)
+			if rule.nest and self.parents:
+				# Nested under the last rule with a lower indent
+				del self.parents[rule.nest:]
+				self.parents[-1].children.append(rule)
+				self.parents.append(rule)
 			else:
 				self.topRules.append(rule)
-				self.lastRule = rule
+				self.parents = [rule]
 
 			return rule
 
-		def match(self, buffer):
+		def match(self, buffer, counter=None):
 			for rule in self.topRules:
-				if rule.match(buffer):
+				if rule.match(buffer, counter):
 					return self.mime
 
 		def __repr__(self):
@@ -328,70 +423,139 @@ class MagicFile(object):
 	def __init__(self):
 		self.types = {} # Indexed by priority, each entry is a list of type rules
 		self.maxLength = 0
+		# (priority, type) pairs of all the types, by decreasing priority
+		self._ordered = None
 
 	def __repr__(self):
 		return "MagicDB(<%i items>)" % (len(self.types))
 
+	def freeze(self):
+		"""
+		Turns the rule lists into tuples, see freeze()
+		The rules already reference the mapped file rather than copies.
+		"""
+		for priority, types in self.types.items():
+			for type in types:
+				type.topRules = tuple(type.topRules)
+				type.parents = []
+				for rule in type.topRules:
+					rule.freeze()
+			self.types[priority] = tuple(types)
+		self._ordered = tuple(self._order())
+
+	def _order(self):
+		return [(priority, type) for priority in sorted(self.types, reverse=True) for type in self.types[priority]]
+
 	def parse(self, fname):
+		"""
+		Parses the magic file \a fname
+		The file is mapped in memory once and the rules keep slices of it.
+		"""
 		with open(fname, "rb") as file:
-			if file.read(12) != b"MIME-Magic\0\n":
-				raise ValueError("Bad header for file %r" % (path))
-
-			while True:
-				# Parse the section head
-				# Example: "[50:text/x-diff]\n"
-				sectionHead = file.readline()
-				if not sectionHead:
-					break
-
-				if sectionHead[0] != ord(b"[") or sectionHead[-2:] != b"]\n":
-					raise ValueError("Malformed section heading: %r" % (sectionHead))
-
-				pri, tname = sectionHead[1:-2].split(b":")
-				pri = int(pri)
-				mime = str(tname, "utf-8")
-
-				if pri not in self.types:
-					self.types[pri] = []
-				ents = self.types[pri]
-
-				magictype = self.MagicType(mime)
-
-				c = file.read(1)
-				file.seek(-1, os.SEEK_CUR)
-				while c and c != b"[":
-					rule = magictype.getLine(file)
-					if rule and rule.length() > self.maxLength:
-						self.maxLength = rule.length()
-
-					c = file.read(1)
-					file.seek(-1, os.SEEK_CUR)
-
-				ents.append(magictype)
-
-				if not c:
-					break
-
-	def matchData(self, data, max=100, min=0):
-		for priority in sorted(self.types.keys(), key=lambda k: -k):
+			try:
+				raw = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+			except (ValueError, EnvironmentError):
+				# Empty files cannot be mapped
+				raw = file.read()
+		data = memoryview(raw)
+		end = len(data)
+
+		if data[:12] != b"MIME-Magic\0\n":
+			raise ValueError("Bad header for file %r" % (fname))
+
+		offset = 12
+		while offset < end:
+			# Parse the section head
+			# Example: "[50:text/x-diff]\n"
+			close = raw.find(b"]\n", offset)
+			if data[offset] != 0x5b or close == -1: # "["
+				raise ValueError("Malformed section heading at offset %i in %r" % (offset, fname))
+
+			pri, tname = data[offset + 1:close].tobytes().split(b":", 1)
+			pri = int(pri)
+			mime = str(tname, "utf-8")
+			offset = close + 2
+
+			if pri not in self.types:
+				self.types[pri] = []
+
+			magictype = self.MagicType(mime)
+			while offset < end and data[offset] != 0x5b:
+				rule = magictype.getLine(data, offset)
+				offset = rule.end
+				if rule.length() > self.maxLength:
+					self.maxLength = rule.length()
+
+			self.types[pri].append(magictype)
+		self._ordered = None
+
+	def _iterMatches(self, data, max, min, candidates=None, counter=None):
+		"""
+		Yields the (priority, mime) of the types matching \a data, by
+		decreasing priority, in a single pass over the rules
+		"""
+		ordered = self._ordered
+		if ordered is None:
+			# Computed before being stored in a single step, see freeze()
+			ordered = self._ordered = self._order()
+		seen = set()
+		for priority, type in ordered:
 			if priority > max:
 				continue
 			if priority < min:
 				break
+			if type.mime in seen or (candidates is not None and type.mime not in candidates):
+				continue
+			if type.match(data, counter):
+				seen.add(type.mime)
+				yield priority, type.mime
 
-			for type in self.types[priority]:
-				mime = type.match(data)
-				if mime:
-					return mime
+	def _matchData(self, data, max, min, counter=None):
+		for priority, mime in self._iterMatches(data, max, min, counter=counter):
+			return mime
+
+	def matchData(self, data, max=100, min=0):
+		if stats.ENABLED:
+			counter = [0]
+			start = stats.clock()
+			mime = self._matchData(data, max, min, counter)
+			stats.STATS.time("magic.match", stats.clock() - start)
+			stats.STATS.count("magic.matches")
+			stats.STATS.count("magic.rules", counter[0])
+			return mime
+		return self._matchData(data, max, min)
+
+	def matchAll(self, data, max=100, min=0, candidates=None, limit=None):
+		"""
+		Returns the (priority, mime) pairs of all the types matching \a data,
+		by decreasing priority, with priorities between \a min and \a max
+		If \a candidates is given, only the types it contains are tried.
+		The rules are traversed once, and the traversal stops after
+		\a limit matches.
+		"""
+		ret = []
+		counter = [0] if stats.ENABLED else None
+		start = stats.clock() if stats.ENABLED else None
+		for match in self._iterMatches(data, max, min, candidates, counter):
+			ret.append(match)
+			if limit is not None and len(ret) >= limit:
+				break
+		if stats.ENABLED:
+			stats.STATS.time("magic.match", stats.clock() - start)
+			stats.STATS.count("magic.matches")
+			stats.STATS.count("magic.rules", counter[0])
+		return ret
 
 	def match(self, path, max=100, min=0):
 		with open(path, "rb") as f:
 			return self.matchData(f.read(self.maxLength), max, min)
 
-
-MAGIC = MagicFile()
-for path in xdg.getFiles("mime/magic"):
-	MAGIC.parse(path)
+	def matchAllFile(self, path, max=100, min=0, candidates=None, limit=None):
+		"""
+		Same as matchAll(), for the start of the file \a path
+		"""
+		with open(path, "rb") as f:
+			return self.matchAll(f.read(self.maxLength), max, min, candidates, limit)
 
 
 class SubclassesFile(BaseFile):
@@ -410,128 +574,214 @@ class SubclassesFile(BaseFile):
 				if subclass not in self._keys[mime]:
 					self._keys[mime].append(subclass)
 
-SUBCLASSES = SubclassesFile()
-for path in xdg.getFiles("mime/subclasses"):
-	SUBCLASSES.parse(path)
 
+class AncestorsTable(object):
+	"""
+	Transitive closure of the subclass relations of the MIME types in
+	\a subclasses, through the aliases in \a aliases.
+	Includes the implicit parents defined by the spec: text/plain for all
+	text/* types and application/octet-stream for all streamable types.
+	Only the closures of the types with a subclass relation and of the
+	types in \a known are kept; those of other names are computed on each
+	lookup, so that arbitrary names cannot grow the table.
+	"""
+	# Types which are not streamable, thus not application/octet-stream
+	NON_STREAMABLE = (INODE, X_CONTENT, X_SCHEME_HANDLER)
+
+	def __init__(self, subclasses, aliases, known=()):
+		self._subclasses = subclasses
+		self._aliases = aliases
+		self._known = frozenset(known)
+		# name -> (ancestors, ordered from most to least specific, frozenset of the type and its ancestors)
+		self._closures = {}
+
+	def _parents(self, name):
+		ret = [self.unalias(parent) for parent in self._subclasses.get(name, [])]
+		type = name.partition("/")[0]
+		if type == TEXT and name != DEFAULT_TEXT:
+			ret.append(DEFAULT_TEXT)
+		if type not in self.NON_STREAMABLE and name != DEFAULT_BINARY:
+			ret.append(DEFAULT_BINARY)
+		return ret
+
+	def _closure(self, name):
+		closure = self._closures.get(name)
+		if closure is None:
+			# Depth-first post-order; reversed, it lists every type before
+			# its parents. Parents are visited in reverse so that the first
+			# declared parent comes first. Cycles are cut by the visited set.
+			order = []
+			visited = set()
+			def visit(mime):
+				visited.add(mime)
+				for parent in reversed(self._parents(mime)):
+					if parent not in visited:
+						visit(parent)
+				order.append(mime)
+			visit(name)
+			order.reverse()
+			closure = (tuple(order[1:]), frozenset(order))
+			if name in self._known or name in self._subclasses._keys:
+				# Threads racing here compute the same closure; setdefault()
+				# makes them all return the one which was stored first
+				closure = self._closures.setdefault(name, closure)
+		return closure
+
+	def ancestors(self, mime):
+		"""
+		Returns the names of all the types \a mime is a subclass of,
+		ordered from the most to the least specific
+		"""
+		return self._closure(self.unalias(mime))[0]
 
-class BaseMimeType(object):
-	FORMAT = "%s/%s"
+	def build(self, known=False):
+		"""
+		Computes the closure of every type with a subclass relation, and
+		of all the known types if \a known is True
+		"""
+		names = set(self._subclasses._keys)
+		if known:
+			names |= self._known
+		for name in sorted(names):
+			self._closure(self.unalias(name))
 
-	DEFAULT_TEXT = "text/plain"
-	DEFAULT_BINARY = "application/octet-stream"
-	INODE_MOUNTPOINT = "inode/mount-point"
-	INODE_BLOCKDEVICE = "inode/blockdevice"
-	INODE_CHARDEVICE = "inode/chardevice"
-	INODE_DIRECTORY = "inode/directory"
-	INODE_FIFO = "inode/fifo"
-	INODE_SYMLINK = "inode/symlink"
-	INODE_SOCKET = "inode/socket"
-	ZERO_SIZE = "application/x-zerosize"
+	def isInstance(self, mime, other):
+		"""
+		Returns True if \a mime is \a other or a subclass of it
+		"""
+		return self.unalias(other) in self._closure(self.unalias(mime))[1]
 
-	def __init__(self, mime):
+	def unalias(self, mime):
 		mime = str(mime)
-		if ";" in mime:
-			self._name, self._parameter = mime.split(";")
-		else:
-			self._name = mime
-		self._aliases = []
-		self._localized = {
-			"acronym": {},
-			"comment": {},
-			"expanded-acronym": {},
-		}
-
-	def __eq__(self, other):
-		if isinstance(other, BaseMimeType):
-			return self.name() == other.name()
-		return self.name() == other
-
-	def __hash__(self):
-		return self.name().__hash__()
-
-	def __str__(self):
-		return self.name()
-
-	def __repr__(self):
-		return "<MimeType: %s>" % (self.name())
+		return self._aliases.get(mime, mime)
 
-	@classmethod
-	def fromInode(cls, name):
-		import stat
-		try:
-			mode = os.stat(name).st_mode
-		except IOError:
-			return
-
-		# Test for mount point before testing for inode/directory
-		if os.path.ismount(name):
-			return cls(cls.INODE_MOUNTPOINT)
-
-		if stat.S_ISBLK(mode):
-			return cls(cls.INODE_BLOCKDEVICE)
 
-		if stat.S_ISCHR(mode):
-			return cls(cls.INODE_CHARDEVICE)
-
-		if stat.S_ISDIR(mode):
-			return cls(cls.INODE_DIRECTORY)
-
-		if stat.S_ISFIFO(mode):
-			return cls(cls.INODE_FIFO)
-
-		if stat.S_ISLNK(mode):
-			return cls(cls.INODE_SYMLINK)
+class Database(object):
+	"""
+	Snapshot of the MIME databases
+	A snapshot is not modified once loaded, except for the ancestor
+	closures which are computed on demand, and is replaced as a whole by
+	reload(). Lookups read DATABASE once, so that they see a consistent
+	set of tables even if another thread reloads meanwhile.
+	"""
+	def __init__(self, aliases, globs, icons, magic, subclasses, fingerprint=""):
+		self.aliases = aliases
+		self.globs = globs
+		self.icons = icons
+		self.magic = magic
+		self.subclasses = subclasses
+		self.ancestors = AncestorsTable(subclasses, aliases, self._names())
+		self.ancestors.build()
+		# Identifies the content-matching files, see enableContentCache()
+		self.fingerprint = fingerprint
 
-		if stat.S_ISSOCK(mode):
-			return cls(cls.INODE_SOCKET)
+	def __repr__(self):
+		return "<Database: %s>" % (self.fingerprint)
 
 	@classmethod
-	def fromScheme(cls, uri):
-		try:
-			from urllib.parse import urlparse
-		except ImportError:
-			from urlparse import urlparse
-
-		scheme = urlparse(uri).scheme
-		if not scheme:
-			raise ValueError("%r does not have a scheme or is not a valid URI" % (scheme))
-
-		return cls(cls.FORMAT % (X_SCHEME_HANDLER, scheme))
-
-	def genericIcon(self):
-		return self.genericMime().name().replace("/", "-")
-
-	def genericMime(self):
-		return self.__class__("%s/x-generic" % (self.type()))
-
-	def icon(self):
-		return self.name().replace("/", "-")
-
-	def isDefault(self):
-		name = self.name()
-		return name == DEFAULT_BINARY or name == DEFAULT_TEXT
-
-	def isInstance(self, other):
-		if self == other:
-			return True
-		for mime in self.subClassOf():
-			if mime.isInstance(other):
-				return True
-		return False
+	def load(cls):
+		"""
+		Loads a snapshot of the databases found in the XDG data dirs
+		"""
+		from .contentcache import statKey
+		databases = (
+			("mime/aliases", AliasesFile()),
+			("mime/globs2", GlobsFile()),
+			("mime/generic-icons", IconsFile()),
+			("mime/magic", MagicFile()),
+			("mime/subclasses", SubclassesFile()),
+		)
+		fingerprint = []
+		for name, db in databases:
+			for path in xdg.getFiles(name):
+				db.parse(path)
+				if name in ("mime/magic", "mime/aliases"):
+					st = os.stat(path)
+					# Same key as the content cache entries: a database
+					# rewritten within the same second changes it too
+					fingerprint.append("%s:%i:%i:%i:%i" % ((path,) + statKey(st)))
+		return cls(*[db for name, db in databases], fingerprint=";".join(fingerprint))
+
+	def _names(self):
+		"""
+		Returns the names of the types the databases refer to
+		"""
+		globs = self.globs
+		names = set(globs._literals.values()) | set(globs._extensionsFor) | set(match[1] for match in globs._matches)
+		names.update(type.mime for types in self.magic.types.values() for type in types)
+		names.update(self.aliases._keys.values())
+		names.update(parent for parents in self.subclasses._keys.values() for parent in parents)
+		names.update((DEFAULT_TEXT, DEFAULT_BINARY))
+		return names
+
+	def freeze(self):
+		for db in (self.aliases, self.globs, self.icons, self.magic, self.subclasses):
+			db.freeze()
+		self.ancestors.build(known=True)
+
+DATABASE = Database.load()
+# The tables of the current snapshot, kept for compatibility; they are
+# replaced by reload()
+ALIASES = DATABASE.aliases
+GLOBS = DATABASE.globs
+ICONS = DATABASE.icons
+MAGIC = DATABASE.magic
+SUBCLASSES = DATABASE.subclasses
+ANCESTORS = DATABASE.ancestors
+
+def reload():
+	"""
+	Loads the databases again and replaces the current snapshot
+	Lookups running in other threads finish on the snapshot they started
+	with. The memory tier of the content cache is cleared.
+	"""
+	global DATABASE, ALIASES, GLOBS, ICONS, MAGIC, SUBCLASSES, ANCESTORS
+	xdg.invalidateFiles()
+	database = Database.load()
+	DATABASE = database
+	ALIASES, GLOBS, ICONS, MAGIC, SUBCLASSES, ANCESTORS = database.aliases, database.globs, database.icons, database.magic, database.subclasses, database.ancestors
+	if CONTENT_CACHE is not None:
+		CONTENT_CACHE.reset(database.fingerprint)
+	return database
+
+def freeze():
+	"""
+	Prepares the loaded databases to be shared with forked children
+	The tables are turned into tuples, the closures of all the known types
+	are computed, and the objects are moved out of reach of the garbage
+	collector with gc.freeze() (Python 3.7+), so that the children do not
+	write to, and thus copy, the memory pages holding them.
+	Call it in the parent process right before forking.
+	"""
+	DATABASE.freeze()
+	actions.freeze()
+	gc.collect()
+	if hasattr(gc, "freeze"):
+		gc.freeze()
 
-	def name(self):
-		return self._name
 
-	def subClassOf(self):
-		# Should be implemented if the MIME type implementation supports subclassing
-		return []
+# Result cache of MimeType.fromContent(), see enableContentCache()
+CONTENT_CACHE = None
 
-	def subtype(self):
-		return self.name().split("/")[1]
+def enableContentCache(size=4096, persistent=False, path=None):
+	"""
+	Caches the results of MimeType.fromContent() by file identity, so that
+	classifying an unchanged file again costs a single stat.
+	\a size is the amount of results kept in memory. If \a persistent is
+	True, results are also stored in an sqlite database at \a path, which
+	defaults to $XDG_CACHE_HOME/python-xdg/mime-content.sqlite.
+	"""
+	global CONTENT_CACHE
+	from .contentcache import CACHE_PATH, ContentCache
+	disableContentCache()
+	CONTENT_CACHE = ContentCache(size, persistent=persistent, path=path or CACHE_PATH, fingerprint=DATABASE.fingerprint)
+	return CONTENT_CACHE
 
-	def type(self):
-		return self.name().split("/")[0]
+def disableContentCache():
+	global CONTENT_CACHE
+	if CONTENT_CACHE is not None:
+		CONTENT_CACHE.close()
+		CONTENT_CACHE = None
 
 
 class MimeType(BaseMimeType):
@@ -541,50 +791,112 @@ class MimeType(BaseMimeType):
 
 	@classmethod
 	def fromName(cls, name):
-		mime = GLOBS.match(name)
+		mime = DATABASE.globs.match(name)
 		if mime:
 			return cls(mime)
 
 	@classmethod
 	def fromContent(cls, name):
-		inode = cls.fromInode(name)
-		if inode and inode != cls.INODE_SYMLINK:
-			return cls(inode)
+		"""
+		Returns the MimeType of the file \a name from its contents
+		Text files are text/plain with a charset parameter, eg.
+		"text/plain; charset=utf-8". name() and comparisons ignore the
+		parameter; use charset() or parameter() to get it.
+		"""
+		if CONTENT_CACHE is not None:
+			return cls._fromContentCached(name)
+		if stats.ENABLED:
+			stage, mime = cls._fromContent(name)
+			if stage:
+				stats.STATS.count("content." + stage)
+			return mime
+		return cls._fromContent(name)[1]
 
+	@classmethod
+	def _fromContentCached(cls, name):
 		try:
-			size = os.stat(name).st_size
-		except IOError:
+			st = os.stat(name)
+		except OSError:
 			return
 
-		if size == 0:
-			return cls(cls.ZERO_SIZE)
+		mime = CONTENT_CACHE.get(st)
+		if mime is not None:
+			if stats.ENABLED:
+				stats.STATS.count("content.cached")
+			return cls(mime)
+
+		stage, mime = cls._fromContent(name, st)
+		if stats.ENABLED and stage:
+			stats.STATS.count("content." + stage)
+		if mime is not None:
+			parameter = mime.parameter()
+			CONTENT_CACHE.set(st, "%s; %s" % (mime.name(), parameter) if parameter else mime.name())
+		return mime
+
+	@classmethod
+	def _fromContent(cls, name, st=None):
+		"""
+		Returns a tuple of the classification stage and the MimeType
+		\a st is the stat result of \a name, if the caller has it.
+		Symlinks are classified by their target.
+		"""
+		if st is None:
+			try:
+				st = os.stat(name)
+			except OSError:
+				return None, None
+
+		inode = cls.fromInode(name, st)
+		if inode:
+			return "inode", cls(inode)
+
+		if st.st_size == 0:
+			return "zerosize", cls(cls.ZERO_SIZE)
+
+		# Read once for both the magic rules and the text heuristic
+		magic = DATABASE.magic
+		with open(name, "rb") as file:
+			data = file.read(max(magic.maxLength, TEXT_WINDOW))
 
-		match = MAGIC.match(name)
+		return cls._fromData(data, magic)
+
+	@classmethod
+	def _fromData(cls, data, magic=None):
+		"""
+		Classifies the start of a non-empty file \a data
+		Returns a tuple of the classification stage and the MimeType
+		"""
+		match = (magic or DATABASE.magic).matchData(data)
 		if match:
-			return cls(match)
+			return "magic", cls(match)
 
-		if not _isBinaryString(open(name, "rb").read(1024)):
-			return cls(cls.DEFAULT_TEXT)
+		charset = _textCharset(data)
+		if charset:
+			return "text", cls("%s; charset=%s" % (cls.DEFAULT_TEXT, charset))
 
-		return cls(cls.DEFAULT_BINARY)
+		return "binary", cls(cls.DEFAULT_BINARY)
 
 	def _localizedTag(self, tag, lang):
 		"""
 		Gets the value of a tag that can be localized through xml:lang
 		"""
+		# The value is computed before being stored in a single step, so
+		# that instances can be shared between threads
 		cache = self._localized[tag]
 		if lang not in cache:
 			files = xdg.getFiles(os.path.join("mime", self.type(), "%s.xml" % (self.subtype())))
 			if not files:
 				return
 
+			value = None
 			for file in files:
 				doc = minidom.parse(file)
 				for element in doc.documentElement.getElementsByTagNameNS(FREEDESKTOP_NS, tag):
 					nslang = element.getAttributeNS(XML_NAMESPACE, "lang") or "en"
 					if nslang == lang:
-						cache[lang] = "".join(n.nodeValue for n in element.childNodes).strip()
+						value = "".join(n.nodeValue for n in element.childNodes).strip()
 						break
+			cache.setdefault(lang, value)
 
 		return cache.get(lang)
 
@@ -597,17 +909,19 @@ class MimeType(BaseMimeType):
 			if not files:
 				return []
 
+			aliases = []
 			for file in files:
 				doc = minidom.parse(file)
 				for node in doc.documentElement.getElementsByTagName("alias"):
 					alias = node.getAttribute("type")
-					if alias not in self._aliases:
-						self._aliases.append(MimeType(alias))
+					if alias not in aliases:
+						aliases.append(MimeType(alias))
+			self._aliases = aliases
 
 		return self._aliases
 
 	def aliasOf(self):
-		mime = ALIASES.get(self.name())
+		mime = DATABASE.aliases.get(self.name())
 		if mime:
 			return MimeType(mime)
 
@@ -618,13 +932,32 @@ class MimeType(BaseMimeType):
 		return self._localizedTag("expanded-acronym", lang)
 
 	def extensions(self):
-		return GLOBS.extensionsFor(self)
+		return DATABASE.globs.extensionsFor(self)
 
 	def genericIcon(self):
-		return ICONS.get(self.name()) or super(MimeType, self).genericIcon()
+		return DATABASE.icons.get(self.name()) or super(MimeType, self).genericIcon()
+
+	def iconPath(self, size=48, scale=1, theme=None):
+		"""
+		Returns the path of the icon of the type, or else of its generic
+		icon, in the icon theme \a theme (hicolor by default)
+		See xdg.icontheme.
+		"""
+		from . import icontheme
+		return icontheme.lookupIcons([self.icon(), self.genericIcon()], size, scale, theme or icontheme.DEFAULT_THEME)
+
+	def ancestors(self):
+		"""
+		Returns all the types this type is a subclass of, directly or not,
+		ordered from the most to the least specific
+		"""
+		return [MimeType(mime) for mime in DATABASE.ancestors.ancestors(self.name())]
+
+	def isInstance(self, other):
+		return DATABASE.ancestors.isInstance(self.name(), other)
 
 	def subClassOf(self):
-		return [MimeType(mime) for mime in SUBCLASSES.get(self.name(), [])]
+		return [MimeType(mime) for mime in DATABASE.subclasses.get(self.name(), [])]
 
 	# MIME Actions
 	def applications(self, action=actions.ACTION_ALL):
@@ -680,3 +1013,99 @@ class MimeType(BaseMimeType):
 
 	def defaultApplication(self, action=actions.ACTION_ALL):
 		return actions.ACTIONS_LIST.defaultApplication(self.name(), action=action)
+
+
+# Command-line classifier
+# Usage: find -print0 | python -m xdg.mime -0 [--mode glob|magic|both] [--jobs N]
+
+def _readPaths(file, separator, size=65536):
+	"""
+	Yields the \a separator-delimited paths read from the binary \a file
+	"""
+	pending = b""
+	while True:
+		chunk = file.read(size)
+		if not chunk:
+			break
+		records = (pending + chunk).split(separator)
+		pending = records.pop()
+		for record in records:
+			if record:
+				yield os.fsdecode(record)
+	if pending:
+		yield os.fsdecode(pending)
+
+def _classifier(mode):
+	"""
+	Returns a function classifying a path with \a mode:
+	 - glob: by file name only
+	 - magic: by content only
+	 - both: by file name, falling back to the content
+	"""
+	def classify(path):
+		mime = None
+		if mode != "magic":
+			mime = MimeType.fromName(os.path.basename(path))
+		if mime is None and mode != "glob":
+			try:
+				mime = MimeType.fromContent(path)
+			except EnvironmentError:
+				mime = None
+		return path, mime
+	return classify
+
+def _classifyParallel(classify, paths, jobs):
+	"""
+	Yields classify(path) for each of \a paths, in order, from \a jobs threads
+	Only a bounded window of paths is read ahead.
+	"""
+	from collections import deque
+	from concurrent.futures import ThreadPoolExecutor
+
+	window = jobs * 64
+	with ThreadPoolExecutor(jobs) as executor:
+		pending = deque()
+		for path in paths:
+			pending.append(executor.submit(classify, path))
+			if len(pending) >= window:
+				yield pending.popleft().result()
+		while pending:
+			yield pending.popleft().result()
+
+def main(argv=None, stdin=None, stdout=None):
+	"""
+	Classifies the paths read from \a stdin and writes path<TAB>mime lines
+	to \a stdout. Paths without a result get an empty MIME type.
+	"""
+	import argparse
+	import sys
+
+	parser = argparse.ArgumentParser(prog="python -m xdg.mime", description="Classify the paths read from stdin by MIME type")
+	parser.add_argument("-0", "--null", action="store_true", help="paths are NUL-delimited, and so is the output")
+	parser.add_argument("-m", "--mode", choices=("glob", "magic", "both"), default="both", help="match by file name, content, or name then content (default: both)")
+	parser.add_argument("-j", "--jobs", type=int, default=1, help="number of threads reading file contents (default: 1)")
+	args = parser.parse_args(argv)
+
+	stdin = stdin or sys.stdin.buffer
+	stdout = stdout or sys.stdout.buffer
+	separator = b"\0" if args.null else b"\n"
+
+	classify = _classifier(args.mode)
+	paths = _readPaths(stdin, separator)
+	if args.jobs > 1 and args.mode != "glob":
+		results = _classifyParallel(classify, paths, args.jobs)
+	else:
+		results = map(classify, paths)
+
+	buffer = []
+	for path, mime in results:
+		buffer.append(os.fsencode(path) + b"\t" + (str(mime).encode("ascii") if mime else b"") + separator)
+		if len(buffer) >= 1024:
+			stdout.write(b"".join(buffer))
+			buffer = []
+	stdout.write(b"".join(buffer))
+	stdout.flush()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,691 @@
+"""
+Compiler of the shared MIME database
+
+Compiles the <MIME>/packages/*.xml source files into the files read by
+the Shared MIME Info implementations, in place of update-mime-database:
+globs2, globs, magic, aliases, subclasses, icons, generic-icons, types,
+XMLnamespaces, mime.cache and a <media>/<subtype>.xml file per type.
+
+Compilation is incremental: the parsed packages are kept in a manifest
+in the database directory, and only the packages whose mtime or size
+changed are parsed again. Each output file is only written if its
+content changed, to a temporary file which then replaces it, so that
+readers never see a partially written file. mime.cache is written last.
+"""
+
+import hashlib
+import json
+import os
+import struct
+from xml.etree import ElementTree
+from .utils import writeAtomic
+
+FREEDESKTOP_NS = "http://www.freedesktop.org/standards/shared-mime-info"
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+MANIFEST = ".python-xdg-manifest.json"
+MANIFEST_VERSION = 1
+
+# Packages are compiled in name order, with Override.xml last
+OVERRIDE_PACKAGE = "Override.xml"
+
+DEFAULT_WEIGHT = 50
+DEFAULT_PRIORITY = 50
+
+GENERATED_HEADER = "# This file was automatically generated by the\n# python-xdg MIME database compiler. DO NOT EDIT!\n"
+GENERATED_COMMENT = "Created automatically by the python-xdg MIME database compiler. DO NOT EDIT!"
+
+# match type -> (size in bytes, struct format, word size)
+MATCH_TYPES = {
+	"byte": (1, ">B", 1),
+	"big16": (2, ">H", 1),
+	"big32": (4, ">I", 1),
+	"little16": (2, "<H", 1),
+	"little32": (4, "<I", 1),
+	# Host-endian values are stored big-endian, see MagicRule
+	"host16": (2, ">H", 2),
+	"host32": (4, ">I", 4),
+}
+
+# Elements not copied to the per-type xml files
+COMPILED_ONLY = ("magic", "treemagic", "root-XML", "glob-deleteall", "magic-deleteall")
+
+# Attribute defaults of the package DTD, which expat fills in; they are
+# left out of the per-type xml files
+DTD_DEFAULTS = {
+	("glob", "weight"): "50",
+}
+
+CACHE_MAJOR_VERSION = 1
+CACHE_MINOR_VERSION = 2
+
+
+class CompileError(Exception):
+	pass
+
+
+def _localName(tag):
+	return tag.rpartition("}")[2]
+
+def _parseInt(value):
+	"""
+	Parses \a value like strtoul() with a base of 0
+	"""
+	value = value.strip()
+	negative = value.startswith("-")
+	digits = value.lstrip("+-")
+	if digits[:2].lower() == "0x":
+		ret = int(digits[2:], 16)
+	elif len(digits) > 1 and digits[0] == "0":
+		ret = int(digits[1:], 8)
+	else:
+		ret = int(digits)
+	return -ret if negative else ret
+
+def _parseString(value):
+	"""
+	Parses the C escapes of the string match \a value
+	"""
+	ret = bytearray()
+	escapes = {"n": 0x0a, "r": 0x0d, "t": 0x09, "b": 0x08, "f": 0x0c, "v": 0x0b, "a": 0x07}
+	i = 0
+	while i < len(value):
+		c = value[i]
+		i += 1
+		if c != "\\" or i == len(value):
+			ret += c.encode("utf-8")
+			continue
+
+		c = value[i]
+		i += 1
+		if c == "x":
+			end = i
+			while end < len(value) and end < i + 2 and value[end] in "0123456789abcdefABCDEF":
+				end += 1
+			if end == i:
+				raise CompileError("Missing hex digits in %r" % (value))
+			ret.append(int(value[i:end], 16))
+			i = end
+		elif c in "01234567":
+			end = i
+			while end < len(value) and end < i + 2 and value[end] in "01234567":
+				end += 1
+			ret.append(int(value[i - 1:end], 8) & 0xff)
+			i = end
+		elif c in escapes:
+			ret.append(escapes[c])
+		else:
+			ret += c.encode("utf-8")
+	return bytes(ret)
+
+def _parseMatch(element):
+	"""
+	Returns the matchlet of the <match> \a element, as a list of
+	[start, range length, word size, value hex, mask hex or None, children]
+	"""
+	type = element.get("type")
+	value = element.get("value")
+	offset = element.get("offset")
+	if type is None or value is None or offset is None:
+		raise CompileError("Missing type, value or offset in <match>")
+
+	mask = element.get("mask")
+	if type == "string":
+		data = _parseString(value)
+		wordSize = 1
+		if mask is not None:
+			if mask[:2].lower() != "0x":
+				raise CompileError("String masks must be in hexadecimal: %r" % (mask))
+			mask = bytes(bytearray.fromhex(mask[2:].rjust(len(data) * 2, "0")))[-len(data):]
+	elif type in MATCH_TYPES:
+		size, format, wordSize = MATCH_TYPES[type]
+		limit = 1 << (size * 8)
+		data = struct.pack(format, _parseInt(value) % limit)
+		if mask is not None:
+			mask = struct.pack(format, _parseInt(mask) % limit)
+	else:
+		raise CompileError("Unknown match type %r" % (type))
+
+	if not data:
+		raise CompileError("Empty match value")
+
+	start, _, end = offset.partition(":")
+	start = int(start)
+	rangeLength = int(end) - start + 1 if end else 1
+	if rangeLength < 1:
+		raise CompileError("Bad match offset %r" % (offset))
+
+	children = [_parseMatch(child) for child in element if _localName(child.tag) == "match"]
+	return [start, rangeLength, wordSize, _hex(data), _hex(mask) if mask is not None else None, children]
+
+def _hex(data):
+	return "".join("%02x" % (c) for c in bytearray(data))
+
+def _unhex(data):
+	return bytes(bytearray.fromhex(data))
+
+def _escape(text, quote=False):
+	text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+	if quote:
+		text = text.replace('"', "&quot;")
+	return text
+
+def _serialize(element):
+	"""
+	Serializes a leaf \a element of a <mime-type> for the per-type xml files
+	"""
+	tag = _localName(element.tag)
+	attributes = ""
+	for key, value in element.attrib.items():
+		if key == XML_LANG:
+			key = "xml:lang"
+		elif DTD_DEFAULTS.get((tag, key)) == value:
+			continue
+		attributes += ' %s="%s"' % (_localName(key), _escape(value, True))
+	if element.text:
+		return "<%s%s>%s</%s>" % (tag, attributes, _escape(element.text), tag)
+	return "<%s%s/>" % (tag, attributes)
+
+def _parseType(element):
+	"""
+	Returns the compiled record of the <mime-type> \a element
+	"""
+	record = {
+		"globs": [],
+		"globDeleteAll": False,
+		"magic": [],
+		"magicDeleteAll": False,
+		"aliases": [],
+		"parents": [],
+		"icon": None,
+		"genericIcon": None,
+		"namespaces": [],
+		"xml": [],
+	}
+	for child in element:
+		tag = _localName(child.tag)
+		if tag == "glob":
+			pattern = child.get("pattern")
+			if not pattern:
+				raise CompileError("Missing pattern in <glob>")
+			weight = int(child.get("weight", DEFAULT_WEIGHT))
+			cs = child.get("case-sensitive") == "true"
+			# Case-insensitive patterns are matched against lowercased names
+			record["globs"].append([weight, pattern if cs else pattern.lower(), cs])
+		elif tag == "glob-deleteall":
+			record["globDeleteAll"] = True
+			record["globs"] = []
+		elif tag == "magic":
+			priority = int(child.get("priority", DEFAULT_PRIORITY))
+			matches = [_parseMatch(match) for match in child if _localName(match.tag) == "match"]
+			if matches:
+				record["magic"].append([priority, matches])
+		elif tag == "magic-deleteall":
+			record["magicDeleteAll"] = True
+			record["magic"] = []
+		elif tag == "alias":
+			record["aliases"].append(child.get("type"))
+		elif tag == "sub-class-of":
+			record["parents"].append(child.get("type"))
+		elif tag == "icon":
+			record["icon"] = child.get("name")
+		elif tag == "generic-icon":
+			record["genericIcon"] = child.get("name")
+		elif tag == "root-XML":
+			record["namespaces"].append([child.get("namespaceURI"), child.get("localName")])
+
+		if tag not in COMPILED_ONLY:
+			record["xml"].append(_serialize(child))
+	return record
+
+def parsePackage(path):
+	"""
+	Parses the package \a path with a streaming parser
+	Returns a list of (MIME type, record) pairs, in the package order.
+	"""
+	ret = []
+	try:
+		for event, element in ElementTree.iterparse(path, events=("end", )):
+			if _localName(element.tag) != "mime-type":
+				continue
+			mime = element.get("type")
+			if not mime or mime.count("/") != 1 or mime.startswith("/") or mime.endswith("/") or ".." in mime:
+				raise CompileError("Invalid MIME type %r" % (mime))
+			ret.append([mime, _parseType(element)])
+			element.clear()
+	except (ElementTree.ParseError, ValueError) as e:
+		raise CompileError(str(e))
+	return ret
+
+
+class Database(object):
+	"""
+	Merged content of all the packages, by MIME type
+	"""
+	def __init__(self):
+		self.types = {}
+
+	def add(self, mime, record):
+		current = self.types.get(mime)
+		if current is None:
+			current = self.types[mime] = {
+				"globs": [],
+				"magic": [],
+				"aliases": [],
+				"parents": [],
+				"icon": None,
+				"genericIcon": None,
+				"namespaces": [],
+				"xml": [],
+			}
+
+		if record["globDeleteAll"]:
+			current["globs"] = []
+		if record["magicDeleteAll"]:
+			current["magic"] = []
+		for key in ("globs", "magic", "namespaces", "xml"):
+			current[key] += record[key]
+		for key in ("aliases", "parents"):
+			for value in record[key]:
+				if value not in current[key]:
+					current[key].append(value)
+		for key in ("icon", "genericIcon"):
+			if record[key]:
+				current[key] = record[key]
+
+	def aliases(self):
+		return sorted((alias, mime) for mime, record in self.types.items() for alias in record["aliases"])
+
+	def globs(self):
+		"""
+		Returns the (weight, mime, pattern, case-sensitive) globs, from
+		highest to lowest weight
+		"""
+		ret = [(weight, mime, pattern, cs) for mime, record in self.types.items() for weight, pattern, cs in record["globs"]]
+		ret.sort(key=lambda glob: (-glob[0], glob[1], glob[2]))
+		return ret
+
+	def icons(self, key):
+		return sorted((mime, record[key]) for mime, record in self.types.items() if record[key])
+
+	def magic(self):
+		"""
+		Returns the (priority, mime, matchlets) sections, from highest to
+		lowest priority
+		"""
+		ret = [(priority, mime, matches) for mime, record in self.types.items() for priority, matches in record["magic"]]
+		ret.sort(key=lambda section: (-section[0], section[1]))
+		return ret
+
+	def namespaces(self):
+		return sorted((uri, local, mime) for mime, record in self.types.items() for uri, local in record["namespaces"])
+
+	def parents(self):
+		return sorted((mime, record["parents"]) for mime, record in self.types.items() if record["parents"])
+
+
+def _matchletLength(matchlet):
+	start, rangeLength, wordSize, value, mask, children = matchlet
+	ret = start + rangeLength + len(value) // 2
+	for child in children:
+		ret = max(ret, _matchletLength(child))
+	return ret
+
+def _writeMatchlets(ret, matchlets, indent=0):
+	for start, rangeLength, wordSize, value, mask, children in matchlets:
+		value = _unhex(value)
+		line = (str(indent) if indent else "") + ">%i=" % (start)
+		ret.append(line.encode("ascii") + struct.pack(">H", len(value)) + value)
+		if mask is not None:
+			ret.append(b"&" + _unhex(mask))
+		if wordSize != 1:
+			ret.append(("~%i" % (wordSize)).encode("ascii"))
+		if rangeLength != 1:
+			ret.append(("+%i" % (rangeLength)).encode("ascii"))
+		ret.append(b"\n")
+		_writeMatchlets(ret, children, indent + 1)
+
+def writeMagic(db):
+	ret = [b"MIME-Magic\0\n"]
+	for priority, mime, matchlets in db.magic():
+		ret.append(("[%i:%s]\n" % (priority, mime)).encode("utf-8"))
+		_writeMatchlets(ret, matchlets)
+	return b"".join(ret)
+
+def writeGlobs2(db):
+	ret = [GENERATED_HEADER]
+	for weight, mime, pattern, cs in db.globs():
+		if cs:
+			ret.append("%i:%s:%s:cs\n" % (weight, mime, pattern))
+		# Like update-mime-database, case-sensitive globs are also listed
+		# without the flag
+		ret.append("%i:%s:%s\n" % (weight, mime, pattern))
+	return "".join(ret).encode("utf-8")
+
+def writeGlobs(db):
+	ret = [GENERATED_HEADER]
+	for weight, mime, pattern, cs in db.globs():
+		ret.append("%s:%s\n" % (mime, pattern))
+	return "".join(ret).encode("utf-8")
+
+def writeLines(lines):
+	return "".join(line + "\n" for line in lines).encode("utf-8")
+
+def writeTypeXml(mime, record):
+	ret = [
+		'<?xml version="1.0" encoding="utf-8"?>\n',
+		'<mime-type xmlns="%s" type="%s">\n' % (FREEDESKTOP_NS, _escape(mime, True)),
+		"  <!--%s-->\n" % (GENERATED_COMMENT),
+	]
+	for element in record["xml"]:
+		ret.append("  %s\n" % (element))
+	ret.append("</mime-type>\n")
+	return "".join(ret).encode("utf-8")
+
+
+class CacheWriter(object):
+	"""
+	Writer of the binary mime.cache file
+	All the strings are stored first, after the header, so that their
+	offsets are known when the tables are written.
+	"""
+	HEADER = struct.Struct(">HHIIIIIIIII")
+
+	def __init__(self, db):
+		self.db = db
+		self.data = bytearray(self.HEADER.size)
+		self.strings = {}
+
+	def string(self, value):
+		offset = self.strings.get(value)
+		if offset is None:
+			offset = self.strings[value] = len(self.data)
+			self.data += value.encode("utf-8") + b"\0"
+			self.align()
+		return offset
+
+	def bytes(self, value):
+		offset = len(self.data)
+		self.data += value
+		self.align()
+		return offset
+
+	def align(self):
+		self.data += b"\0" * (-len(self.data) % 4)
+
+	def card32(self, *values):
+		offset = len(self.data)
+		self.data += struct.pack(">%iI" % (len(values)), *values)
+		return offset
+
+	def reserve(self, count):
+		offset = len(self.data)
+		self.data += b"\0" * (count * 4)
+		return offset
+
+	def patch(self, offset, *values):
+		struct.pack_into(">%iI" % (len(values)), self.data, offset, *values)
+
+	def write(self):
+		db = self.db
+		globs = db.globs()
+		literals = []
+		suffixes = []
+		others = []
+		seen = set()
+		for weight, mime, pattern, cs in globs:
+			flags = weight | (0x100 if cs else 0)
+			if (pattern, mime, flags) in seen:
+				continue
+			seen.add((pattern, mime, flags))
+			if not any(c in pattern for c in "*?["):
+				literals.append((pattern, mime, flags))
+			elif pattern.startswith("*") and not any(c in pattern[1:] for c in "*?["):
+				suffixes.append((pattern[1:], mime, flags))
+			else:
+				others.append((pattern, mime, flags))
+
+		# Strings first, so that every table can reference them
+		for mime in sorted(db.types):
+			self.string(mime)
+		for alias, mime in db.aliases():
+			self.string(alias)
+		for pattern, mime, flags in literals + others:
+			self.string(pattern)
+		for uri, local, mime in db.namespaces():
+			self.string(uri)
+			self.string(local)
+		for key in ("icon", "genericIcon"):
+			for mime, icon in db.icons(key):
+				self.string(icon)
+		for parent in set(parent for mime, parents in db.parents() for parent in parents):
+			self.string(parent)
+
+		offsets = []
+		offsets.append(self.writePairs(db.aliases()))
+		offsets.append(self.writeParents(db.parents()))
+		offsets.append(self.writeGlobList(sorted(literals)))
+		offsets.append(self.writeSuffixTree(suffixes))
+		offsets.append(self.writeGlobList(others))
+		offsets.append(self.writeMagic(db.magic()))
+		offsets.append(self.writeNamespaces(db.namespaces()))
+		offsets.append(self.writePairs(db.icons("icon")))
+		offsets.append(self.writePairs(db.icons("genericIcon")))
+		self.HEADER.pack_into(self.data, 0, CACHE_MAJOR_VERSION, CACHE_MINOR_VERSION, *offsets)
+		return bytes(self.data)
+
+	def writePairs(self, pairs):
+		offset = self.card32(len(pairs))
+		for key, value in pairs:
+			self.card32(self.string(key), self.string(value))
+		return offset
+
+	def writeParents(self, parents):
+		offset = self.card32(len(parents))
+		table = self.reserve(len(parents) * 2)
+		for i, (mime, values) in enumerate(parents):
+			list = self.card32(len(values), *[self.string(parent) for parent in values])
+			self.patch(table + i * 8, self.string(mime), list)
+		return offset
+
+	def writeGlobList(self, globs):
+		offset = self.card32(len(globs))
+		for pattern, mime, flags in globs:
+			self.card32(self.string(pattern), self.string(mime), flags)
+		return offset
+
+	def writeSuffixTree(self, suffixes):
+		# Trie of the reversed suffixes; leaves are stored under the key 0
+		root = {}
+		for suffix, mime, flags in suffixes:
+			node = root
+			for c in reversed(suffix):
+				node = node.setdefault(ord(c), {})
+			node.setdefault(0, []).append((mime, flags))
+
+		offset = self.reserve(2)
+		first = self.writeNodes(root)
+		self.patch(offset, self.nodeCount(root), first)
+		return offset
+
+	def nodeCount(self, node):
+		return sum(len(value) if key == 0 else 1 for key, value in node.items())
+
+	def writeNodes(self, node):
+		"""
+		Writes the children of \a node contiguously, then their own children
+		"""
+		offset = self.reserve(self.nodeCount(node) * 3)
+		position = offset
+		for key in sorted(node):
+			if key == 0:
+				for mime, flags in node[0]:
+					self.patch(position, 0, self.string(mime), flags)
+					position += 12
+				continue
+			child = node[key]
+			first = self.writeNodes(child)
+			self.patch(position, key, self.nodeCount(child), first)
+			position += 12
+		return offset
+
+	def writeMagic(self, sections):
+		offset = self.reserve(3)
+		maxExtent = 0
+		for priority, mime, matchlets in sections:
+			for matchlet in matchlets:
+				maxExtent = max(maxExtent, _matchletLength(matchlet))
+
+		table = self.reserve(len(sections) * 4)
+		for i, (priority, mime, matchlets) in enumerate(sections):
+			first = self.writeMatchlets(matchlets)
+			self.patch(table + i * 16, priority, self.string(mime), len(matchlets), first)
+		self.patch(offset, len(sections), maxExtent, table)
+		return offset
+
+	def writeMatchlets(self, matchlets):
+		offset = self.reserve(len(matchlets) * 8)
+		for i, (start, rangeLength, wordSize, value, mask, children) in enumerate(matchlets):
+			value = _unhex(value)
+			valueOffset = self.bytes(value)
+			maskOffset = self.bytes(_unhex(mask)) if mask is not None else 0
+			first = self.writeMatchlets(children) if children else 0
+			self.patch(offset + i * 32, start, rangeLength, wordSize, len(value), valueOffset, maskOffset, len(children), first)
+		return offset
+
+	def writeNamespaces(self, namespaces):
+		offset = self.card32(len(namespaces))
+		for uri, local, mime in namespaces:
+			self.card32(self.string(uri), self.string(local), self.string(mime))
+		return offset
+
+
+def _digest(data):
+	return hashlib.sha1(data).hexdigest()
+
+class Compiler(object):
+	"""
+	Incremental compiler of the MIME database in \a base
+	Packages which fail to parse are skipped, and listed in self.errors
+	as (path, message) pairs.
+	"""
+	def __init__(self, base):
+		self.base = base
+		self.packages = os.path.join(base, "packages")
+		self.manifestPath = os.path.join(base, MANIFEST)
+		self.errors = []
+
+	def _loadManifest(self):
+		try:
+			with open(self.manifestPath, "r") as file:
+				manifest = json.load(file)
+		except (IOError, OSError, ValueError):
+			return {"packages": {}, "outputs": {}}
+		if manifest.get("version") != MANIFEST_VERSION:
+			return {"packages": {}, "outputs": {}}
+		return manifest
+
+	def _scan(self):
+		"""
+		Returns the (name, path, stat) of the packages, in compile order
+		"""
+		ret = []
+		try:
+			entries = list(os.scandir(self.packages))
+		except OSError:
+			return ret
+		for entry in entries:
+			if entry.name.endswith(".xml") and not entry.name.startswith(".") and entry.is_file():
+				ret.append((entry.name, entry.path, entry.stat()))
+		ret.sort(key=lambda package: (package[0] == OVERRIDE_PACKAGE, package[0]))
+		return ret
+
+	def outputs(self, db):
+		"""
+		Returns the output files of \a db as a dict of relative path -> bytes
+		"""
+		ret = {
+			"globs2": writeGlobs2(db),
+			"globs": writeGlobs(db),
+			"magic": writeMagic(db),
+			"aliases": writeLines("%s %s" % (alias, mime) for alias, mime in db.aliases()),
+			"subclasses": writeLines("%s %s" % (mime, parent) for mime, parents in db.parents() for parent in parents),
+			"icons": writeLines("%s:%s" % (mime, icon) for mime, icon in db.icons("icon")),
+			"generic-icons": writeLines("%s:%s" % (mime, icon) for mime, icon in db.icons("genericIcon")),
+			"types": writeLines(sorted(db.types)),
+			"XMLnamespaces": writeLines("%s %s %s" % namespace for namespace in db.namespaces()),
+		}
+		for mime, record in db.types.items():
+			# update-mime-database names the files in lowercase
+			ret[mime.lower() + ".xml"] = writeTypeXml(mime, record)
+		return ret
+
+	def compile(self, force=False):
+		"""
+		Compiles the packages, parsing again only those which changed
+		since the last run, or all of them if \a force is True.
+		Returns the list of the output files which were written.
+		"""
+		manifest = self._loadManifest()
+		previous = manifest["packages"]
+		packages = {}
+		db = Database()
+		self.errors = []
+		for name, path, st in self._scan():
+			key = [st.st_mtime_ns, st.st_size]
+			entry = previous.get(name)
+			if force or entry is None or entry["key"] != key:
+				try:
+					entry = {"key": key, "types": parsePackage(path)}
+				except CompileError as e:
+					self.errors.append((path, str(e)))
+					continue
+			packages[name] = entry
+			for mime, record in entry["types"]:
+				db.add(mime, record)
+
+		outputs = self.outputs(db)
+		digests = manifest["outputs"]
+		written = []
+		for name in sorted(outputs):
+			data = outputs[name]
+			digest = _digest(data)
+			path = os.path.join(self.base, name)
+			if force or digests.get(name) != digest or not os.path.exists(path):
+				writeAtomic(path, data)
+				written.append(name)
+			digests[name] = digest
+
+		# Types which disappeared
+		for name in list(digests):
+			if name not in outputs and name != "mime.cache":
+				try:
+					os.remove(os.path.join(self.base, name))
+				except OSError:
+					pass
+				del digests[name]
+
+		cache = CacheWriter(db).write()
+		digest = _digest(cache)
+		if written or force or digests.get("mime.cache") != digest or not os.path.exists(os.path.join(self.base, "mime.cache")):
+			writeAtomic(os.path.join(self.base, "mime.cache"), cache)
+			written.append("mime.cache")
+		digests["mime.cache"] = digest
+
+		if written or packages != previous:
+			manifest = {"version": MANIFEST_VERSION, "packages": packages, "outputs": digests}
+			writeAtomic(self.manifestPath, json.dumps(manifest, sort_keys=True).encode("utf-8"))
+		return written
+
+
+def compileDatabase(base, force=False, strict=False):
+	"""
+	Compiles the MIME database in \a base, see Compiler.compile()
+	If \a strict is True, raises CompileError listing the packages which
+	failed to parse, once the database of the others is written.
+	"""
+	compiler = Compiler(base)
+	ret = compiler.compile(force)
+	if strict and compiler.errors:
+		raise CompileError("\n".join("%s: %s" % error for error in compiler.errors))
+	return ret
@@ -0,0 +1,595 @@
+"""
+Local MIME classification daemon
+
+The server loads the MIME and actions databases once and answers queries
+over a Unix domain socket, so that worker processes can classify files
+without loading the databases themselves:
+
+	python -m xdg.mimeserver [--socket PATH]
+
+Workers use RemoteMimeType, which has the query API of xdg.mime.MimeType.
+Importing this module does not import xdg.mime, only xdg.mimetype.
+
+Protocol: every request is a header packed as REQUEST (request id,
+opcode, payload length) followed by the payload. Every response is a
+header packed as RESPONSE (request id, status, payload length) followed
+by the payload. Strings are utf-8, paths use the filesystem encoding.
+Requests may be pipelined: the server answers the requests of a
+connection in order, and replies to all the requests it has read in one
+write.
+
+	OP_FROM_NAME        name                -> MIME type
+	OP_FROM_CONTENT     path                -> MIME type
+	OP_FROM_FD          (fd in SCM_RIGHTS)  -> MIME type
+	OP_BEST_APP         action byte + mime  -> desktop file id
+	OP_IS_INSTANCE      mime NUL other      -> "\1" or "\0"
+	OP_COMMENT          mime NUL lang       -> comment
+	OP_GENERIC_ICON     mime                -> icon name
+	OP_ALIASES          mime                -> MIME types, NUL-separated
+	OP_EXTENSIONS       mime                -> extensions, NUL-separated
+	OP_ACRONYM          mime NUL lang       -> acronym
+	OP_EXPANDED_ACRONYM mime NUL lang       -> expanded acronym
+	OP_ALIAS_OF         mime                -> MIME type
+	OP_SUBCLASS_OF      mime                -> MIME types, NUL-separated
+	OP_ANCESTORS        mime                -> MIME types, NUL-separated
+	OP_APPLICATIONS     action byte + mime  -> desktop file ids, NUL-separated
+	OP_DEFAULT_APP      action byte + mime  -> desktop file id
+"""
+
+import array
+import os
+import socket
+import stat
+import struct
+import tempfile
+import threading
+from .basedir import XDG_RUNTIME_DIR
+from .mimetype import BaseMimeType
+
+try:
+	import socketserver
+except ImportError:
+	import SocketServer as socketserver
+
+# Without XDG_RUNTIME_DIR, falls back to a private directory in the
+# temporary directory, which is checked before use as anyone can create it
+RUNTIME_DIR = XDG_RUNTIME_DIR or os.path.join(tempfile.gettempdir(), "python-xdg-%i" % (os.getuid()))
+SOCKET_PATH = os.path.join(RUNTIME_DIR, "python-xdg", "mime.sock")
+
+REQUEST = struct.Struct(">IBI")
+RESPONSE = struct.Struct(">IBI")
+
+OP_FROM_NAME = 1
+OP_FROM_CONTENT = 2
+OP_FROM_FD = 3
+OP_BEST_APP = 4
+OP_IS_INSTANCE = 5
+OP_COMMENT = 6
+OP_GENERIC_ICON = 7
+OP_ALIASES = 8
+OP_EXTENSIONS = 9
+OP_ACRONYM = 10
+OP_EXPANDED_ACRONYM = 11
+OP_ALIAS_OF = 12
+OP_SUBCLASS_OF = 13
+OP_ANCESTORS = 14
+OP_APPLICATIONS = 15
+OP_DEFAULT_APP = 16
+
+STATUS_OK = 0
+STATUS_NONE = 1
+STATUS_ERROR = 2
+
+# Same as xdg.actions.ACTION_ALL, which cannot be imported without loading
+# the databases
+ACTION_ALL = 0x07
+
+# Amount of requests in flight in Client.pipeline(), so that neither side
+# blocks on a full socket buffer
+PIPELINE_WINDOW = 1024
+
+# Largest accepted payload, to bound the memory used by a bad client
+MAX_PAYLOAD = 1 << 16
+
+
+class ProtocolError(Exception):
+	pass
+
+
+class UnsafePathError(Exception):
+	"""
+	The socket or one of its directories could be tampered with by
+	another user
+	"""
+	pass
+
+
+def _privateDirs(path):
+	"""
+	Returns the directories of \a path which must be private to the user:
+	its parent, and its ancestors up to RUNTIME_DIR if it is inside it
+	"""
+	dir = os.path.dirname(os.path.abspath(path))
+	ret = [dir]
+	runtime = os.path.abspath(RUNTIME_DIR)
+	if dir.startswith(os.path.join(runtime, "")):
+		while dir != runtime:
+			dir = os.path.dirname(dir)
+			ret.append(dir)
+	return ret[::-1]
+
+def _checkDirectory(dir):
+	"""
+	Raises UnsafePathError unless \a dir is a directory (not a symlink)
+	owned by the user and inaccessible to the other users
+	"""
+	st = os.lstat(dir)
+	if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+		raise UnsafePathError("%r must be a directory owned by the user with mode 0700" % (dir))
+
+def _checkSocket(path):
+	"""
+	Raises UnsafePathError unless \a path is a socket owned by the user,
+	in private directories
+	"""
+	for dir in _privateDirs(path):
+		_checkDirectory(dir)
+	st = os.lstat(path)
+	if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+		raise UnsafePathError("%r is not a socket owned by the user" % (path))
+
+
+def _fromFd(fd):
+	"""
+	Classifies the open file \a fd by content
+	"""
+	from .mime import DATABASE, TEXT_WINDOW, MimeType
+	mode = os.fstat(fd).st_mode
+	if not stat.S_ISREG(mode):
+		return MimeType.fromMode(mode)
+
+	magic = DATABASE.magic
+	data = os.pread(fd, max(magic.maxLength, TEXT_WINDOW), 0)
+	if not data:
+		return MimeType(MimeType.ZERO_SIZE)
+	return MimeType._fromData(data, magic)[1]
+
+def _joinList(values):
+	return "\0".join(values).encode("utf-8")
+
+def _splitList(payload):
+	return payload.decode("utf-8").split("\0") if payload else []
+
+def _mimeString(mime):
+	if mime is None:
+		return
+	parameter = mime.parameter()
+	return "%s; %s" % (mime.name(), parameter) if parameter else mime.name()
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+	def handle(self):
+		from .mime import MimeType
+		self.mimeType = MimeType
+
+		buffer = b""
+		fds = []
+		try:
+			while True:
+				data, ancdata, flags, addr = self.request.recvmsg(MAX_PAYLOAD, socket.CMSG_SPACE(64 * array.array("i").itemsize))
+				for level, type, cdata in ancdata:
+					if level == socket.SOL_SOCKET and type == socket.SCM_RIGHTS:
+						received = array.array("i")
+						received.frombytes(cdata[:len(cdata) - len(cdata) % received.itemsize])
+						fds.extend(received)
+				if not data:
+					break
+
+				buffer += data
+				replies = []
+				offset = 0
+				while len(buffer) - offset >= REQUEST.size:
+					id, op, length = REQUEST.unpack_from(buffer, offset)
+					if length > MAX_PAYLOAD:
+						return
+					end = offset + REQUEST.size + length
+					if len(buffer) < end:
+						break
+					payload = buffer[offset + REQUEST.size:end]
+					offset = end
+					fd = fds.pop(0) if op == OP_FROM_FD and fds else None
+					replies.append(self.reply(id, op, payload, fd))
+				buffer = buffer[offset:]
+				if replies:
+					self.request.sendall(b"".join(replies))
+		finally:
+			for fd in fds:
+				os.close(fd)
+
+	def reply(self, id, op, payload, fd=None):
+		try:
+			result = self.query(op, payload, fd)
+		except Exception as e:
+			result = str(e).encode("utf-8")
+			return RESPONSE.pack(id, STATUS_ERROR, len(result)) + result
+		finally:
+			if fd is not None:
+				os.close(fd)
+
+		if result is None:
+			return RESPONSE.pack(id, STATUS_NONE, 0)
+		return RESPONSE.pack(id, STATUS_OK, len(result)) + result
+
+	def query(self, op, payload, fd):
+		"""
+		Returns the answer to the request \a op as bytes, or None
+		"""
+		MimeType = self.mimeType
+		if op == OP_FROM_NAME:
+			mime = MimeType.fromName(payload.decode("utf-8"))
+		elif op == OP_FROM_CONTENT:
+			mime = MimeType.fromContent(os.fsdecode(payload))
+		elif op == OP_FROM_FD:
+			if fd is None:
+				raise ProtocolError("No file descriptor was passed")
+			mime = _fromFd(fd)
+		elif op == OP_BEST_APP:
+			app = MimeType(payload[1:].decode("utf-8")).bestApplication(action=payload[0])
+			return app.encode("utf-8") if app else None
+		elif op == OP_DEFAULT_APP:
+			app = MimeType(payload[1:].decode("utf-8")).defaultApplication(action=payload[0])
+			return app.encode("utf-8") if app else None
+		elif op == OP_APPLICATIONS:
+			return _joinList(MimeType(payload[1:].decode("utf-8")).applications(action=payload[0]))
+		elif op == OP_IS_INSTANCE:
+			mime, _, other = payload.decode("utf-8").partition("\0")
+			return b"\1" if MimeType(mime).isInstance(other) else b"\0"
+		elif op in (OP_ACRONYM, OP_COMMENT, OP_EXPANDED_ACRONYM):
+			mime, _, lang = payload.decode("utf-8").partition("\0")
+			mime = MimeType(mime)
+			if op == OP_ACRONYM:
+				text = mime.acronym(lang)
+			elif op == OP_COMMENT:
+				text = mime.comment(lang)
+			else:
+				text = mime.expandedAcronym(lang)
+			return text.encode("utf-8") if text else None
+		elif op == OP_GENERIC_ICON:
+			return MimeType(payload.decode("utf-8")).genericIcon().encode("utf-8")
+		elif op == OP_ALIASES:
+			return _joinList(alias.name() for alias in MimeType(payload.decode("utf-8")).aliases())
+		elif op == OP_ALIAS_OF:
+			mime = MimeType(payload.decode("utf-8")).aliasOf()
+		elif op == OP_SUBCLASS_OF:
+			return _joinList(parent.name() for parent in MimeType(payload.decode("utf-8")).subClassOf())
+		elif op == OP_ANCESTORS:
+			return _joinList(parent.name() for parent in MimeType(payload.decode("utf-8")).ancestors())
+		elif op == OP_EXTENSIONS:
+			try:
+				extensions = MimeType(payload.decode("utf-8")).extensions()
+			except KeyError:
+				# Types without extensions
+				extensions = []
+			return _joinList(extensions)
+		else:
+			raise ProtocolError("Unknown opcode %i" % (op))
+
+		mime = _mimeString(mime)
+		return mime.encode("utf-8") if mime else None
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	"""
+	Classification server listening on \a path
+	The databases are loaded when the server is created.
+	"""
+	daemon_threads = True
+
+	def __init__(self, path=SOCKET_PATH):
+		from . import mime
+		dirs = _privateDirs(path)
+		if not os.path.isdir(os.path.dirname(dirs[0])):
+			os.makedirs(os.path.dirname(dirs[0]))
+		for dir in dirs:
+			try:
+				os.mkdir(dir, 0o700)
+			except OSError:
+				# Checked below if it exists
+				pass
+			_checkDirectory(dir)
+
+		try:
+			st = os.lstat(path)
+		except OSError:
+			st = None
+		if st is not None:
+			# Only a stale socket of the user may be replaced
+			if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+				raise UnsafePathError("%r exists and is not a socket owned by the user" % (path))
+			os.remove(path)
+
+		# The socket is created with the umask, so that it is never
+		# accessible to the other users
+		umask = os.umask(0o077)
+		try:
+			socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+		finally:
+			os.umask(umask)
+		os.chmod(path, 0o600)
+
+	def server_close(self):
+		socketserver.UnixStreamServer.server_close(self)
+		try:
+			os.remove(self.server_address)
+		except OSError:
+			pass
+
+
+class Client(object):
+	"""
+	Connection to the classification server at \a path
+	A client can be shared between threads; requests are serialized.
+	Raises UnsafePathError if the socket is not a socket of the user in
+	directories private to the user.
+	"""
+	def __init__(self, path=SOCKET_PATH):
+		self.path = path
+		_checkSocket(path)
+		self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self._socket.connect(path)
+		self._file = self._socket.makefile("rb")
+		self._lock = threading.Lock()
+		self._id = 0
+
+	def close(self):
+		self._file.close()
+		self._socket.close()
+
+	def _read(self, size):
+		data = self._file.read(size)
+		if len(data) != size:
+			raise ProtocolError("Connection closed by the server")
+		return data
+
+	def _receive(self, ids):
+		ret = []
+		error = None
+		for expected in ids:
+			id, status, length = RESPONSE.unpack(self._read(RESPONSE.size))
+			payload = self._read(length)
+			if id != expected:
+				raise ProtocolError("Unexpected response %i to request %i" % (id, expected))
+			if status == STATUS_ERROR:
+				error = error or ProtocolError(payload.decode("utf-8"))
+				payload = None
+			elif status == STATUS_NONE:
+				payload = None
+			ret.append(payload)
+		return ret, error
+
+	def _send(self, requests):
+		ids = []
+		chunks = []
+		for op, payload, fd in requests:
+			self._id = (self._id + 1) & 0xffffffff
+			ids.append(self._id)
+			chunk = REQUEST.pack(self._id, op, len(payload)) + payload
+			if fd is None:
+				chunks.append(chunk)
+				continue
+			# The descriptor travels with the request it belongs to
+			if chunks:
+				self._socket.sendall(b"".join(chunks))
+				chunks = []
+			self._socket.sendmsg([chunk], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", [fd]))])
+		if chunks:
+			self._socket.sendall(b"".join(chunks))
+		return ids
+
+	def pipeline(self, requests):
+		"""
+		Sends the \a requests, a list of (opcode, payload, fd) tuples, without
+		waiting for the answers, PIPELINE_WINDOW requests at a time.
+		Returns the list of answers as bytes (or None), in order.
+		"""
+		ret = []
+		error = None
+		with self._lock:
+			for i in range(0, len(requests), PIPELINE_WINDOW):
+				answers, e = self._receive(self._send(requests[i:i + PIPELINE_WINDOW]))
+				ret += answers
+				error = error or e
+		if error:
+			raise error
+		return ret
+
+	def request(self, op, payload=b"", fd=None):
+		return self.pipeline([(op, payload, fd)])[0]
+
+	def _string(self, op, payload, fd=None):
+		ret = self.request(op, payload, fd)
+		if ret is not None:
+			return ret.decode("utf-8")
+
+	def acronym(self, mime, lang="en"):
+		return self._string(OP_ACRONYM, ("%s\0%s" % (mime, lang)).encode("utf-8"))
+
+	def aliasOf(self, mime):
+		return self._string(OP_ALIAS_OF, str(mime).encode("utf-8"))
+
+	def aliases(self, mime):
+		return _splitList(self.request(OP_ALIASES, str(mime).encode("utf-8")))
+
+	def ancestors(self, mime):
+		return _splitList(self.request(OP_ANCESTORS, str(mime).encode("utf-8")))
+
+	def applications(self, mime, action=ACTION_ALL):
+		return _splitList(self.request(OP_APPLICATIONS, bytes(bytearray([action])) + str(mime).encode("utf-8")))
+
+	def bestApplication(self, mime, action=ACTION_ALL):
+		return self._string(OP_BEST_APP, bytes(bytearray([action])) + str(mime).encode("utf-8"))
+
+	def comment(self, mime, lang="en"):
+		return self._string(OP_COMMENT, ("%s\0%s" % (mime, lang)).encode("utf-8"))
+
+	def defaultApplication(self, mime, action=ACTION_ALL):
+		return self._string(OP_DEFAULT_APP, bytes(bytearray([action])) + str(mime).encode("utf-8"))
+
+	def expandedAcronym(self, mime, lang="en"):
+		return self._string(OP_EXPANDED_ACRONYM, ("%s\0%s" % (mime, lang)).encode("utf-8"))
+
+	def extensions(self, mime):
+		return _splitList(self.request(OP_EXTENSIONS, str(mime).encode("utf-8")))
+
+	def fromContent(self, path):
+		return self._string(OP_FROM_CONTENT, os.fsencode(path))
+
+	def fromFd(self, fd):
+		return self._string(OP_FROM_FD, b"", fd)
+
+	def fromName(self, name):
+		return self._string(OP_FROM_NAME, name.encode("utf-8"))
+
+	def genericIcon(self, mime):
+		return self._string(OP_GENERIC_ICON, str(mime).encode("utf-8"))
+
+	def fromNames(self, names):
+		"""
+		Classifies all the \a names in a single round trip
+		"""
+		answers = self.pipeline([(OP_FROM_NAME, name.encode("utf-8"), None) for name in names])
+		return [answer.decode("utf-8") if answer is not None else None for answer in answers]
+
+	def isInstance(self, mime, other):
+		return self.request(OP_IS_INSTANCE, ("%s\0%s" % (mime, other)).encode("utf-8")) == b"\1"
+
+	def subClassOf(self, mime):
+		return _splitList(self.request(OP_SUBCLASS_OF, str(mime).encode("utf-8")))
+
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+def getClient():
+	"""
+	Returns the shared client, connecting to SOCKET_PATH on first use
+	"""
+	global _CLIENT
+	with _CLIENT_LOCK:
+		if _CLIENT is None:
+			_CLIENT = Client()
+		return _CLIENT
+
+def connect(path=SOCKET_PATH):
+	"""
+	Connects the shared client used by RemoteMimeType to \a path
+	"""
+	global _CLIENT
+	with _CLIENT_LOCK:
+		if _CLIENT is not None:
+			_CLIENT.close()
+		_CLIENT = Client(path)
+		return _CLIENT
+
+
+class RemoteMimeType(BaseMimeType):
+	"""
+	MimeType backed by the classification server
+	Has the query API of xdg.mime.MimeType. The methods which need the
+	databases ask the server; the others, such as fromInode(), icon() or
+	genericMime(), are those of BaseMimeType and run locally, and so do the
+	lookups of desktop files and icons on the file system.
+	extensions() returns an empty list for the types without extensions.
+	"""
+	@classmethod
+	def _fromString(cls, mime):
+		if mime is not None:
+			return cls(mime)
+
+	@classmethod
+	def fromContent(cls, name):
+		return cls._fromString(getClient().fromContent(name))
+
+	@classmethod
+	def fromFile(cls, fd):
+		"""
+		Classifies the open file \a fd by content, passing it to the server
+		"""
+		return cls._fromString(getClient().fromFd(fd))
+
+	@classmethod
+	def fromName(cls, name):
+		return cls._fromString(getClient().fromName(name))
+
+	def acronym(self, lang="en"):
+		return getClient().acronym(self.name(), lang)
+
+	def aliases(self):
+		return [RemoteMimeType(alias) for alias in getClient().aliases(self.name())]
+
+	def aliasOf(self):
+		return self._fromString(getClient().aliasOf(self.name()))
+
+	def comment(self, lang="en"):
+		return getClient().comment(self.name(), lang)
+
+	def expandedAcronym(self, lang="en"):
+		return getClient().expandedAcronym(self.name(), lang)
+
+	def extensions(self):
+		return getClient().extensions(self.name())
+
+	def genericIcon(self):
+		return getClient().genericIcon(self.name())
+
+	def iconPath(self, size=48, scale=1, theme=None):
+		from . import icontheme
+		return icontheme.lookupIcons([self.icon(), self.genericIcon()], size, scale, theme or icontheme.DEFAULT_THEME)
+
+	def ancestors(self):
+		return [RemoteMimeType(mime) for mime in getClient().ancestors(self.name())]
+
+	def isInstance(self, other):
+		return getClient().isInstance(self.name(), other)
+
+	def subClassOf(self):
+		return [RemoteMimeType(mime) for mime in getClient().subClassOf(self.name())]
+
+	# MIME Actions
+	def applications(self, action=ACTION_ALL):
+		return iter(getClient().applications(self.name(), action))
+
+	def bestApplication(self, action=ACTION_ALL):
+		return getClient().bestApplication(self.name(), action)
+
+	def availableApplications(self, action=ACTION_ALL):
+		from .desktopfile import getDesktopFilePath
+
+		for app in self.applications(action=action):
+			if getDesktopFilePath(app):
+				yield app
+
+	def bestAvailableApplication(self, action=ACTION_ALL):
+		return next(self.availableApplications(action=action), None)
+
+	def defaultApplication(self, action=ACTION_ALL):
+		return getClient().defaultApplication(self.name(), action)
+
+
+def main(argv=None):
+	import argparse
+	parser = argparse.ArgumentParser(prog="python -m xdg.mimeserver", description="Answer MIME classification queries over a Unix socket")
+	parser.add_argument("-s", "--socket", default=SOCKET_PATH, help="path of the socket (default: %s)" % (SOCKET_PATH))
+	args = parser.parse_args(argv)
+
+	server = Server(args.socket)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,156 @@
+"""
+MIME type names, and the parts of xdg.mime.MimeType which do not need the
+MIME database: parameters, inode/* types and URI schemes.
+Importing this module does not load the databases.
+"""
+
+import os
+import stat
+from .mounts import MOUNTS
+
+
+INODE = "inode"
+TEXT = "text"
+X_CONTENT = "x-content"
+X_SCHEME_HANDLER = "x-scheme-handler"
+
+DEFAULT_TEXT = "text/plain"
+DEFAULT_BINARY = "application/octet-stream"
+
+
+class BaseMimeType(object):
+	FORMAT = "%s/%s"
+
+	DEFAULT_TEXT = DEFAULT_TEXT
+	DEFAULT_BINARY = DEFAULT_BINARY
+	INODE_MOUNTPOINT = "inode/mount-point"
+	INODE_BLOCKDEVICE = "inode/blockdevice"
+	INODE_CHARDEVICE = "inode/chardevice"
+	INODE_DIRECTORY = "inode/directory"
+	INODE_FIFO = "inode/fifo"
+	INODE_SYMLINK = "inode/symlink"
+	INODE_SOCKET = "inode/socket"
+	ZERO_SIZE = "application/x-zerosize"
+
+	_MODES = (
+		(stat.S_ISLNK, INODE_SYMLINK),
+		(stat.S_ISBLK, INODE_BLOCKDEVICE),
+		(stat.S_ISCHR, INODE_CHARDEVICE),
+		(stat.S_ISDIR, INODE_DIRECTORY),
+		(stat.S_ISFIFO, INODE_FIFO),
+		(stat.S_ISSOCK, INODE_SOCKET),
+	)
+
+	def __init__(self, mime):
+		mime = str(mime)
+		name, _, parameter = mime.partition(";")
+		self._name = name.strip()
+		self._parameter = parameter.strip()
+		self._aliases = []
+		self._localized = {
+			"acronym": {},
+			"comment": {},
+			"expanded-acronym": {},
+		}
+
+	def __eq__(self, other):
+		if isinstance(other, BaseMimeType):
+			return self.name() == other.name()
+		return self.name() == other
+
+	def __hash__(self):
+		return self.name().__hash__()
+
+	def __str__(self):
+		return self.name()
+
+	def __repr__(self):
+		return "<MimeType: %s>" % (self.name())
+
+	@classmethod
+	def fromInode(cls, name, st=None):
+		"""
+		Returns the inode/* type of \a name, or None for regular files
+		\a st is the stat result of \a name, if the caller has it;
+		otherwise \a name is lstat()ed, and symlinks are not followed.
+		"""
+		if st is None:
+			try:
+				st = os.lstat(name)
+			except OSError:
+				return
+
+		# Test for mount point before testing for inode/directory
+		if not stat.S_ISLNK(st.st_mode) and MOUNTS.isMountPoint(name, st):
+			return cls(cls.INODE_MOUNTPOINT)
+
+		return cls.fromMode(st.st_mode)
+
+	@classmethod
+	def fromMode(cls, mode):
+		"""
+		Returns the inode/* type of the file mode \a mode, or None for
+		regular files. Mount points are not told apart from directories.
+		"""
+		for test, mime in cls._MODES:
+			if test(mode):
+				return cls(mime)
+
+	@classmethod
+	def fromScheme(cls, uri):
+		try:
+			from urllib.parse import urlparse
+		except ImportError:
+			from urlparse import urlparse
+
+		scheme = urlparse(uri).scheme
+		if not scheme:
+			raise ValueError("%r does not have a scheme or is not a valid URI" % (scheme))
+
+		return cls(cls.FORMAT % (X_SCHEME_HANDLER, scheme))
+
+	def charset(self):
+		"""
+		Returns the value of the charset parameter, if any
+		"""
+		for parameter in self._parameter.split(";"):
+			key, _, value = parameter.partition("=")
+			if key.strip().lower() == "charset":
+				return value.strip().strip('"')
+
+	def genericIcon(self):
+		return self.genericMime().name().replace("/", "-")
+
+	def genericMime(self):
+		return self.__class__("%s/x-generic" % (self.type()))
+
+	def icon(self):
+		return self.name().replace("/", "-")
+
+	def isDefault(self):
+		name = self.name()
+		return name == DEFAULT_BINARY or name == DEFAULT_TEXT
+
+	def isInstance(self, other):
+		if self == other:
+			return True
+		for mime in self.subClassOf():
+			if mime.isInstance(other):
+				return True
+		return False
+
+	def name(self):
+		return self._name
+
+	def parameter(self):
+		return self._parameter
+
+	def subClassOf(self):
+		# Should be implemented if the MIME type implementation supports subclassing
+		return []
+
+	def subtype(self):
+		return self.name().split("/")[1]
+
+	def type(self):
+		return self.name().split("/")[0]
@@ -0,0 +1,189 @@
+"""
+Table of the mounted filesystems
+
+Reads /proc/self/mountinfo (Linux only) and maps the devices (st_dev) to
+their mount points. The table is read again when the kernel reports a
+change of the mounts, which it does by flagging the open mountinfo file
+in poll(). Where mountinfo is not available, the lookups fall back to
+walking up the directory tree.
+"""
+
+import os
+import stat
+import threading
+
+try:
+	import select
+	_poll = select.poll
+except (ImportError, AttributeError):
+	_poll = None
+
+MOUNTINFO = "/proc/self/mountinfo"
+
+
+def _unescape(path):
+	"""
+	Decodes the octal escapes (eg. \\040 for spaces) of mountinfo paths
+	"""
+	if "\\" not in path:
+		return path
+	ret = bytearray()
+	i = 0
+	encoded = path.encode("utf-8", "surrogateescape")
+	while i < len(encoded):
+		if encoded[i:i + 1] == b"\\" and encoded[i + 1:i + 4].isdigit():
+			ret.append(int(encoded[i + 1:i + 4], 8))
+			i += 4
+		else:
+			ret.append(encoded[i])
+			i += 1
+	return bytes(ret).decode("utf-8", "surrogateescape")
+
+def parseMountInfo(data):
+	"""
+	Parses the mountinfo contents \a data
+	Returns a dict of st_dev -> list of mount points, in mount order.
+	"""
+	ret = {}
+	for line in data.splitlines():
+		fields = line.split(" ")
+		if len(fields) < 5:
+			continue
+		major, sep, minor = fields[2].partition(":")
+		if not sep:
+			continue
+		dev = os.makedev(int(major), int(minor))
+		ret.setdefault(dev, []).append(_unescape(fields[4]))
+	return ret
+
+
+class MountTable(object):
+	"""
+	Mount points by device, read from the mountinfo file \a path
+	"""
+	def __init__(self, path=MOUNTINFO):
+		self.path = path
+		self._lock = threading.Lock()
+		self._fd = None
+		self._poller = None
+		# st_dev -> list of mount points
+		self._devices = {}
+		self._points = frozenset()
+		# st_dev -> mount point found by walking up the tree, for the
+		# devices which are not in the table (eg. btrfs subvolumes)
+		self._walked = {}
+		self._open()
+
+	def _open(self):
+		if _poll is None:
+			return
+		try:
+			self._fd = os.open(self.path, os.O_RDONLY)
+		except OSError:
+			return
+		self._poller = _poll()
+		self._poller.register(self._fd, select.POLLPRI | select.POLLERR)
+		self._poller.poll(0)
+		self._read()
+
+	def _read(self):
+		os.lseek(self._fd, 0, os.SEEK_SET)
+		chunks = []
+		while True:
+			chunk = os.read(self._fd, 65536)
+			if not chunk:
+				break
+			chunks.append(chunk)
+		devices = parseMountInfo(b"".join(chunks).decode("utf-8", "surrogateescape"))
+		# Replaced as a whole, so that lookups see a consistent table
+		self._devices, self._points, self._walked = devices, frozenset(p for points in devices.values() for p in points), {}
+
+	def available(self):
+		"""
+		Returns True if the table is read from mountinfo
+		"""
+		return self._fd is not None
+
+	def refresh(self, force=False):
+		"""
+		Reads the table again if the mounts changed, or if \a force is True
+		Called by the lookups; polling the file costs a single system call.
+		A poll object cannot be polled by two threads at once, so threads
+		which find another one checking skip the check and use the current
+		table.
+		"""
+		if self._fd is None:
+			return
+		if force:
+			self._lock.acquire()
+		elif not self._lock.acquire(False):
+			return
+		try:
+			if self._poller.poll(0) or force:
+				self._read()
+		finally:
+			self._lock.release()
+
+	def mountPoints(self, dev):
+		"""
+		Returns the mount points of the device \a dev, in mount order
+		"""
+		self.refresh()
+		return list(self._devices.get(dev, ()))
+
+	def isMountPoint(self, path, st=None):
+		"""
+		Returns True if \a path is a mount point
+		\a st is the lstat() result of \a path, if the caller has it.
+		Only directories which are not listed as is cost more system calls.
+		"""
+		if self._fd is None:
+			return os.path.ismount(path)
+		self.refresh()
+		path = os.path.abspath(path)
+		if path in self._points:
+			return True
+		if st is None:
+			try:
+				st = os.lstat(path)
+			except OSError:
+				return False
+		if not stat.S_ISDIR(st.st_mode):
+			return False
+		# Paths through symlinked directories
+		return os.path.realpath(path) in self._points
+
+	def mountPoint(self, path, st=None):
+		"""
+		Returns the mount point of the filesystem \a path lives on
+		\a st is the lstat() result of \a path, if the caller has it.
+		"""
+		self.refresh()
+		path = os.path.abspath(path)
+		if st is None:
+			st = os.lstat(path)
+		if not stat.S_ISDIR(st.st_mode):
+			path = os.path.dirname(path)
+		points = self._devices.get(st.st_dev, ())
+		if len(points) == 1:
+			return points[0]
+
+		path = os.path.realpath(path)
+		if points:
+			# Bind mounts: the deepest mount point above path
+			matches = [p for p in points if path == p or path.startswith(p.rstrip("/") + "/")]
+			if matches:
+				return max(matches, key=len)
+
+		walked = self._walked
+		if st.st_dev not in walked:
+			while True:
+				parent = os.path.dirname(path)
+				if parent == path or os.lstat(parent).st_dev != st.st_dev:
+					break
+				path = parent
+			walked[st.st_dev] = path
+		return walked[st.st_dev]
+
+
+MOUNTS = MountTable()
@@ -0,0 +1,116 @@
+"""
+Opt-in instrumentation of the lookup paths
+
+Instrumentation is disabled by default, in which case it costs a single
+flag check in the instrumented functions. Once enabled with enable(),
+the following counters are kept in STATS:
+
+ - globs.literal, globs.extension, globs.fnmatch, globs.miss:
+   Which stage of GlobsFile.match() answered the lookup
+ - magic.matches, magic.rules:
+   Calls to MagicFile.matchData() and the magic rules they evaluated
+ - content.inode, content.zerosize, content.magic, content.text, content.binary:
+   How MimeType.fromContent() classified a file
+ - files.lookups, dircache.hit, dircache.miss:
+   Calls to xdg.getFiles() and whether directory listings came from the
+   cache or from the disk
+
+Along with the cumulative time spent in globs.match, magic.match and
+files.lookup, in seconds.
+
+Hooks added with Stats.addHook() are called with (kind, name, value) for
+each event, kind being "count" or "time". For magic.rules, value is the
+amount of rules evaluated by a single match.
+"""
+
+import threading
+import time
+
+try:
+	clock = time.perf_counter
+except AttributeError:
+	clock = time.time
+
+# Checked by the instrumented functions; use enable() and disable()
+ENABLED = False
+
+# The hooks added by enable(), removed by disable()
+_enabledHooks = []
+
+
+class Stats(object):
+	def __init__(self):
+		self._counters = {}
+		self._timings = {}
+		self._hooks = []
+		self._lock = threading.Lock()
+
+	def __repr__(self):
+		return "Stats(%r)" % (self.snapshot())
+
+	def addHook(self, hook):
+		"""
+		Calls \a hook(kind, name, value) for every event
+		"""
+		# The list is replaced rather than modified, for the events being
+		# sent by other threads
+		self._hooks = self._hooks + [hook]
+
+	def count(self, name, value=1):
+		with self._lock:
+			self._counters[name] = self._counters.get(name, 0) + value
+		for hook in self._hooks:
+			hook("count", name, value)
+
+	def counter(self, name):
+		return self._counters.get(name, 0)
+
+	def removeHook(self, hook):
+		hooks = list(self._hooks)
+		hooks.remove(hook)
+		self._hooks = hooks
+
+	def reset(self):
+		with self._lock:
+			self._counters.clear()
+			self._timings.clear()
+
+	def snapshot(self):
+		"""
+		Returns a copy of the counters and timings, as a dict of
+		{"counters": {name: count}, "timings": {name: seconds}}
+		"""
+		with self._lock:
+			return {"counters": dict(self._counters), "timings": dict(self._timings)}
+
+	def time(self, name, seconds):
+		with self._lock:
+			self._timings[name] = self._timings.get(name, 0.0) + seconds
+		for hook in self._hooks:
+			hook("time", name, seconds)
+
+	def timing(self, name):
+		return self._timings.get(name, 0.0)
+
+STATS = Stats()
+
+
+def enable(hook=None):
+	"""
+	Enables the instrumentation, optionally adding \a hook to STATS
+	"""
+	global ENABLED
+	if hook is not None:
+		STATS.addHook(hook)
+		_enabledHooks.append(hook)
+	ENABLED = True
+
+def disable():
+	"""
+	Disables the instrumentation and removes the hooks added by enable()
+	The counters and timings are kept; see Stats.reset().
+	"""
+	global ENABLED
+	ENABLED = False
+	while _enabledHooks:
+		STATS.removeHook(_enabledHooks.pop())
@@ -3,10 +3,13 @@
 XDG Trash implementation
 """
 
+import errno
 import os
 import shutil
+import stat
 from time import strftime
 from .basedir import XDG_DATA_HOME
+from .mounts import MOUNTS
 
 TRASH_HOME = os.path.join(XDG_DATA_HOME, "Trash")
 
@@ -15,9 +18,83 @@ Path=%(path)s
 DeletionDate=%(deletionDate)s
 """
 
+
+def _device(path):
+	"""
+	Returns the st_dev of \a path, or of its closest existing parent
+	"""
+	while True:
+		try:
+			return os.lstat(path).st_dev
+		except OSError:
+			parent = os.path.dirname(path)
+			if parent == path:
+				raise
+			path = parent
+
+def mountPoint(path):
+	"""
+	Returns the mount point (the "topdir" of the Trash spec) of the
+	filesystem \a path lives on, see xdg.mounts.MountTable.mountPoint()
+	"""
+	return MOUNTS.mountPoint(path)
+
+def topdirTrash(topdir):
+	"""
+	Returns the Trash for the mount point \a topdir, following the spec:
+	 - $topdir/.Trash/$uid if $topdir/.Trash is a sticky, non-symlink directory
+	 - $topdir/.Trash-$uid otherwise
+	Returns None if neither can be used.
+	"""
+	uid = os.getuid()
+	shared = os.path.join(topdir, ".Trash")
+	try:
+		mode = os.lstat(shared).st_mode
+	except OSError:
+		mode = 0
+
+	if stat.S_ISDIR(mode) and mode & stat.S_ISVTX:
+		trash = Trash(os.path.join(shared, str(uid)), topdir=topdir)
+		try:
+			trash._makedirs()
+			return trash
+		except OSError:
+			pass
+
+	trash = Trash(os.path.join(topdir, ".Trash-%i" % (uid)), topdir=topdir)
+	try:
+		trash._makedirs()
+		return trash
+	except OSError:
+		return None
+
+def trashFor(path):
+	"""
+	Returns the Trash that lives on the same device as \a path.
+	Files on the same device as $XDG_DATA_HOME go to the home trash,
+	other files go to the trash of their mount point. Trashing a file
+	to the returned Trash is therefore a rename and does not copy any data.
+	Falls back to the home trash if the mount point has no usable trash.
+	"""
+	st = os.lstat(path)
+	if st.st_dev == _device(TRASH_HOME):
+		return Trash()
+
+	return topdirTrash(MOUNTS.mountPoint(path, st)) or Trash()
+
+def trash(path, copy=False):
+	"""
+	Moves the file at \a path to the trash of its device (see trashFor())
+	If \a copy is True and no trash is available on the same device, the
+	file is copied to the home trash instead.
+	"""
+	trashFor(path).trash(path, copy=copy)
+
+
 class Trash(object):
-	def __init__(self, path=TRASH_HOME):
+	def __init__(self, path=TRASH_HOME, topdir=None):
 		self._path = path
+		self._topdir = topdir
 
 	def __contains__(self, item):
 		"""
@@ -45,9 +122,17 @@ class Trash(object):
 	def _deleteFile(self, name):
 		"""
 		Deletes the file \a name from the trash if it exists
+		Directories, such as those partially copied by _move(), are
+		deleted with their contents.
 		"""
 		path = os.path.join(self.filesPath(), name)
-		if os.path.exists(path):
+		try:
+			mode = os.lstat(path).st_mode
+		except OSError:
+			return
+		if stat.S_ISDIR(mode):
+			shutil.rmtree(path)
+		else:
 			os.remove(path)
 
 	def _deleteInfo(self, name):
@@ -59,10 +144,82 @@ class Trash(object):
 		if os.path.exists(path):
 			os.remove(path)
 
+	def _makedirs(self):
+		"""
+		Creates the trash directories if they do not exist yet
+		"""
+		for path in (self.filesPath(), self.infoPath()):
+			if not os.path.isdir(path):
+				os.makedirs(path, 0o700)
+
 	def _writeInfo(self, name, path, deletionDate):
-		with open(os.path.join(self.infoPath(), name + ".trashinfo"), "w") as f:
-			f.write(TRASH_INFO_TEMPLATE % {"path": path, "deletionDate": deletionDate})
-		return f.name
+		"""
+		Atomically creates the metadata file for \a name
+		Raises an OSError (EEXIST) if it already exists
+		"""
+		infoPath = os.path.join(self.infoPath(), name + ".trashinfo")
+		fd = os.open(infoPath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+		try:
+			os.write(fd, (TRASH_INFO_TEMPLATE % {"path": path, "deletionDate": deletionDate}).encode("utf-8"))
+		finally:
+			os.close(fd)
+		return infoPath
+
+	def _reserve(self, path, deletionDate, taken=None, counters=None):
+		"""
+		Finds a free name in the trash for the file at \a path and claims
+		it by writing its metadata. Returns the name.
+		If \a taken is given, it is used as the set of names already in
+		use instead of probing the files directory, and is updated with
+		the claimed name. \a counters keeps track of the last suffix used
+		for each base name so that duplicates are not probed from the start.
+		"""
+		base = os.path.basename(path)
+		i = counters.get(base, 0) if counters is not None else 0
+		name = "%s.%i" % (base, i) if i else base
+		while True:
+			if taken is None:
+				free = not os.path.lexists(os.path.join(self.filesPath(), name))
+			else:
+				free = name not in taken
+			if free:
+				try:
+					self._writeInfo(name=name, path=self.infoPathFor(path), deletionDate=deletionDate)
+					break
+				except OSError as e:
+					if e.errno != errno.EEXIST:
+						raise
+			i += 1
+			name = "%s.%i" % (base, i)
+
+		if taken is not None:
+			taken.add(name)
+		if counters is not None:
+			counters[base] = i
+		return name
+
+	def _move(self, path, name, copy=False):
+		"""
+		Renames the file at \a path to \a name in the trash
+		See trash() for \a copy
+		"""
+		dest = os.path.join(self.filesPath(), name)
+		try:
+			os.rename(path, dest)
+		except OSError as e:
+			if e.errno != errno.EXDEV or not copy:
+				raise
+			shutil.move(path, dest)
+
+	def _syncInfo(self):
+		"""
+		Flushes the info directory entries to disk
+		"""
+		fd = os.open(self.infoPath(), os.O_RDONLY)
+		try:
+			os.fsync(fd)
+		finally:
+			os.close(fd)
 
 	def delete(self, name):
 		"""
@@ -104,31 +261,82 @@ class Trash(object):
 		"""
 		return len(self) == 0
 
-	def trash(self, path):
+	def infoPathFor(self, path):
+		"""
+		Returns the Path= value to store in the metadata of \a path.
+		Trashes on a mount point store paths relative to it.
+		"""
+		path = os.path.abspath(path)
+		if self._topdir:
+			return os.path.relpath(path, self._topdir)
+		return path
+
+	def topdir(self):
+		"""
+		Returns the mount point this trash belongs to, or None for the home trash
+		"""
+		return self._topdir
+
+	def trash(self, path, copy=False):
 		"""
 		Moves the file at \a path to the trash
 		Raises an IOError if the file does not exist
+		The file is renamed into the trash. If it lives on another device,
+		an OSError (EXDEV) is raised unless \a copy is True, in which case
+		it is copied to the trash and then deleted.
 		"""
-		if not os.path.exists(path):
+		if not os.path.lexists(path):
 			raise IOError("No such file or directory")
 
-		name = os.path.basename(path)
-		if os.path.exists(os.path.join(self.filesPath(), name)):
-			_name = name + ".1"
-			i = 1
-			while os.path.exists(os.path.join(self.filesPath(), _name)):
-				i += 1
-				_name = "%s.%i" % (name, i)
-			name = _name
-
-		self._writeInfo(name=name, path=path, deletionDate=strftime("%Y-%m-%dT%H:%M:%S"))
+		self._makedirs()
+		name = self._reserve(path, deletionDate=strftime("%Y-%m-%dT%H:%M:%S"))
 		try:
-			# TODO spec says the move must be atomic (O_EXCL)
-			shutil.move(path, os.path.join(self.filesPath(), name))
+			self._move(path, name, copy=copy)
 		except Exception:
 			self._cleanup(name)
 			raise
 
+	def trashMany(self, paths, copy=False):
+		"""
+		Moves all the files in \a paths to the trash
+		Names are allocated in a single pass and all the metadata is written
+		and synced to disk at once before the files are moved. Creating the
+		metadata files dominates, so this is not faster than trash().
+		Returns a dict of {path: exception} for the files which could not
+		be trashed. Those files are left untouched and have no metadata
+		in the trash. See trash() for \a copy.
+		"""
+		self._makedirs()
+		taken = set(os.listdir(self.filesPath()))
+		for name in os.listdir(self.infoPath()):
+			if name.endswith(".trashinfo"):
+				taken.add(name[:-len(".trashinfo")])
+
+		deletionDate = strftime("%Y-%m-%dT%H:%M:%S")
+		counters = {}
+		errors = {}
+		reserved = []
+		for path in paths:
+			if not os.path.lexists(path):
+				errors[path] = IOError("No such file or directory")
+				continue
+			try:
+				reserved.append((path, self._reserve(path, deletionDate, taken, counters)))
+			except OSError as e:
+				errors[path] = e
+
+		if reserved:
+			self._syncInfo()
+
+		for path, name in reserved:
+			try:
+				self._move(path, name, copy=copy)
+			except Exception as e:
+				self._cleanup(name)
+				errors[path] = e
+
+		return errors
+
 	def path(self):
 		"""
 		Returns the path to the trash
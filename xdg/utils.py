@@ -1,6 +1,12 @@
-import collections
+import os
+import tempfile
+try:
+	from collections.abc import MutableSet
+except ImportError:
+	# Python 2
+	from collections import MutableSet
 
-class OrderedSet(collections.MutableSet):
+class OrderedSet(MutableSet):
 	"""
 	OrderedSet recipe from
 	http://code.activestate.com/recipes/576694/
@@ -63,3 +69,25 @@ class OrderedSet(collections.MutableSet):
 		key = self.end[1][0] if last else self.end[2][0]
 		self.discard(key)
 		return key
+
+
+def writeAtomic(path, data):
+	"""
+	Writes the bytes \a data to \a path through a temporary file, which
+	then replaces \a path so that readers never see a partially written
+	file. The file is synced to disk before it replaces \a path.
+	"""
+	dir = os.path.dirname(path) or "."
+	if not os.path.isdir(dir):
+		os.makedirs(dir)
+	fd, tmp = tempfile.mkstemp(dir=dir, prefix="." + os.path.basename(path) + ".")
+	try:
+		with os.fdopen(fd, "wb") as file:
+			file.write(data)
+			file.flush()
+			os.fsync(file.fileno())
+		os.chmod(tmp, 0o644)
+		getattr(os, "replace", os.rename)(tmp, path)
+	except Exception:
+		os.remove(tmp)
+		raise
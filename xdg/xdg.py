@@ -3,21 +3,58 @@ Shared definitions and helper functions for xdg
 """
 
 import os
+from . import stats
 from .basedir import *
+from .basedir import DIRECTORY_CACHE
 
 
 def getFiles(name):
-	ret = []
-	for dir in XDG_DATA_DIRS:
-		path = os.path.join(dir, name)
-		if path not in ret and os.path.exists(path):
-			ret.append(path)
-	return ret
+	"""
+	Returns the list of existing files \a name in XDG_DATA_DIRS
+	The directory listings are cached, see invalidateFiles()
+	"""
+	if stats.ENABLED:
+		start = stats.clock()
+		ret = DIRECTORY_CACHE.getFiles(name, XDG_DATA_DIRS)
+		stats.STATS.time("files.lookup", stats.clock() - start)
+		stats.STATS.count("files.lookups")
+		return ret
+	return DIRECTORY_CACHE.getFiles(name, XDG_DATA_DIRS)
+
+def getConfigFiles(name):
+	"""
+	Returns the list of existing files \a name in XDG_CONFIG_DIRS
+	"""
+	return DIRECTORY_CACHE.getFiles(name, XDG_CONFIG_DIRS)
+
+def invalidateFiles(path=None):
+	"""
+	Forgets the cached listings of \a path and its subdirectories, or of
+	every directory if \a path is None.
+	This must be called after files are added to or removed from the data
+	directories by other means than the functions in this package.
+	"""
+	DIRECTORY_CACHE.invalidate(path)
 
 def updateDesktopDatabase(base):
-	from subprocess import Popen
-	Popen(["update-desktop-database", base])
+	"""
+	Generates the mimeinfo.cache of the applications directory \a base,
+	see xdg.desktopcache
+	Returns the list of the files which were written.
+	"""
+	from .desktopcache import generateCache
+	ret = generateCache(base)
+	invalidateFiles(base)
+	return ret
 
-def updateMimeDatabase(base):
-	from subprocess import Popen
-	Popen(["update-mime-database", base])
+def updateMimeDatabase(base, strict=False):
+	"""
+	Compiles the MIME database in \a base, see xdg.mimecompiler
+	Returns the list of the files which were written.
+	If \a strict is True, raises CompileError if a package fails to parse.
+	"""
+	from .mimecompiler import compileDatabase
+	try:
+		return compileDatabase(base, strict=strict)
+	finally:
+		invalidateFiles(base)